@@ -0,0 +1,16 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Load tools/frr-reload.py, which can't be imported by name, for the tests
+#
+import importlib.util
+import os
+import sys
+
+srcdir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+frr_reload_path = os.path.join(srcdir, "tools", "frr-reload.py")
+spec = importlib.util.spec_from_file_location("frr_reload", frr_reload_path)
+frr_reload = importlib.util.module_from_spec(spec)
+# Registered so its functions can be pickled for a ProcessPoolExecutor
+sys.modules["frr_reload"] = frr_reload
+spec.loader.exec_module(frr_reload)
@@ -0,0 +1,88 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Check the library entry point of frr-reload.py
+#
+from frr_reload_loader import frr_reload
+
+running = """\
+hostname r1
+router bgp 65001
+ neighbor 10.0.0.2 remote-as 65002
+ neighbor 10.0.0.3 remote-as 65003
+exit
+"""
+
+new = """\
+hostname r1
+router bgp 65001
+ neighbor 10.0.0.2 remote-as 65002
+ neighbor 10.0.0.4 remote-as 65004
+exit
+"""
+
+
+def test_compare_config_text():
+    delta = frr_reload.compare_config_text(new, running)
+
+    assert delta == {
+        "delete": [
+            {
+                "context": ["router bgp 65001"],
+                "line": "neighbor 10.0.0.3 remote-as 65003",
+                "commands": [
+                    "router bgp 65001",
+                    " no neighbor 10.0.0.3 remote-as 65003",
+                    "exit",
+                ],
+            }
+        ],
+        "add": [
+            {
+                "context": ["router bgp 65001"],
+                "line": "neighbor 10.0.0.4 remote-as 65004",
+                "commands": [
+                    "router bgp 65001",
+                    " neighbor 10.0.0.4 remote-as 65004",
+                    "exit",
+                ],
+            }
+        ],
+    }
+
+
+def test_compare_config_text_same():
+    assert frr_reload.compare_config_text(running, running) == {
+        "delete": [],
+        "add": [],
+    }
+
+
+def test_compare_config_text_empty_context():
+    # The route follows an interface without sub-commands, it is not part
+    # of the interface
+    new_text = """\
+hostname r1
+interface r1-eth1
+# ip address 172.31.0.1/24
+!
+ip route 192.0.2.3/32 172.31.10.3
+!
+"""
+    running_text = """\
+hostname r1
+interface r1-eth1
+exit
+!
+"""
+    delta = frr_reload.compare_config_text(new_text, running_text)
+
+    assert delta == {
+        "delete": [],
+        "add": [
+            {
+                "context": ["ip route 192.0.2.3/32 172.31.10.3"],
+                "line": None,
+                "commands": ["ip route 192.0.2.3/32 172.31.10.3"],
+            }
+        ],
+    }
@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Check the per-daemon (--parallel) and mgmtd transaction (--transaction)
+# apply paths of frr-reload.py
+#
+from frr_reload_loader import frr_reload
+
+
+class FakeVtysh(object):
+    """
+    Shows a fixed running configuration and records what is applied to it,
+    with the daemon the vtysh talks to (None for all of them).
+    """
+
+    def __init__(self, running, daemon=None, applied=None, failing_files=0):
+        # Daemon to its running configuration
+        self.running = running
+        self.daemon = daemon
+        self.applied = [] if applied is None else applied
+        self.failing_files = failing_files
+
+    def for_daemon(self, daemon):
+        return FakeVtysh(self.running, daemon, self.applied)
+
+    def mark_text(self, text):
+        return frr_reload.mark_config(text)
+
+    def mark_show_run(self, daemon=None):
+        if daemon:
+            return self.mark_text(self.running.get(daemon, ""))
+        return self.mark_text("".join(self.running.values()))
+
+    def exec_batch(self, commands, stdouts=None):
+        cmds = [x.strip() for x in commands if x not in ("configure", "end")]
+        self.applied.append((self.daemon, "delete", cmds))
+        return len(commands)
+
+    def __call__(self, command, stdouts=None):
+        if self.exec_batch(command, stdouts) != len(command):
+            raise frr_reload.VtyshException("failed")
+
+    def exec_file(self, filename):
+        with open(filename) as fh:
+            lines = [x.strip() for x in fh.read().splitlines() if x.strip()]
+        if self.failing_files:
+            self.failing_files -= 1
+            raise frr_reload.VtyshException("vtysh (exec file) exited with status 1")
+        self.applied.append((self.daemon, "file", lines))
+
+
+running = {
+    None: "hostname r1\nip route 10.0.0.0/24 Null0\n",
+    "bgpd": "router bgp 65001\n neighbor 10.0.0.2 remote-as 65002\nexit\n",
+    "ospfd": "router ospf\n ospf router-id 10.0.0.1\nexit\n",
+}
+
+new = """\
+hostname r1
+ip route 10.0.1.0/24 Null0
+router bgp 65001
+ neighbor 10.0.0.3 remote-as 65003
+exit
+router ospf
+ ospf router-id 10.0.0.9
+exit
+"""
+
+
+def load_new(vtysh):
+    config = frr_reload.Config(vtysh)
+    config.load_from_text(new)
+    return config
+
+
+def applied_commands(applied):
+    """
+    The commands applied through each daemon, without the context lines
+    """
+    commands = {}
+    for daemon, _, cmds in applied:
+        for cmd in cmds:
+            if cmd.startswith(("no ", "ip route ", "neighbor ", "ospf ")):
+                commands.setdefault(daemon, set()).add(cmd)
+    return commands
+
+
+def test_reload_by_daemon(tmp_path, monkeypatch):
+    monkeypatch.setattr(frr_reload, "stats", frr_reload.Stats())
+    vtysh = FakeVtysh(running)
+
+    assert frr_reload.reload_config_by_daemon(
+        vtysh, vtysh, load_new(vtysh), str(tmp_path)
+    )
+
+    assert applied_commands(vtysh.applied) == {
+        None: {"no ip route 10.0.0.0/24 Null0", "ip route 10.0.1.0/24 Null0"},
+        "bgpd": {
+            "no neighbor 10.0.0.2 remote-as 65002",
+            "neighbor 10.0.0.3 remote-as 65003",
+        },
+        "ospfd": {"no ospf router-id 10.0.0.1", "ospf router-id 10.0.0.9"},
+    }
+    # The fixups run in the worker processes, their timings are merged back
+    assert "delete_move_lines" in frr_reload.stats.phases
+
+
+def test_reload_transaction(tmp_path):
+    vtysh = FakeVtysh({None: "".join(running.values())})
+
+    assert frr_reload.reload_config(
+        vtysh, load_new(vtysh), None, str(tmp_path), transaction=True
+    )
+
+    # The static routes are committed first, in one file, and not applied
+    # again by the passes after it.
+    assert vtysh.applied[0] == (
+        None,
+        "file",
+        ["no ip route 10.0.0.0/24 Null0", "ip route 10.0.1.0/24 Null0"],
+    )
+    for _, _, cmds in vtysh.applied[1:]:
+        assert not [x for x in cmds if "ip route" in x]
+
+
+def test_reload_transaction_failed(tmp_path):
+    # The transaction is rejected, the lines go through the passes instead
+    vtysh = FakeVtysh({None: "".join(running.values())}, failing_files=1)
+
+    assert frr_reload.reload_config(
+        vtysh, load_new(vtysh), None, str(tmp_path), transaction=True
+    )
+
+    assert len(vtysh.applied) == 3
+    assert vtysh.applied[0][1] == "delete"
+    assert vtysh.applied[1][1] == "file"
+    assert "no ip route 10.0.0.0/24 Null0" in vtysh.applied[1][2]
+    assert "ip route 10.0.1.0/24 Null0" in vtysh.applied[1][2]
+
+
+def test_stats_merge():
+    stats = frr_reload.Stats()
+    stats.count("delete_retries")
+    worker = frr_reload.Stats()
+    worker.count("delete_retries", 2)
+    with worker.phase("delete_move_lines"):
+        pass
+
+    stats.merge(worker.as_dict())
+
+    assert stats.counters["delete_retries"] == 3
+    assert "delete_move_lines" in stats.phases
@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Check the batched delete pass of frr-reload.py
+#
+from frr_reload_loader import frr_reload
+
+
+class FakeVtysh(object):
+    """
+    Runs batches like "vtysh -c ... -c ...": the node of a command is the one
+    the previous command left the session in.
+    """
+
+    def __init__(self, nodes):
+        # Commands entering a node, to the commands that exist in that node
+        self.nodes = nodes
+        self.executed = []
+
+    def exec_batch(self, commands, stdouts=None):
+        node = "enable"
+        for count, cmd in enumerate(commands):
+            if cmd == "configure":
+                node = "config"
+            elif cmd == "end":
+                node = "enable"
+            elif cmd in self.nodes:
+                node = cmd
+            elif cmd not in self.nodes.get(node, ()):
+                if stdouts is not None:
+                    stdouts.append("%% Unknown command: %s" % cmd)
+                return count
+            else:
+                self.executed.append((node, cmd))
+        return len(commands)
+
+    def __call__(self, command, stdouts=None):
+        if self.exec_batch(command, stdouts) != len(command):
+            raise frr_reload.VtyshException("failed")
+
+
+def test_apply_deletes_node():
+    # "no ip route" exists both in the config and vrf nodes, the global one
+    # must not be applied inside the vrf of the command before it.
+    vtysh = FakeVtysh(
+        {
+            "config": ["no ip route 10.0.0.2/32 Null0"],
+            "vrf red": [
+                "no ip route 10.0.0.1/32 Null0",
+                "no ip route 10.0.0.2/32 Null0",
+            ],
+        }
+    )
+    commands = [
+        ["vrf red", "no ip route 10.0.0.1/32 Null0"],
+        ["no ip route 10.0.0.2/32 Null0"],
+    ]
+
+    assert frr_reload.apply_deletes(vtysh, commands)
+    assert vtysh.executed == [
+        ("vrf red", "no ip route 10.0.0.1/32 Null0"),
+        ("config", "no ip route 10.0.0.2/32 Null0"),
+    ]
+
+
+def test_apply_deletes_fallback():
+    vtysh = FakeVtysh(
+        {
+            "interface eth0": [
+                "no ip ospf authentication",
+                "no description",
+            ],
+        }
+    )
+    commands = [
+        ["interface eth0", "no ip ospf authentication message-digest"],
+        ["interface eth0", "no description"],
+    ]
+
+    assert frr_reload.apply_deletes(vtysh, commands)
+    assert vtysh.executed == [
+        ("interface eth0", "no ip ospf authentication"),
+        ("interface eth0", "no description"),
+    ]
@@ -0,0 +1,93 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Check the parse cache of "frr-reload.py --incremental"
+#
+from frr_reload_loader import frr_reload
+
+
+class FakeVtysh(object):
+    "Marks the configuration like vtysh -m, see mark_config()"
+
+    def mark_text(self, text):
+        return frr_reload.mark_config(text)
+
+    def mark_file(self, filename, stdin=None):
+        with open(filename) as fh:
+            return self.mark_text(fh.read())
+
+
+indented = """\
+hostname r1
+router bgp 65001
+ neighbor 10.0.0.2 remote-as 65002
+exit
+!
+router ospf
+ ospf router-id 10.0.0.1
+exit
+"""
+
+unindented = """\
+hostname r1
+router bgp 65001
+neighbor 10.0.0.2 remote-as 65002
+neighbor 10.0.0.3 remote-as 65003
+router ospf
+ospf router-id 10.0.0.1
+"""
+
+
+def load(tmp_path, text, cache):
+    filename = tmp_path / "frr.conf"
+    filename.write_text(text)
+    config = frr_reload.Config(FakeVtysh())
+    touched = config.load_from_file_incremental(str(filename), cache)
+
+    full = frr_reload.Config(FakeVtysh())
+    full.load_from_file(str(filename))
+    assert [(k, c.lines) for k, c in config.contexts.items()] == [
+        (k, c.lines) for k, c in full.contexts.items()
+    ]
+    return config, touched
+
+
+def test_incremental_blocks(tmp_path):
+    cache = frr_reload.ConfigCache(str(tmp_path / "cache"), [])
+
+    _, touched = load(tmp_path, indented, cache)
+    assert touched is None
+    assert len(cache.order) == 3
+
+    _, touched = load(tmp_path, indented.replace("10.0.0.1", "10.0.0.9"), cache)
+    assert touched == {"router ospf"}
+
+
+def test_incremental_unindented(tmp_path):
+    # The neighbors are sub-commands of "router bgp", they must not become
+    # top-level contexts of their own blocks.
+    assert frr_reload.split_config_blocks(unindented) is None
+
+    cache = frr_reload.ConfigCache(str(tmp_path / "cache"), [])
+    load(tmp_path, indented, cache)
+
+    config, touched = load(tmp_path, unindented, cache)
+
+    assert touched is None
+    assert cache.order == []
+    assert config.contexts[("router bgp 65001",)].lines == [
+        "neighbor 10.0.0.2 remote-as 65002",
+        "neighbor 10.0.0.3 remote-as 65003",
+    ]
+    assert config.contexts[("router ospf",)].lines == ["ospf router-id 10.0.0.1"]
+
+
+def test_incremental_several_contexts(tmp_path):
+    # A block the marker splits into several top-level contexts is not
+    # cached either, here the python marker does not know the abbreviation.
+    cache = frr_reload.ConfigCache(str(tmp_path / "cache"), [])
+    load(tmp_path, indented, cache)
+
+    _, touched = load(tmp_path, "int eth0\n ip address 10.0.0.1/24\n", cache)
+
+    assert touched is None
+    assert cache.order == []
@@ -0,0 +1,122 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Check the python config marker of frr-reload.py against "vtysh -m"
+#
+import glob
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from frr_reload_loader import frr_reload, srcdir
+
+
+def find_vtysh():
+    """
+    vtysh of the build tree (in the source tree, or run from an out of tree
+    build directory), or else the installed one
+    """
+    for path in [
+        os.path.join(srcdir, "vtysh", "vtysh"),
+        os.path.abspath(os.path.join("..", "vtysh", "vtysh")),
+    ]:
+        if os.access(path, os.X_OK):
+            return path
+    return shutil.which("vtysh")
+
+
+vtysh = find_vtysh()
+
+configs = sorted(
+    glob.glob(
+        os.path.join(srcdir, "tests", "topotests", "**", "*.conf"),
+        recursive=True,
+    )
+)
+
+
+def parse(marked):
+    config = frr_reload.Config(None)
+    config.load_marked(marked)
+    return [(key, ctx.lines) for key, ctx in config.contexts.items()]
+
+
+@pytest.mark.skipif(vtysh is None, reason="vtysh not found")
+@pytest.mark.parametrize(
+    "config", configs, ids=[os.path.relpath(c, srcdir) for c in configs]
+)
+def test_marker(config, tmp_path):
+    proc = subprocess.run(
+        [vtysh, "--config_dir", str(tmp_path), "-m", "-f", config],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        pytest.skip("not a valid configuration for this build")
+
+    with open(config) as fh:
+        text = fh.read()
+
+    assert parse(frr_reload.mark_config(text)) == parse(proc.stdout.decode("UTF-8"))
+
+
+# Contexts closed by "!" or by a command of the config node, as "vtysh -m"
+# marks them
+marked_configs = [
+    (
+        "bgp_listen_l3vrf/r1/frr.conf",
+        [
+            (("interface r1-eth1",), []),
+            (("ip route 192.0.2.3/32 172.31.10.3",), []),
+        ],
+    ),
+    (
+        "ospf6_gr_topo1/rt1/zebra.conf",
+        [(("interface eth-rt2",), []), (("ip forwarding",), [])],
+    ),
+    (
+        "bgp_evpn_route_map_match/r1/frr.conf",
+        [
+            (("route-map rt5 permit 30",), []),
+            (("ip prefix-list pl seq 5 permit 192.168.1.0/24",), []),
+        ],
+    ),
+    (
+        "ospf6_topo1_vrf/r1/zebra.conf",
+        [
+            (("interface lo",), []),
+            (
+                ("vrf r1-cust1",),
+                ["ipv6 route fc00:1111:1111:1111::/64 fc00:1:1:1::1234"],
+            ),
+        ],
+    ),
+    ("ldp_snmp/r1/ldpd.conf", [(("line vty",), []), (("agentx",), [])]),
+]
+
+
+@pytest.mark.parametrize(
+    "config,expected", marked_configs, ids=[c[0] for c in marked_configs]
+)
+def test_marker_fixed(config, expected):
+    with open(os.path.join(srcdir, "tests", "topotests", config)) as fh:
+        contexts = parse(frr_reload.mark_config(fh.read()))
+
+    for context in expected:
+        assert context in contexts
+
+
+def test_marker_sub_commands():
+    text = """\
+vrf red
+ip route 10.0.0.0/8 Null0
+exit-vrf
+router bgp 65001
+bgp router-id 10.0.0.1
+!
+"""
+    assert parse(frr_reload.mark_config(text)) == [
+        (("vrf red",), ["ip route 10.0.0.0/8 Null0"]),
+        (("router bgp 65001",), ["bgp router-id 10.0.0.1"]),
+    ]
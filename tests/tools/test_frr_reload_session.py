@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Check which commands the vtysh session of frr-reload.py runs itself
+#
+from frr_reload_loader import frr_reload
+
+
+class FakeVtysh(object):
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, command, stdouts=None):
+        self.commands.append(command)
+        return ""
+
+
+class FailingVtysh(FakeVtysh):
+    def __call__(self, command, stdouts=None):
+        super().__call__(command, stdouts)
+        if stdouts is not None:
+            stdouts.append("Exiting: failed to connect to any daemons.\n")
+        raise frr_reload.VtyshException("vtysh exited with status 1")
+
+
+class FakeSession(frr_reload.VtyshSession):
+    def __init__(self, vtysh):
+        super().__init__(vtysh)
+        self.commands = []
+
+    def run(self, command):
+        self.commands.append(command)
+        return ""
+
+
+def test_session_show():
+    vtysh = FakeVtysh()
+    session = FakeSession(vtysh)
+
+    session("show running-config no-header")
+
+    assert session.commands == ["show running-config no-header"]
+    assert vtysh.commands == []
+
+
+def test_session_help_key():
+    # "?" would show the help of the command instead of being typed
+    vtysh = FakeVtysh()
+    session = FakeSession(vtysh)
+    commands = [
+        "configure",
+        "bgp as-path access-list FOO seq 5 permit ^65001_(65002)?$",
+    ]
+
+    session(commands)
+    session("show bgp ipv4 regexp _65002?_")
+
+    assert session.commands == []
+    assert vtysh.commands == [commands, "show bgp ipv4 regexp _65002?_"]
+
+
+def test_session_config():
+    # Configuration failures are only reported through the exit status
+    vtysh = FakeVtysh()
+    session = FakeSession(vtysh)
+
+    session(["configure", "interface eth0", "description eth0"])
+    session("write")
+
+    assert session.commands == []
+    assert vtysh.commands == [
+        ["configure", "interface eth0", "description eth0"],
+        "write",
+    ]
+
+
+def test_session_config_unavailable():
+    # "configure" failing must stop the reload, not only a locked configuration
+    vtysh = FailingVtysh()
+    session = FakeSession(vtysh)
+
+    assert not session.is_config_available()
+    assert vtysh.commands == [["configure"]]
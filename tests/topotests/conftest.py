@@ -18,7 +18,8 @@ from pathlib import Path
 
 import lib.fixtures
 import pytest
-from lib.common_config import generate_support_bundle
+from lib.common_config import generate_support_bundle, stop_reset_executor
+from lib.micronet_compat import Mininet
 from lib.topogen import diagnose_env, get_topogen
 from lib.topolog import get_test_logdir, logger
 from lib.topotest import gdb_core, json_cmp_result
@@ -266,6 +267,32 @@ def pytest_addoption(parser):
         help="Spawn vtysh on all routers on test failure",
     )
 
+    parser.addoption(
+        "--poll-log-wakeup",
+        action="store_true",
+        help="Re-check polled conditions on a router as soon as its daemons log"
+        " something other than debugs (which only are told apart with"
+        " 'log record-severity')",
+    )
+
+    parser.addoption(
+        "--reuse-topology",
+        action="store_true",
+        help="Keep the network of dictionary topologies for later test modules",
+    )
+
+    parser.addoption(
+        "--serial-router-start",
+        action="store_true",
+        help="Start the routers one after the other instead of concurrently",
+    )
+
+    parser.addoption(
+        "--no-vtysh-session",
+        action="store_true",
+        help="Run every vtysh_cmd() in a new vtysh instead of a per-router session",
+    )
+
     parser.addoption(
         "--ignore-backtraces",
         action="store_true",
@@ -536,9 +563,16 @@ def pytest_runtest_call(item: pytest.Item) -> None:
     if tgen is not None:
         tgen.log_test_start(item.nodeid)
 
+    topotest.poll_sleep_time(reset=True)
+
     # Let the default pytest_runtest_call execute the test function
     yield
 
+    # Reported as a property of the test case in the junit XML
+    item.user_properties.append(
+        ("poll_sleep_secs", "{:.3f}".format(topotest.poll_sleep_time()))
+    )
+
     if not item.config.option.ignore_backtraces:
         check_for_backtraces(item)
     check_for_core_dumps(item)
@@ -757,6 +791,8 @@ def session_autouse():
     if is_main:
         cleanup_previous()
     yield
+    Mininet.stop_parked()
+    stop_reset_executor()
     # Reap munet/mutini children on xdist workers too; otherwise a few stuck
     # workers with zombie mutini block the controller until the session is killed.
     cleanup_current()
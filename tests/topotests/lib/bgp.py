@@ -21,6 +21,8 @@ from lib.common_config import (
     check_address_types,
     find_interface_with_greater_ip,
     generate_ips,
+    get_rib_prefixes,
+    get_rib_snapshot,
     get_frr_ipv6_linklocal,
     retry,
     run_frr_cmd,
@@ -1383,15 +1385,16 @@ def verify_bgp_convergence(tgen, topo=None, dut=None, expected=True, addr_type=N
     result = False
     logger.debug("Entering lib API: {}".format(sys._getframe().f_code.co_name))
     tgen = get_topogen()
-    for router, rnode in tgen.routers().items():
-        if "bgp" not in topo["routers"][router]:
-            continue
-
-        if dut is not None and dut != router:
-            continue
-
+    routers = [
+        router
+        for router in tgen.routers()
+        if "bgp" in topo["routers"][router] and dut in (None, router)
+    ]
+    outputs = tgen.vtysh_gather("show bgp vrf all summary json", routers=routers)
+
+    for router in routers:
         logger.info("Verifying BGP Convergence on router %s:", router)
-        show_bgp_json = run_frr_cmd(rnode, "show bgp vrf all summary json", isjson=True)
+        show_bgp_json = outputs[router]
         # Verifying output dictionary show_bgp_json is empty or not
         if not bool(show_bgp_json):
             errormsg = "BGP is not running"
@@ -2921,18 +2924,15 @@ def verify_bgp_rib(
             command = "show bgp"
 
             # Static routes
-            sleep(2)
             logger.info("Checking router {} BGP RIB:".format(dut))
 
             if "static_routes" in input_dict[routerInput]:
                 static_routes = input_dict[routerInput]["static_routes"]
 
+                # Fetch the routes of all the static routes at once
+                static_route_cmds = []
+                cmd_prefixes = {}
                 for static_route in static_routes:
-                    found_routes = []
-                    missing_routes = []
-                    st_found = False
-                    nh_found = False
-
                     vrf = static_route.setdefault("vrf", None)
                     community = static_route.setdefault("community", None)
                     largeCommunity = static_route.setdefault("largeCommunity", None)
@@ -2950,30 +2950,31 @@ def verify_bgp_rib(
 
                     cmd = "{} json".format(cmd)
 
-                    rib_routes_json = run_frr_cmd(rnode, cmd, isjson=True)
+                    # Generating IPs for verification
+                    prefixes = get_rib_prefixes(
+                        generate_ips(
+                            static_route["network"], static_route.get("no_of_ip", 1)
+                        ),
+                        addr_type,
+                    )
+                    static_route_cmds.append((cmd, prefixes))
+                    cmd_prefixes.setdefault(cmd, []).extend(prefixes)
+                rib_snapshot = get_rib_snapshot(rnode, cmd_prefixes, "routes")
+
+                for cmd, prefixes in static_route_cmds:
+                    found_routes = []
+                    missing_routes = []
+                    st_found = False
+                    nh_found = False
+
+                    rib_routes_json = rib_snapshot[cmd]
 
                     # Verifying output dictionary rib_routes_json is not empty
                     if bool(rib_routes_json) == False:
                         errormsg = "No route found in rib of router {}..".format(router)
                         return errormsg
 
-                    network = static_route["network"]
-
-                    if "no_of_ip" in static_route:
-                        no_of_ip = static_route["no_of_ip"]
-                    else:
-                        no_of_ip = 1
-
-                    # Generating IPs for verification
-                    ip_list = generate_ips(network, no_of_ip)
-
-                    for st_rt in ip_list:
-                        st_rt = str(ipaddress.ip_network(frr_unicode(st_rt)))
-
-                        _addr_type = validate_ip_address(st_rt)
-                        if _addr_type != addr_type:
-                            continue
-
+                    for st_rt in prefixes:
                         if st_rt in rib_routes_json["routes"]:
                             st_found = True
                             found_routes.append(st_rt)
@@ -3116,40 +3117,36 @@ def verify_bgp_rib(
 
                 cmd = "{} json".format(cmd)
 
-                rib_routes_json = run_frr_cmd(rnode, cmd, isjson=True)
-
-                # Verifying output dictionary rib_routes_json is not empty
-                if bool(rib_routes_json) == False:
-                    errormsg = "No route found in rib of router {}..".format(router)
-                    return errormsg
-
                 bgp_net_advertise = bgp_data["address_family"][addr_type]["unicast"]
                 advertise_network = bgp_net_advertise.setdefault(
                     "advertise_networks", []
                 )
 
+                # Only fetch the routes being verified
+                network_prefixes = []
                 for advertise_network_dict in advertise_network:
+                    ip_list = generate_ips(
+                        advertise_network_dict["network"],
+                        advertise_network_dict.get("no_of_network", 1),
+                    )
+                    network_prefixes.append(get_rib_prefixes(ip_list, addr_type))
+                rib_routes_json = get_rib_snapshot(
+                    rnode,
+                    {cmd: [p for prefixes in network_prefixes for p in prefixes]},
+                    "routes",
+                )[cmd]
+
+                # Verifying output dictionary rib_routes_json is not empty
+                if bool(rib_routes_json) == False:
+                    errormsg = "No route found in rib of router {}..".format(router)
+                    return errormsg
+
+                for prefixes in network_prefixes:
                     found_routes = []
                     missing_routes = []
                     found = False
 
-                    network = advertise_network_dict["network"]
-
-                    if "no_of_network" in advertise_network_dict:
-                        no_of_network = advertise_network_dict["no_of_network"]
-                    else:
-                        no_of_network = 1
-
-                    # Generating IPs for verification
-                    ip_list = generate_ips(network, no_of_network)
-
-                    for st_rt in ip_list:
-                        st_rt = str(ipaddress.ip_network(frr_unicode(st_rt)))
-
-                        _addr_type = validate_ip_address(st_rt)
-                        if _addr_type != addr_type:
-                            continue
-
+                    for st_rt in prefixes:
                         if st_rt in rib_routes_json["routes"]:
                             found = True
                             found_routes.append(st_rt)
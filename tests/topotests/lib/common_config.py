@@ -7,14 +7,18 @@
 
 import functools
 import ipaddress
+import multiprocessing
 import os
 import platform
+import shutil
 import socket
 import subprocess
 import sys
 import traceback
+import weakref
 import configparser
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 from datetime import datetime, timedelta
 from functools import wraps
@@ -217,6 +221,41 @@ class InvalidCLIError(Exception):
     """Raise when the CLI command is wrong"""
 
 
+def get_rib_prefixes(ip_list, addr_type):
+    """
+    Returns the prefixes of `ip_list` (see generate_ips()) that are of
+    `addr_type`, in the format used as keys of the RIB JSON output.
+    """
+    prefixes = []
+    for ip in ip_list:
+        prefix = str(ipaddress.ip_network(frr_unicode(ip), strict=False))
+        if validate_ip_address(prefix) == addr_type:
+            prefixes.append(prefix)
+    return prefixes
+
+
+def get_rib_snapshot(rnode, cmd_prefixes, routes_key=None):
+    """
+    Runs each show command once for all the prefixes verified with it.
+
+    * `rnode`: router node
+    * `cmd_prefixes`: dictionary of the JSON show commands to the prefixes to
+      fetch with them, in the format returned by get_rib_prefixes()
+    * `routes_key`: key of the routes in the command output, e.g. "routes" for
+      "show bgp json", None when they are at the top level
+
+    Returns a dictionary of the commands to their output, only holding the
+    requested routes (see topotest.router_json_get()).
+    """
+    snapshot = {}
+    for cmd, prefixes in cmd_prefixes.items():
+        expected = dict.fromkeys(prefixes)
+        if routes_key:
+            expected = {routes_key: expected}
+        snapshot[cmd] = topotest.router_json_get(rnode, cmd, expected)
+    return snapshot
+
+
 def run_frr_cmd(rnode, cmd, isjson=False):
     """
     Execute frr show commands in privileged mode
@@ -267,7 +306,8 @@ def apply_raw_config(tgen, input_dict):
             config_cmd = [config_cmd]
 
         frr_cfg_file = "{}/{}/{}".format(tgen.logdir, router_name, FRRCFG_FILE)
-        with open(frr_cfg_file, "w") as cfg:
+        mode = "w" if tgen.config_batch_routers is None else "a"
+        with open(frr_cfg_file, mode) as cfg:
             for cmd in config_cmd:
                 cfg.write("{}\n".format(cmd))
 
@@ -318,6 +358,9 @@ def create_common_configurations(
         mode = "a"
     elif not load_config:
         mode = "a"
+    elif tgen.config_batch_routers is not None:
+        # Keep what the batch has written so far
+        mode = "a"
     else:
         mode = "w"
 
@@ -499,6 +542,86 @@ def save_initial_config_on_routers(tgen):
             )
 
 
+# Topogen -> {config file: (mtime, baseline from _get_reset_baseline())}
+_reset_baselines = weakref.WeakKeyDictionary()
+_reset_executor = None
+
+
+def _get_reset_baseline(tgen, frr_reload, filename):
+    """
+    Returns the contexts of `filename`, marked with vtysh as "frr-reload.py
+    --test-reset" does, as (keys, lines) pairs the delta processes unpickle
+    without frr-reload.py.
+    """
+    baselines = _reset_baselines.setdefault(tgen, {})
+    mtime = os.stat(filename).st_mtime_ns
+    if filename not in baselines or baselines[filename][0] != mtime:
+        vtysh_path = shutil.which("vtysh")
+        bindir = os.path.dirname(vtysh_path) if vtysh_path else "/usr/bin"
+        config = frr_reload.Config(frr_reload.Vtysh(bindir))
+        config.load_from_file(filename)
+        contexts = [(keys, ctx.lines) for keys, ctx in config.contexts.items()]
+        baselines[filename] = (mtime, contexts)
+    return baselines[filename][1]
+
+
+def _get_reset_executor():
+    global _reset_executor
+
+    if _reset_executor is None:
+        # Not forked from this process, its threads may hold locks
+        _reset_executor = ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _reset_executor
+
+
+def stop_reset_executor():
+    """
+    Stops the processes computing the deltas of `reset_config_on_routers()`.
+    """
+    global _reset_executor
+
+    if _reset_executor is not None:
+        _reset_executor.shutdown()
+        _reset_executor = None
+
+
+def reset_config_delta(baseline, running_text):
+    """
+    Returns the commands to go from the `running_text` configuration to the
+    `baseline` one, (keys, lines) pairs from `_get_reset_baseline()`, as
+    "frr-reload.py --test-reset" prints them.
+
+    The text of "show running-config" is marked with the python version of
+    "vtysh -m", vtysh output needs no validation.
+    """
+    frr_reload = topotest.load_frr_reload()
+    vtysh = frr_reload.Vtysh(marker=frr_reload.mark_config)
+    contexts = [
+        (keys, frr_reload.Context(keys, list(lines))) for keys, lines in baseline
+    ]
+    baseline = frr_reload.Config(vtysh, contexts)
+    running = frr_reload.Config(vtysh)
+    running.load_from_text(running_text)
+
+    lines_to_add, lines_to_del = frr_reload.compare_context_objects(baseline, running)
+    delta = []
+    for ctx_keys, line in lines_to_del:
+        if line == "!":
+            continue
+        nolines = [x.strip() for x in frr_reload.lines_to_config(ctx_keys, line, True)]
+        # Leave the debug and log file commands configured
+        delta += [x for x in nolines if "debug" not in x and "log file" not in x]
+    for ctx_keys, line in lines_to_add:
+        if line == "!":
+            continue
+        lines = frr_reload.lines_to_config(ctx_keys, line, False)
+        delta += [x.strip() for x in lines if x.strip()]
+
+    return "".join(x + "\n" for x in delta)
+
+
 def reset_config_on_routers(tgen, routerName=None):
     """
     Resets configuration on routers to the snapshot created using input JSON
@@ -527,6 +650,13 @@ def reset_config_on_routers(tgen, routerName=None):
             return True
         router_list = {routerName: router_list[routerName]}
 
+    if tgen.config_batch_routers is not None:
+        # The configuration the batch has not loaded yet would be reset anyway
+        for rname in router_list:
+            if rname in tgen.config_batch_routers:
+                tgen.config_batch_routers.remove(rname)
+                open("{}/{}/{}".format(tgen.logdir, rname, FRRCFG_FILE), "w").close()
+
     delta_fmt = tgen.logdir + "/{}/delta-{}.conf"
     # FRRCFG_BKUP_FILE
     target_cfg_fmt = tgen.logdir + "/{}/frr_json_initial.conf"
@@ -558,32 +688,73 @@ def reset_config_on_routers(tgen, routerName=None):
     #
     # Get all delta's in parallel
     #
-    procs = {}
-    for rname in router_list:
-        logger.debug(
-            "Generating delta for router %s to new configuration (gen %d)", rname, gen
-        )
-        with open(delta_fmt.format(rname, gen), "w") as delta_fd:
-            procs[rname] = tgen.net.popen(
-                [
-                    "/usr/lib/frr/frr-reload.py",
-                    "--test-reset",
-                    "--input",
-                    run_cfg_fmt.format(rname, gen),
-                    "--test",
-                    target_cfg_fmt.format(rname),
-                ],
-                stdin=None,
-                stdout=delta_fd,
-                stderr=subprocess.PIPE,
+    frr_reload = topotest.load_frr_reload()
+    if frr_reload is not None:
+        futures = {}
+        for rname in router_list:
+            logger.debug(
+                "Generating delta for router %s to new configuration (gen %d)",
+                rname,
+                gen,
             )
-    for rname, p in procs.items():
-        _, error = p.communicate()
-        if p.returncode:
-            logger.error(
-                "Delta file creation for %s failed %d: %s", rname, p.returncode, error
+            try:
+                baseline = _get_reset_baseline(
+                    tgen, frr_reload, target_cfg_fmt.format(rname)
+                )
+            except frr_reload.VtyshException as error:
+                logger.error("Baseline parse for %s failed: %s", rname, error)
+                raise InvalidCLIError(
+                    "frr-reload error for {}: {}".format(rname, error)
+                )
+            with open(run_cfg_fmt.format(rname, gen)) as run_cfg_fd:
+                running = run_cfg_fd.read()
+            futures[rname] = _get_reset_executor().submit(
+                reset_config_delta, baseline, running
+            )
+        for rname, future in futures.items():
+            try:
+                delta = future.result()
+            except Exception as error:
+                logger.error("Delta file creation for %s failed: %s", rname, error)
+                raise InvalidCLIError(
+                    "frr-reload error for {}: {}".format(rname, error)
+                )
+            with open(delta_fmt.format(rname, gen), "w") as delta_fd:
+                delta_fd.write(delta)
+    else:
+        procs = {}
+        for rname in router_list:
+            logger.debug(
+                "Generating delta for router %s to new configuration (gen %d)",
+                rname,
+                gen,
             )
-            raise InvalidCLIError("frr-reload error for {}: {}".format(rname, error))
+            with open(delta_fmt.format(rname, gen), "w") as delta_fd:
+                procs[rname] = tgen.net.popen(
+                    [
+                        topotest.FRR_RELOAD_PATH,
+                        "--test-reset",
+                        "--input",
+                        run_cfg_fmt.format(rname, gen),
+                        "--test",
+                        target_cfg_fmt.format(rname),
+                    ],
+                    stdin=None,
+                    stdout=delta_fd,
+                    stderr=subprocess.PIPE,
+                )
+        for rname, p in procs.items():
+            _, error = p.communicate()
+            if p.returncode:
+                logger.error(
+                    "Delta file creation for %s failed %d: %s",
+                    rname,
+                    p.returncode,
+                    error,
+                )
+                raise InvalidCLIError(
+                    "frr-reload error for {}: {}".format(rname, error)
+                )
 
     #
     # Apply all the deltas in parallel
@@ -710,6 +881,14 @@ def load_config_to_routers(tgen, routers, save_bkup=False):
 
     logger.debug("Entering API: load_config_to_routers")
 
+    if tgen.config_batch_routers is not None and not save_bkup:
+        # Loaded at the end of the batch, see Topogen.config_batch()
+        for router in routers:
+            if router not in tgen.config_batch_routers:
+                tgen.config_batch_routers.append(router)
+        logger.debug("Exiting API: load_config_to_routers (batched)")
+        return True
+
     tgen.cfg_gen += 1
     gen = tgen.cfg_gen
 
@@ -1849,7 +2028,7 @@ def retry(retry_timeout, initial_wait=0, expected=True, diag_pct=0.75):
             # longer retry timeout value.
             saved_failure = None
 
-            retry_sleep = 2
+            poller = topotest.Poller(2)
 
             # Allow the wrapped function's args to override the fixtures
             _retry_timeout = kwargs.pop("retry_timeout", retry_timeout)
@@ -1871,7 +2050,9 @@ def retry(retry_timeout, initial_wait=0, expected=True, diag_pct=0.75):
                 seconds_left = (retry_until - datetime.now()).total_seconds()
                 try:
                     try:
-                        ret = func(*args, seconds_left=seconds_left, **kwargs)
+                        ret = poller.call(
+                            func, *args, seconds_left=seconds_left, **kwargs
+                        )
                     except TypeError as error:
                         if "seconds_left" not in str(error):
                             raise
@@ -1929,17 +2110,17 @@ def retry(retry_timeout, initial_wait=0, expected=True, diag_pct=0.75):
 
                 if saved_failure:
                     logger.debug(
-                        "RETRY DIAG: [failure] Sleeping %ds until next retry with %.1f retry time left - too see if timeout was too short",
-                        retry_sleep,
+                        "RETRY DIAG: [failure] Sleeping %.2fs until next retry with %.1f retry time left - too see if timeout was too short",
+                        poller.delay,
                         seconds_left,
                     )
                 else:
                     logger.debug(
-                        "Sleeping %ds until next retry with %.1f retry time left",
-                        retry_sleep,
+                        "Sleeping %.2fs until next retry with %.1f retry time left",
+                        poller.delay,
                         seconds_left,
                     )
-                sleep(retry_sleep)
+                poller.sleep()
 
         func_retry._original = func
         return func_retry
@@ -3282,16 +3463,12 @@ def verify_rib(
             if "static_routes" in input_dict[routerInput]:
                 static_routes = input_dict[routerInput]["static_routes"]
 
-                for idx, static_route in enumerate(static_routes):
+                # Fetch the routes of all the static routes at once
+                static_route_cmds = []
+                cmd_prefixes = {}
+                for static_route in static_routes:
                     if "vrf" in static_route and static_route["vrf"] is not None:
-                        logger.info(
-                            "[DUT: %s]: Verifying routes for VRF: %s",
-                            router,
-                            static_route["vrf"],
-                        )
-
                         cmd = "{} vrf {}".format(command, static_route["vrf"])
-
                     else:
                         cmd = "{}".format(command)
 
@@ -3300,40 +3477,44 @@ def verify_rib(
 
                     cmd = "{} json".format(cmd)
 
-                    rib_routes_json = run_frr_cmd(rnode, cmd, isjson=True)
-
-                    # Verifying output dictionary rib_routes_json is not empty
-                    if bool(rib_routes_json) is False:
-                        errormsg = "No route found in rib of router {}..".format(router)
-                        return errormsg
+                    # Generating IPs for verification
+                    prefixes = get_rib_prefixes(
+                        generate_ips(
+                            static_route["network"], static_route.get("no_of_ip", 1)
+                        ),
+                        addr_type,
+                    )
+                    static_route_cmds.append((cmd, prefixes))
+                    cmd_prefixes.setdefault(cmd, []).extend(prefixes)
+                rib_snapshot = get_rib_snapshot(rnode, cmd_prefixes)
 
-                    network = static_route["network"]
-                    if "no_of_ip" in static_route:
-                        no_of_ip = static_route["no_of_ip"]
-                    else:
-                        no_of_ip = 1
+                for idx, static_route in enumerate(static_routes):
+                    if "vrf" in static_route and static_route["vrf"] is not None:
+                        logger.info(
+                            "[DUT: %s]: Verifying routes for VRF: %s",
+                            router,
+                            static_route["vrf"],
+                        )
 
                     if "tag" in static_route:
                         _tag = static_route["tag"]
                     else:
                         _tag = None
 
-                    # Generating IPs for verification
-                    ip_list = generate_ips(network, no_of_ip)
+                    cmd, prefixes = static_route_cmds[idx]
+                    rib_routes_json = rib_snapshot[cmd]
+
+                    # Verifying output dictionary rib_routes_json is not empty
+                    if bool(rib_routes_json) is False:
+                        errormsg = "No route found in rib of router {}..".format(router)
+                        return errormsg
                     st_found = False
                     nh_found = False
 
                     # Track verification errors for this prefix to continue processing
                     verification_errors = []
 
-                    for st_rt in ip_list:
-                        st_rt = str(
-                            ipaddress.ip_network(frr_unicode(st_rt), strict=False)
-                        )
-                        _addr_type = validate_ip_address(st_rt)
-                        if _addr_type != addr_type:
-                            continue
-
+                    for st_rt in prefixes:
                         if st_rt in rib_routes_json:
                             st_found = True
                             found_routes.append(st_rt)
@@ -3620,13 +3801,6 @@ def verify_rib(
                     else:
                         cmd = "{} json".format(command)
 
-                rib_routes_json = run_frr_cmd(rnode, cmd, isjson=True)
-
-                # Verifying output dictionary rib_routes_json is not empty
-                if bool(rib_routes_json) is False:
-                    errormsg = "No route found in rib of router {}..".format(router)
-                    return errormsg
-
                 start_ip = advertise_network_dict["network"]
                 if "no_of_network" in advertise_network_dict:
                     no_of_network = advertise_network_dict["no_of_network"]
@@ -3635,19 +3809,22 @@ def verify_rib(
 
                 # Generating IPs for verification
                 ip_list = generate_ips(start_ip, no_of_network)
+
+                # Only fetch the routes being verified
+                prefixes = get_rib_prefixes(ip_list, addr_type)
+                rib_routes_json = get_rib_snapshot(rnode, {cmd: prefixes})[cmd]
+
+                # Verifying output dictionary rib_routes_json is not empty
+                if bool(rib_routes_json) is False:
+                    errormsg = "No route found in rib of router {}..".format(router)
+                    return errormsg
                 st_found = False
                 nh_found = False
 
                 # Track verification errors for this prefix to continue processing
                 verification_errors = []
 
-                for st_rt in ip_list:
-                    st_rt = str(ipaddress.ip_network(frr_unicode(st_rt), strict=False))
-
-                    _addr_type = validate_ip_address(st_rt)
-                    if _addr_type != addr_type:
-                        continue
-
+                for st_rt in prefixes:
                     logger.info("Checking BGP route: %s", st_rt)
                     if st_rt in rib_routes_json:
                         st_found = True
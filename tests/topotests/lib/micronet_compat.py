@@ -7,9 +7,10 @@
 #
 import ipaddress
 import os
+from pathlib import Path
 
 from munet import cli
-from munet.base import BaseMunet, LinuxNamespace
+from munet.base import BaseMunet, LinuxNamespace, MunetError
 
 
 class Node(LinuxNamespace):
@@ -125,6 +126,10 @@ class Mininet(BaseMunet):
 
     g_mnet_inst = None
 
+    # Topologies kept by `park()` for reuse, by fingerprint
+    parked = {}
+    max_parked = 4
+
     def __init__(self, rundir=None, pytestconfig=None, logger=None):
         """
         Create a Micronet.
@@ -147,12 +152,7 @@ class Mininet(BaseMunet):
             pid=False, rundir=rundir, pytestconfig=pytestconfig, logger=logger
         )
 
-        # From munet/munet/native.py
-        with open(os.path.join(self.rundir, "nspid"), "w", encoding="ascii") as f:
-            f.write(f"{self.pid}\n")
-
-        with open(os.path.join(self.rundir, "nspids"), "w", encoding="ascii") as f:
-            f.write(f'{" ".join([str(x) for x in self.pids])}\n')
+        self.write_pid_files()
 
         hosts_file = os.path.join(self.rundir, "hosts.txt")
         with open(hosts_file, "w", encoding="ascii") as hf:
@@ -288,6 +288,65 @@ ff02::2\tip6-allrouters
     def __str__(self):
         return "Mininet()"
 
+    def write_pid_files(self):
+        # From munet/munet/native.py
+        with open(os.path.join(self.rundir, "nspid"), "w", encoding="ascii") as f:
+            f.write(f"{self.pid}\n")
+
+        with open(os.path.join(self.rundir, "nspids"), "w", encoding="ascii") as f:
+            f.write(f'{" ".join([str(x) for x in self.pids])}\n')
+
+    def park(self, fingerprint):
+        """
+        Keep the topology, restored to its last snapshot, for reuse by a later
+        `take_parked(fingerprint)`. Returns False if it cannot be reused, e.g.
+        when processes the test started are still running in the hosts, the
+        caller should then stop it.
+        """
+        if fingerprint in Mininet.parked or len(Mininet.parked) >= self.max_parked:
+            return False
+        try:
+            for host in self.hosts.values():
+                pids = host.get_ns_processes()
+                if pids:
+                    raise MunetError(f"{host}: processes {pids} still running")
+            self.restore()
+        except Exception as error:
+            self.logger.info("%s: not reusable: %s", self, error)
+            return False
+        Mininet.parked[fingerprint] = self
+        if Mininet.g_mnet_inst is self:
+            Mininet.g_mnet_inst = None
+        return True
+
+    @classmethod
+    def take_parked(cls, fingerprint, rundir, logger):
+        """
+        Return the topology parked with `fingerprint`, now using `rundir` and
+        `logger`, or None.
+        """
+        net = cls.parked.pop(fingerprint, None)
+        if net is None:
+            return None
+        if cls.g_mnet_inst is not None:
+            cls.g_mnet_inst.stop()
+        cls.g_mnet_inst = net
+
+        net.logger = logger
+        net.rundir = Path(rundir)
+        for host in net.hosts.values():
+            host.rundir = net.rundir.joinpath(host.name)
+        net.write_pid_files()
+        net.logger.debug("%s: Reusing", net)
+        return net
+
+    @classmethod
+    def stop_parked(cls):
+        "Stop all the parked topologies."
+        while cls.parked:
+            _, net = cls.parked.popitem()
+            net.stop()
+
     def configure_hosts(self):
         """
         Configure hosts once the topology has been built.
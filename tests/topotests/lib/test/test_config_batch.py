@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: ISC
+
+#
+# test_config_batch.py
+# Tests for library function: Topogen.config_batch().
+#
+
+"""
+Tests for the Topogen.config_batch() function.
+"""
+
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.common_config import FRRCFG_FILE, InvalidCLIError, apply_raw_config
+from lib.topogen import Topogen
+from lib.topolog import logger
+
+
+class FakeProcess(object):
+    def __init__(self, returncode):
+        self.returncode = returncode
+
+    def communicate(self):
+        return "", None
+
+
+class FakeRouter(object):
+    "Records the configurations loaded with 'vtysh -f'"
+
+    def __init__(self):
+        self.logger = logger
+        self.loaded = []
+        self.returncode = 0
+
+    def popen(self, cmd, **kwargs):
+        with open(cmd[-1]) as f:
+            self.loaded.append(f.read())
+        return FakeProcess(self.returncode)
+
+
+class FakeTopogen(Topogen):
+    def __init__(self, logdir, names):
+        # pylint: disable=super-init-not-called
+        self.logdir = logdir
+        self.cfg_gen = 0
+        self.config_batch_routers = None
+        self.fake_routers = {}
+        for name in names:
+            os.mkdir(os.path.join(logdir, name))
+            self.fake_routers[name] = FakeRouter()
+
+    def routers(self):
+        return self.fake_routers
+
+
+def raw_config(*commands):
+    return {"r1": {"raw_config": list(commands)}}
+
+
+def test_config_batch_load(tmp_path):
+    "Test the configuration is loaded once, at the end of the batch"
+
+    tgen = FakeTopogen(str(tmp_path), ["r1", "r2"])
+    r1 = tgen.routers()["r1"]
+
+    with tgen.config_batch():
+        assert apply_raw_config(tgen, raw_config("ip forwarding"))
+        with tgen.config_batch():
+            assert apply_raw_config(tgen, raw_config("ipv6 forwarding"))
+        assert r1.loaded == []
+
+    assert r1.loaded == ["ip forwarding\nipv6 forwarding\n"]
+    assert tgen.routers()["r2"].loaded == []
+    assert tgen.config_batch_routers is None
+
+
+def test_config_batch_exception(tmp_path):
+    "Test the configuration is dropped when the batch raises"
+
+    tgen = FakeTopogen(str(tmp_path), ["r1"])
+    r1 = tgen.routers()["r1"]
+
+    with pytest.raises(KeyError):
+        with tgen.config_batch():
+            apply_raw_config(tgen, raw_config("ip forwarding"))
+            raise KeyError("r2")
+
+    assert r1.loaded == []
+    assert os.path.getsize(os.path.join(tgen.logdir, "r1", FRRCFG_FILE)) == 0
+    assert tgen.config_batch_routers is None
+
+    with tgen.config_batch():
+        apply_raw_config(tgen, raw_config("ipv6 forwarding"))
+
+    assert r1.loaded == ["ipv6 forwarding\n"]
+
+
+def test_config_batch_load_error(tmp_path):
+    "Test a failure to load the configuration raises"
+
+    tgen = FakeTopogen(str(tmp_path), ["r1"])
+    tgen.routers()["r1"].returncode = 1
+
+    with pytest.raises(InvalidCLIError):
+        with tgen.config_batch():
+            apply_raw_config(tgen, raw_config("ip forwarding"))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -22,7 +22,7 @@ CWD = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(CWD, "../../"))
 
 # pylint: disable=C0413
-from lib.topotest import json_cmp
+from lib.topotest import json_cmp, partial_json_cmds, router_json_get
 
 
 def test_json_intersect_true():
@@ -623,5 +623,143 @@ def test_json_list_nested_with_objects():
     assert json_cmp(dcomplete, dsub1) is None
 
 
+def test_json_list_duplicate_keys():
+    "Test array elements sharing values are each matched once"
+
+    dcomplete = [
+        {"prefix": "10.0.0.0/24", "nexthop": "1.1.1.1"},
+        {"prefix": "10.0.0.0/24", "nexthop": "1.1.1.2"},
+        {"prefix": "10.0.1.0/24", "nexthop": "1.1.1.1"},
+    ]
+
+    dsub1 = [
+        {"prefix": "10.0.0.0/24", "nexthop": "1.1.1.2"},
+        {"prefix": "10.0.0.0/24"},
+    ]
+
+    dsub2 = [
+        {"prefix": "10.0.0.0/24"},
+        {"prefix": "10.0.0.0/24"},
+        {"prefix": "10.0.0.0/24"},
+    ]
+
+    dsub3 = [
+        {"prefix": "10.0.0.0/24", "nexthop": "1.1.1.3"},
+    ]
+
+    assert json_cmp(dcomplete, dsub1) is None
+    assert json_cmp(dcomplete, dsub2) is not None
+    assert json_cmp(dcomplete, dsub3) is not None
+
+
+def test_json_not_modified():
+    "Test json_cmp() leaves its arguments untouched"
+
+    dcomplete = {"a": [3, 2, 1], "b": [{"c": 1}, {"c": 2}]}
+    dsub1 = {"a": ["__ordered__", 3, 2, 1], "b": [{"c": 2}, {"c": 1}]}
+
+    assert json_cmp(dcomplete, dsub1) is None
+    assert dcomplete == {"a": [3, 2, 1], "b": [{"c": 1}, {"c": 2}]}
+    assert dsub1 == {"a": ["__ordered__", 3, 2, 1], "b": [{"c": 2}, {"c": 1}]}
+
+
+def test_json_report():
+    "Test the error report of a mismatch"
+
+    dcomplete = {"a": [{"b": 1}, {"b": 2}]}
+    dsub1 = {"a": [{"b": 3}], "c": 1}
+
+    result = json_cmp(dcomplete, dsub1)
+    assert result is not None
+    assert result.has_errors()
+    assert "> $: expected has key 'c' which is not present in output" in str(result)
+    assert "> $->a: expected has the following element at index 0" in str(result)
+
+
+def test_json_report_copy():
+    "Test the error report is about the data that was compared"
+
+    output = {"a": 1}
+    expected = {"a": 2}
+
+    result = json_cmp(output, expected)
+    # Retry loops update the data before the result is printed
+    output["a"] = 2
+    expected["b"] = 3
+
+    assert "output has element with value '1'" in str(result)
+    assert "expected has key 'b'" not in str(result)
+
+
+def test_partial_json_cmds():
+    "Test splitting a command on the keys of the expected data"
+
+    assert partial_json_cmds(
+        "show ip route vrf red bgp json", {"10.0.0.0/24": [], "10.0.1.1/32": None}
+    ) == (
+        [
+            "show ip route vrf red 10.0.0.0/24 longer-prefixes bgp json",
+            "show ip route vrf red 10.0.1.1/32 longer-prefixes bgp json",
+        ],
+        None,
+    )
+    assert partial_json_cmds(
+        "show bgp ipv6 unicast json",
+        {"routerId": "1.1.1.1", "routes": {"2001::/64": []}},
+    ) == (["show bgp ipv6 unicast 2001::/64 longer-prefixes json"], "routes")
+    assert partial_json_cmds(
+        "show ip bgp neighbor json", {"192.168.0.2": {"bgpState": "Established"}}
+    ) == (["show ip bgp neighbor 192.168.0.2 json"], None)
+
+    # Keys that are not canonical prefixes of the right family
+    assert partial_json_cmds("show ip route json", {"2001::/64": []}) is None
+    assert partial_json_cmds("show ip route json", {"10.0.0.1/24": []}) is None
+    assert partial_json_cmds("show bgp ipv4 json", {"totalRoutes": 1}) is None
+    assert partial_json_cmds("show bgp neighbors json", {"r1-eth0": {}}) is None
+    # Unknown commands
+    assert partial_json_cmds("show ip route summary json", {"10.0.0.0/24": []}) is None
+    assert partial_json_cmds("show bgp ipv4 json detail", {"routes": {}}) is None
+
+
+def test_router_json_get():
+    "Test the merging of the partial outputs"
+
+    class FakeRouter:
+        def __init__(self, outputs):
+            self.outputs = outputs
+            self.cmds = []
+
+        def vtysh_cmd(self, cmd, isjson=False):
+            self.cmds.append(cmd)
+            return self.outputs[cmd]
+
+    router = FakeRouter(
+        {
+            "show bgp ipv4 10.0.0.0/24 longer-prefixes json": {
+                "routerId": "1.1.1.1",
+                "routes": {"10.0.0.0/24": [{"valid": True}]},
+            },
+            "show bgp ipv4 10.0.1.0/24 longer-prefixes json": {
+                "routerId": "1.1.1.1",
+                "routes": {},
+            },
+        }
+    )
+    expected = {"routes": {"10.0.0.0/24": [{"valid": True}], "10.0.1.0/24": None}}
+    output = router_json_get(router, "show bgp ipv4 json", expected)
+    assert output == {
+        "routerId": "1.1.1.1",
+        "routes": {"10.0.0.0/24": [{"valid": True}]},
+    }
+    assert json_cmp(output, expected) is None
+    assert len(router.cmds) == 2
+
+    # exact comparisons need the full output
+    router = FakeRouter({"show bgp ipv4 json": {"routes": {}}})
+    assert router_json_get(router, "show bgp ipv4 json", expected, exact=True) == {
+        "routes": {}
+    }
+
+
 if __name__ == "__main__":
     sys.exit(pytest.main())
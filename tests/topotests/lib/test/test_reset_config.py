@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: ISC
+
+#
+# test_reset_config.py
+# Tests for library function: reset_config_delta().
+#
+
+"""
+Tests for the reset_config_delta() function, it must print the commands
+"frr-reload.py --test-reset" prints.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib import topotest
+from lib.common_config import _get_reset_baseline, reset_config_delta
+
+FRR_RELOAD_PATH = os.path.realpath(os.path.join(CWD, "../../../../tools/frr-reload.py"))
+
+baseline_text = """\
+frr defaults traditional
+hostname r1
+log file zebra.log
+ip route 10.0.9.0/24 Null0
+!
+interface r1-eth0
+ ip address 10.0.1.1/24
+ ip ospf hello-interval 2
+exit
+!
+router bgp 65001
+ bgp router-id 10.0.0.1
+ neighbor 10.0.1.2 remote-as 65002
+ !
+ address-family ipv4 unicast
+  network 10.0.9.0/24
+ exit-address-family
+exit
+!
+router ospf
+ ospf router-id 10.0.0.1
+exit
+!
+"""
+
+running_text = """\
+frr version 10.0
+frr defaults traditional
+hostname r1
+log file zebra.log
+log file bgpd.log
+debug bgp updates
+ip route 10.0.8.0/24 Null0
+!
+interface r1-eth0
+ ip address 10.0.1.1/24
+ ip address 10.0.2.1/24
+exit
+!
+router bgp 65001
+ bgp router-id 10.0.0.1
+ neighbor 10.0.1.2 remote-as 65003
+ neighbor 10.0.1.3 remote-as 65002
+ !
+ address-family ipv4 unicast
+  network 10.0.8.0/24
+  redistribute static
+ exit-address-family
+exit
+!
+router isis 1
+ net 49.0001.0000.0000.0001.00
+exit
+!
+"""
+
+
+class FakeTopogen(object):
+    "Keys the cache of the parsed baselines"
+
+
+@pytest.fixture
+def frr_reload(monkeypatch):
+    monkeypatch.setattr(topotest, "FRR_RELOAD_PATH", FRR_RELOAD_PATH)
+    monkeypatch.setattr(topotest, "_frr_reload", None)
+    module = topotest.load_frr_reload()
+    assert module is not None
+    return module
+
+
+def write_configs(tmp_path):
+    baseline_file = tmp_path / "frr_json_initial.conf"
+    baseline_file.write_text(baseline_text)
+    running_file = tmp_path / "frr-1.sav"
+    running_file.write_text(running_text)
+    return str(baseline_file), str(running_file)
+
+
+def test_reset_delta_python_marker(tmp_path, frr_reload):
+    "Test the delta of configurations marked in python, without vtysh"
+
+    baseline_file, running_file = write_configs(tmp_path)
+    config = frr_reload.Config(frr_reload.Vtysh(marker=frr_reload.mark_config))
+    config.load_from_file(baseline_file)
+    baseline = [(keys, ctx.lines) for keys, ctx in config.contexts.items()]
+
+    # Only checked for, vtysh is not run with the python marker
+    (tmp_path / "vtysh").touch()
+    expected = subprocess.check_output(
+        [
+            sys.executable,
+            FRR_RELOAD_PATH,
+            "--test-reset",
+            "--marker",
+            "python",
+            "--bindir",
+            str(tmp_path),
+            "--confdir",
+            str(tmp_path),
+            "--input",
+            running_file,
+            "--test",
+            baseline_file,
+        ],
+        text=True,
+    )
+
+    delta = reset_config_delta(baseline, running_text)
+    assert delta == expected
+    assert "debug bgp updates" not in delta
+    assert "no log file bgpd.log" not in delta
+    assert "no router isis 1\n" in delta
+    assert "ip route 10.0.9.0/24 Null0\n" in delta
+
+
+@pytest.mark.skipif(shutil.which("vtysh") is None, reason="needs vtysh")
+def test_reset_delta_vtysh(tmp_path, frr_reload):
+    "Test the delta of a baseline marked with vtysh, as --test-reset does"
+
+    baseline_file, running_file = write_configs(tmp_path)
+    tgen = FakeTopogen()
+    baseline = _get_reset_baseline(tgen, frr_reload, baseline_file)
+    # Parsed once
+    assert _get_reset_baseline(tgen, frr_reload, baseline_file) is baseline
+
+    expected = subprocess.check_output(
+        [
+            sys.executable,
+            FRR_RELOAD_PATH,
+            "--test-reset",
+            "--bindir",
+            os.path.dirname(shutil.which("vtysh")),
+            "--confdir",
+            str(tmp_path),
+            "--input",
+            running_file,
+            "--test",
+            baseline_file,
+        ],
+        text=True,
+    )
+
+    assert reset_config_delta(baseline, running_text) == expected
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -15,6 +15,8 @@ Tests for the `run_and_expect(_type)()` functions.
 
 import os
 import sys
+import threading
+import time
 import pytest
 
 # Save the Current Working Directory to find lib files.
@@ -22,7 +24,15 @@ CWD = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(CWD, "../../"))
 
 # pylint: disable=C0413
-from lib.topotest import run_and_expect_type
+from lib.topotest import (
+    LogWatcher,
+    Poller,
+    poll_note,
+    poll_sleep_time,
+    poll_wakeup,
+    run_and_expect,
+    run_and_expect_type,
+)
 
 
 def test_run_and_expect_type():
@@ -62,5 +72,97 @@ def test_run_and_expect_type():
     assert value is True
 
 
+def test_run_and_expect_backoff():
+    "Test `run_and_expect` retries quickly at first."
+
+    tries = []
+
+    def converge():
+        "Test function that succeeds on the third try."
+        tries.append(time.time())
+        return len(tries) >= 3
+
+    poll_sleep_time(reset=True)
+    success, value = run_and_expect(converge, True, count=20, wait=3)
+    assert success is True
+    assert len(tries) == 3
+    # 0.05 then 0.1 seconds instead of twice 3 seconds
+    assert tries[-1] - tries[0] < 1
+    assert 0.1 < poll_sleep_time() < 1
+
+
+def test_poller():
+    "Test `Poller` pacing and wake-ups."
+
+    poller = Poller(0.2, timeout=0.5)
+    delays = []
+    while poller.sleep():
+        delays.append(poller.delay)
+    assert delays[:3] == [0.1, 0.2, 0.2]
+
+    poller = Poller(30)
+    poller.sleep()
+    threading.Timer(0.1, poll_wakeup).start()
+    start = time.time()
+    poller.sleep()
+    assert time.time() - start < 5
+
+    # A wake-up between two sleeps ends the next one right away
+    poll_wakeup()
+    start = time.time()
+    poller.sleep()
+    assert time.time() - start < 5
+
+
+def test_poller_router():
+    "Test `Poller` only wakes up for the routers looked at."
+
+    poller = Poller(1)
+    assert poller.call(lambda: poll_note("r1") or 42) == 42
+
+    # Another router is busy
+    threading.Timer(0.05, poll_wakeup, ["r2"]).start()
+    start = time.time()
+    poller.sleep()
+    assert time.time() - start >= 0.05
+    poller.sleep()
+    assert time.time() - start >= 0.15
+
+    threading.Timer(0.05, poll_wakeup, ["r1"]).start()
+    start = time.time()
+    poller.sleep()
+    assert time.time() - start < 0.15
+
+    # Waking up all the pollers still does
+    poll_wakeup()
+    start = time.time()
+    poller.sleep()
+    assert time.time() - start < 0.1
+
+
+def test_log_watcher(tmp_path):
+    "Test `LogWatcher` ignores the lines logged as debugs."
+
+    path = str(tmp_path / "bgpd.log")
+    with open(path, "w") as f:
+        f.write("2024/01/01 00:00:00.000 BGP: [AAAAA-AAAAA] started\n")
+
+    watcher = LogWatcher("r1")
+    watcher.sizes[path] = 0
+    assert watcher._new_lines(path, 0)
+    size = watcher.sizes[path]
+    assert not watcher._new_lines(path, size)
+
+    with open(path, "a") as f:
+        f.write("2024/01/01 00:00:01.000 DEBUG: BGP: [BBBBB-BBBBB] update\n")
+        f.write("2024/01/01 00:00:01.000 BGP: [CCCCC-CCCCC] partial")
+    assert not watcher._new_lines(path, size)
+    size = watcher.sizes[path]
+
+    with open(path, "a") as f:
+        f.write(" line\n")
+    assert watcher._new_lines(path, size)
+
+
 if __name__ == "__main__":
     sys.exit(pytest.main())
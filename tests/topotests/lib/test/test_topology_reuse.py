@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: ISC
+
+#
+# test_topology_reuse.py
+# Tests for library functions: Mininet.park(), Mininet.take_parked().
+#
+
+"""
+Tests for the reuse of topologies across test modules (--reuse-topology).
+"""
+
+import os
+import shutil
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, "../../"))
+
+# pylint: disable=C0413
+from lib.micronet_compat import Mininet
+
+pytestmark = pytest.mark.skipif(
+    os.geteuid() != 0 or not all(shutil.which(x) for x in ("ip", "bridge", "tc")),
+    reason="needs root and iproute2 to create namespaces",
+)
+
+
+@pytest.fixture
+def net(tmp_path):
+    "A router attached to a switch, with a network snapshot"
+    net = Mininet(rundir=str(tmp_path))
+    net.add_host("r1")
+    net.add_switch("s1")
+    net.add_link("r1", "s1", "r1-eth0", "s1-r1")
+    net.snapshot()
+    yield net
+    Mininet.stop_parked()
+    if Mininet.g_mnet_inst is not None:
+        Mininet.g_mnet_inst.stop()
+
+
+def test_park_restores_links(net):
+    "Test the link state a module changed is restored when parking"
+
+    r1 = net.hosts["r1"]
+    mac = net.get_mac("r1", "r1-eth0")
+    r1.cmd_raises("ip link set dev r1-eth0 address 02:00:00:00:00:99")
+    r1.cmd_raises("tc qdisc replace dev r1-eth0 root pfifo limit 10")
+    net.cmd_raises("bridge fdb add 02:00:00:00:00:42 dev s1-r1 master static")
+    assert net.get_mac("r1", "r1-eth0") == mac
+
+    assert net.park("fingerprint")
+
+    assert "02:00:00:00:00:99" not in r1.cmd_raises("ip link show r1-eth0")
+    assert "pfifo" not in r1.cmd_raises("tc qdisc show dev r1-eth0")
+    assert "02:00:00:00:00:42" not in net.cmd_raises("bridge fdb show")
+    assert not net.macs
+
+    assert Mininet.take_parked("other", net.rundir, net.logger) is None
+    assert Mininet.take_parked("fingerprint", net.rundir, net.logger) is net
+    assert net.get_mac("r1", "r1-eth0") == mac
+
+
+def test_park_refused_with_processes(net):
+    "Test a topology with processes left in a namespace is not parked"
+
+    r1 = net.hosts["r1"]
+    p = r1.popen(["sleep", "60"])
+    try:
+        assert r1.get_ns_processes() == [p.pid]
+        assert not net.park("fingerprint")
+    finally:
+        p.kill()
+        p.wait()
+
+    assert r1.get_ns_processes() == []
+    assert net.park("fingerprint")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
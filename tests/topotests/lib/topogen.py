@@ -26,7 +26,9 @@ Basic usage instructions:
 """
 
 import configparser
+import contextlib
 import grp
+import hashlib
 import inspect
 import json
 import logging
@@ -37,7 +39,9 @@ import re
 import shlex
 import subprocess
 import sys
+import time
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 import lib.topolog as topolog
@@ -81,6 +85,26 @@ def is_string(value):
         return isinstance(value, str)
 
 
+def topology_fingerprint(topodef, router_cls, router_params):
+    """
+    Returns a string identifying the topology built from the dictionary
+    `topodef`, see `Topogen.add_topology_from_dict()`, with routers of class
+    `router_cls` added with `router_params`. Topologies with the same
+    fingerprint have the same routers, switches and interfaces, and routers
+    with the same class and private mounts.
+    """
+    keylist = (
+        topodef.keys() if isinstance(topodef, OrderedDict) else sorted(topodef.keys())
+    )
+    items = []
+    for oname in keylist:
+        tup = (topodef[oname],) if is_string(topodef[oname]) else topodef[oname]
+        items.append((oname, tuple(tup)))
+    items.append((router_cls.__module__, router_cls.__qualname__))
+    items.append(sorted(router_params.items()))
+    return hashlib.sha256(repr(items).encode()).hexdigest()
+
+
 def get_exabgp_cmd(commander=None):
     """Return the command to use for ExaBGP version >= 4.2.11"""
 
@@ -156,6 +180,9 @@ class Topogen(object):
         self.cfg_gen = 0
         self.exabgp_cmd = None
         self.topology_stopped = False
+        self.fingerprint = None
+        self.reusing = False
+        self.config_batch_routers = None
         self._init_topo(topodef)
 
         logger.info("loading topology: {}".format(self.modname))
@@ -213,14 +240,30 @@ class Topogen(object):
         # Mininet(Micronet) to build the actual topology.
         assert not inspect.isclass(topodef)
 
-        self.net = Mininet(
-            rundir=self.logdir,
-            pytestconfig=topotest.g_pytest_config,
-            logger=topolog.get_logger("mu", log_level="debug"),
-        )
+        # With --reuse-topology, dictionary topologies are kept after the test
+        # module and handed to the next module building the same topology.
+        if (
+            isinstance(topodef, dict)
+            and topodef
+            and topotest.g_pytest_config.getoption("--reuse-topology", False)
+        ):
+            self.fingerprint = topology_fingerprint(topodef, *self._router_params())
+            self.net = Mininet.take_parked(
+                self.fingerprint,
+                rundir=self.logdir,
+                logger=topolog.get_logger("mu", log_level="debug"),
+            )
+            self.reusing = self.net is not None
 
-        # Adjust the parent namespace
-        topotest.fix_netns_limits(self.net)
+        if not self.reusing:
+            self.net = Mininet(
+                rundir=self.logdir,
+                pytestconfig=topotest.g_pytest_config,
+                logger=topolog.get_logger("mu", log_level="debug"),
+            )
+
+            # Adjust the parent namespace
+            topotest.fix_netns_limits(self.net)
 
         # New direct way: Either a dictionary defines the topology or a build function
         # is supplied, or a json filename all of which build the topology by calling
@@ -242,6 +285,10 @@ class Topogen(object):
                 self.net.configure_hosts()
             elif topodef:
                 self.add_topology_from_dict(topodef)
+                if self.reusing:
+                    self.reusing = False
+                elif self.fingerprint:
+                    self.net.snapshot()
 
     def add_topology_from_dict(self, topodef):
         keylist = (
@@ -272,16 +319,17 @@ class Topogen(object):
         # ----------------
         # Create all links
         # ----------------
-        for oname in keylist:
-            if oname is None:
-                continue
-            tup = (topodef[oname],) if is_string(topodef[oname]) else topodef[oname]
-            for e in tup:
-                desc = e.split(":")
-                name = desc[0]
-                ifname = desc[1] if len(desc) > 1 else None
-                sifname = desc[2] if len(desc) > 2 else None
-                self.add_link(self.gears[oname], self.gears[name], sifname, ifname)
+        with self.net.batch_links():
+            for oname in keylist:
+                if oname is None:
+                    continue
+                tup = (topodef[oname],) if is_string(topodef[oname]) else topodef[oname]
+                for e in tup:
+                    desc = e.split(":")
+                    name = desc[0]
+                    ifname = desc[1] if len(desc) > 1 else None
+                    sifname = desc[2] if len(desc) > 2 else None
+                    self.add_link(self.gears[oname], self.gears[name], sifname, ifname)
 
         self.net.configure_hosts()
 
@@ -303,21 +351,28 @@ class Topogen(object):
         * `routertype`: (optional) `frr`
         Returns a TopoRouter.
         """
-        if cls is None:
-            cls = topotest.Router
         if name is None:
             name = "r{}".format(self.routern)
         if name in self.gears:
             raise KeyError("router already exists")
 
+        cls, params = self._router_params(cls, **params)
+        self.gears[name] = TopoRouter(self, cls, name, **params)
+        self.routern += 1
+        return self.gears[name]
+
+    def _router_params(self, cls=None, **params):
+        "Returns the class and parameters `add_router()` creates a router with."
+        if cls is None:
+            cls = topotest.Router
+
         params["frrdir"] = self.config.get(self.CONFIG_SECTION, "frrdir")
         params["memleak_path"] = self.config.get(self.CONFIG_SECTION, "memleak_path")
         if "routertype" not in params:
             params["routertype"] = self.config.get(self.CONFIG_SECTION, "routertype")
-
-        self.gears[name] = TopoRouter(self, cls, name, **params)
-        self.routern += 1
-        return self.gears[name]
+        if "private_mounts" not in params:
+            params["private_mounts"] = TopoRouter.PRIVATE_DIRS
+        return cls, params
 
     def add_switch(self, name=None):
         """
@@ -396,7 +451,8 @@ class Topogen(object):
 
         node1.register_link(ifname1, node2, ifname2)
         node2.register_link(ifname2, node1, ifname1)
-        self.net.add_link(node1.name, node2.name, ifname1, ifname2)
+        if not self.reusing:
+            self.net.add_link(node1.name, node2.name, ifname1, ifname2)
 
     def get_gears(self, geartype):
         """
@@ -431,6 +487,93 @@ class Topogen(object):
         """
         return self.get_gears(TopoRouter)
 
+    def vtysh_gather(self, commands, isjson=True, routers=None):
+        """
+        Runs vtysh commands on several routers concurrently and returns a
+        dictionary with the output of each router (key is the router name).
+
+        `commands` is either a command string, run on all routers or on the
+        router names listed in `routers`, or a dictionary mapping router
+        names to the command to run on them.
+
+        Usage:
+        ```py
+        tgen = get_topogen()
+        outputs = tgen.vtysh_gather("show bgp vrf all summary json")
+        for router_name, output in outputs.items():
+            # Do stuff
+        ```
+        """
+        if isinstance(commands, dict):
+            router_cmds = commands
+        else:
+            if routers is None:
+                routers = self.routers().keys()
+            router_cmds = {name: commands for name in routers}
+
+        if not router_cmds:
+            return {}
+
+        # vtysh_cmd() blocks on I/O with the router, so threads are enough
+        # to wait on all of them at once.
+        with ThreadPoolExecutor(max_workers=min(len(router_cmds), 32)) as executor:
+            futures = {
+                name: executor.submit(self.gears[name].vtysh_cmd, cmd, isjson=isjson)
+                for name, cmd in router_cmds.items()
+            }
+
+        return {name: future.result() for name, future in futures.items()}
+
+    @contextlib.contextmanager
+    def config_batch(self):
+        """
+        Defers the loading of the configuration written by the common_config
+        create_* functions to the end of the block, where every router it was
+        written for loads it once, all the routers concurrently.
+
+        Usage:
+        ```py
+        with tgen.config_batch():
+            create_prefix_lists(tgen, prefix_lists)
+            create_route_maps(tgen, route_maps)
+            create_router_bgp(tgen, topo, bgp_config)
+        ```
+        """
+        # common_config imports topogen
+        from lib.common_config import (
+            FRRCFG_FILE,
+            InvalidCLIError,
+            load_config_to_routers,
+        )
+
+        if self.config_batch_routers is not None:
+            # Nested, loaded by the outer batch
+            yield
+            return
+
+        self.config_batch_routers = []
+        try:
+            yield
+        except BaseException:
+            # Don't load a half-built configuration, nor leave it to the next load
+            for rname in self.config_batch_routers:
+                open(os.path.join(self.logdir, rname, FRRCFG_FILE), "w").close()
+            raise
+        finally:
+            routers = self.config_batch_routers
+            self.config_batch_routers = None
+
+        if routers:
+            start = time.time()
+            result = load_config_to_routers(self, routers)
+            logger.info(
+                "config batch loaded on %s in %.2fs",
+                ", ".join(routers),
+                time.time() - start,
+            )
+            if not result:
+                raise InvalidCLIError("config batch load error, see the router logs")
+
     def exabgp_peers(self):
         """
         Returns the exabgp peer dictionary (key is the peer name and value is
@@ -450,16 +593,56 @@ class Topogen(object):
         logger.info("starting topology: {}".format(self.modname))
         self.net.start()
 
-    def start_router(self, router=None):
+    def start_router(self, router=None, parallel=None):
         """
         Call the router startRouter method.
         If no router is specified it is called for all registered routers.
+
+        All routers are started concurrently, each one bringing its daemons
+        up in the usual order, unless `parallel` is False.  When `parallel`
+        is None they are started one by one if --serial-router-start is
+        given or a debugger (gdb/rr) is attached to the daemons.
         """
         if router is None:
-            # pylint: disable=r1704
-            # XXX should be hosts?
-            for router in self.routers().values():
+            routers = list(self.routers().values())
+            if parallel is None:
+                parallel = not any(
+                    self.net.cfgopt.get_option(option)
+                    for option in (
+                        "--serial-router-start",
+                        "--gdb-routers",
+                        "--gdb-daemons",
+                        "--rr-routers",
+                        "--rr-daemons",
+                    )
+                )
+
+            def start(router):
+                start_time = time.time()
                 router.start()
+                logger.info(
+                    'router "{}" started in {:.2f} secs'.format(
+                        router.name, time.time() - start_time
+                    )
+                )
+
+            if not parallel or len(routers) < 2:
+                for router in routers:
+                    start(router)
+                return
+
+            # Starting a router mostly waits on its daemons, so threads are
+            # enough to overlap them.  result() re-raises the first failure.
+            start_time = time.time()
+            with ThreadPoolExecutor(max_workers=min(len(routers), 32)) as executor:
+                futures = [executor.submit(start, router) for router in routers]
+            for future in futures:
+                future.result()
+            logger.info(
+                "{} routers started in {:.2f} secs".format(
+                    len(routers), time.time() - start_time
+                )
+            )
         else:
             if isinstance(router, str):
                 router = self.gears[router]
@@ -499,15 +682,18 @@ class Topogen(object):
         # binds.  If we assert before this runs (e.g. on a memory-leak
         # report from gear.stop()), those mutini.py PID-1 processes - and
         # the namespaces / mounts they anchor - are leaked across runs.
-        try:
-            self.net.stop()
-        except OSError as error:
-            # OSError exception is raised when mininet tries to stop switch
-            # though switch is stopped once but mininet tries to stop same
-            # switch again, where it ended up with exception
+        if self.fingerprint and not errors and self.net.park(self.fingerprint):
+            logger.info("keeping topology of {} for reuse".format(self.modname))
+        else:
+            try:
+                self.net.stop()
+            except OSError as error:
+                # OSError exception is raised when mininet tries to stop switch
+                # though switch is stopped once but mininet tries to stop same
+                # switch again, where it ended up with exception
 
-            logger.info(error)
-            logger.info("Exception ignored: switch is already stopped")
+                logger.info(error)
+                logger.info("Exception ignored: switch is already stopped")
 
         # Reap any mutini/nsenter children left as zombies under this process.
         while True:
@@ -679,6 +865,7 @@ class TopoGear(object):
         Runs the provided command string in the router and returns a string
         with the response.
         """
+        topotest.poll_note(self.name)
         return self.net.cmd_legacy(command, **kwargs)
 
     def cmd_raises(self, command, **kwargs):
@@ -686,6 +873,7 @@ class TopoGear(object):
         Runs the provided command string in the router and returns a string
         with the response. Raise an exception on any error.
         """
+        topotest.poll_note(self.name)
         return self.net.cmd_raises(command, **kwargs)
 
     run = cmd
@@ -859,8 +1047,11 @@ class TopoRouter(TopoGear):
         self.daemondir = params.get("frrdir")
         self.logger = topolog.get_logger(name, log_level="debug", target=logfile)
         params["logger"] = self.logger
-        tgen.net.add_host(self.name, cls=cls, **params)
-        topotest.fix_netns_limits(tgen.net[name])
+        if tgen.reusing:
+            tgen.net[name].reuse(**params)
+        else:
+            tgen.net.add_host(self.name, cls=cls, **params)
+            topotest.fix_netns_limits(tgen.net[name])
 
         # Mount gear log directory on a common path
         self.net.bind_mount(self.gearlogdir, "/tmp/gearlogdir")
@@ -1109,6 +1300,67 @@ class TopoRouter(TopoGear):
         self.logger.debug("Killing daemons using SIGKILL..")
         return self.net.killRouterDaemons(daemons, wait, assertOnError)
 
+    def _vtysh_session_cmd(self, command, daemon=None):
+        """
+        Run a show command through the persistent vtysh session of the
+        router.  Returns None when the session can't be used, in which case
+        the caller runs a new vtysh.
+        """
+        if command.split(" ", 1)[0] != "show":
+            return None
+
+        session = self.net.vtysh_session(daemon)
+        if session is None or not session.typeable(command):
+            return None
+
+        try:
+            output = session.run(command)
+        except topotest.VtyshSessionError as error:
+            self.logger.warning("vtysh session failed, retrying: %s", error)
+            return None
+
+        # vtysh reconnects by itself to a daemon which was restarted behind
+        # its back, but the command hitting the stale connection is lost.
+        if "Warning: closing connection to" in output:
+            return None
+
+        return output
+
+    def _vtysh_session_multicmd(self, commands, daemon=None):
+        """
+        Run commands through the persistent vtysh session of the router, the
+        way "vtysh < file" would.  Returns None when the session can't be
+        used.
+        """
+        session = self.net.vtysh_session(daemon)
+        if session is None:
+            return None
+
+        if not is_string(commands):
+            commands = "\n".join(commands)
+
+        lines = [line for line in commands.split("\n") if line.strip()]
+        if not all(session.typeable(line) for line in lines):
+            return None
+
+        output = ""
+        for line in lines:
+            try:
+                output += session.run(line, echo=True)
+            except topotest.VtyshSessionError as error:
+                # Like "vtysh < file", leaving vtysh ends the input
+                if line.split()[0] not in ("exit", "quit", "logout"):
+                    self.logger.warning("vtysh session failed: %s", error)
+                return output
+
+        # Go back to the enable node, as a new vtysh would start there
+        try:
+            session.run("end")
+        except topotest.VtyshSessionError:
+            pass
+
+        return output
+
     def vtysh_cmd(self, command, isjson=False, daemon=None, raises=False):
         """
         Runs the provided command string in the vty shell and returns a string
@@ -1121,6 +1373,8 @@ class TopoRouter(TopoGear):
         if command.find("\n") != -1:
             return self.vtysh_multicmd(command, daemon=daemon, raises=raises)
 
+        topotest.poll_note(self.name)
+
         dparam = ""
         if daemon is not None:
             dparam += "-d {}".format(daemon)
@@ -1130,10 +1384,12 @@ class TopoRouter(TopoGear):
         )
 
         self.logger.debug("vtysh command => {}".format(shlex.quote(command)))
-        if raises:
-            output = self.cmd_raises(vtysh_command)
-        else:
-            output = self.run(vtysh_command)
+        output = None if raises else self._vtysh_session_cmd(command, daemon)
+        if output is None:
+            if raises:
+                output = self.cmd_raises(vtysh_command)
+            else:
+                output = self.run(vtysh_command)
 
         dbgout = output.strip()
         if dbgout:
@@ -1165,30 +1421,41 @@ class TopoRouter(TopoGear):
         pretty_output: defines how the return value will be presented. When
         True it will show the command as they were executed in the vty shell,
         otherwise it will only show lines that failed.
+
+        Unless `raises` is set, commands with pretty output go through the
+        persistent vtysh session of the router.
         """
-        # Prepare the temporary file that will hold the commands
-        fname = topotest.get_file(commands)
+        topotest.poll_note(self.name)
+        dbgcmds = commands if is_string(commands) else "\n".join(commands)
+        dbgcmds = "\t" + dbgcmds.replace("\n", "\n\t")
 
-        dparam = ""
-        if daemon is not None:
-            dparam += "-d {}".format(daemon)
+        res = None
+        if pretty_output and not raises:
+            self.logger.debug("vtysh command => SESSION:\n{}".format(dbgcmds))
+            res = self._vtysh_session_multicmd(commands, daemon)
 
-        # Run the commands and delete the temporary file
-        if pretty_output:
-            vtysh_command = "vtysh {} < {}".format(dparam, fname)
-        else:
-            vtysh_command = "vtysh {} -f {}".format(dparam, fname)
+        if res is None:
+            # Prepare the temporary file that will hold the commands
+            fname = topotest.get_file(commands)
 
-        dbgcmds = commands if is_string(commands) else "\n".join(commands)
-        dbgcmds = "\t" + dbgcmds.replace("\n", "\n\t")
-        self.logger.debug("vtysh command => FILE:\n{}".format(dbgcmds))
+            dparam = ""
+            if daemon is not None:
+                dparam += "-d {}".format(daemon)
 
-        if raises:
-            res = self.cmd_raises(vtysh_command)
-        else:
-            res = self.run(vtysh_command)
+            # Run the commands and delete the temporary file
+            if pretty_output:
+                vtysh_command = "vtysh {} < {}".format(dparam, fname)
+            else:
+                vtysh_command = "vtysh {} -f {}".format(dparam, fname)
+
+            self.logger.debug("vtysh command => FILE:\n{}".format(dbgcmds))
 
-        os.unlink(fname)
+            if raises:
+                res = self.cmd_raises(vtysh_command)
+            else:
+                res = self.run(vtysh_command)
+
+            os.unlink(fname)
 
         dbgres = res.strip()
         if dbgres:
@@ -1321,7 +1588,10 @@ class TopoSwitch(TopoGear):
     def __init__(self, tgen, name, **params):
         logger = topolog.get_logger(name, log_level="debug")
         super(TopoSwitch, self).__init__(tgen, name, **params)
-        tgen.net.add_switch(name, logger=logger)
+        if tgen.reusing:
+            tgen.net[name].logger = logger
+        else:
+            tgen.net.add_switch(name, logger=logger)
 
     def __str__(self):
         gear = super(TopoSwitch, self).__str__()
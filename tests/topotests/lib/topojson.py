@@ -44,6 +44,12 @@ def build_topo_from_json(tgen, topo=None):
     * `tgen`: Topogen object
     * `topo`: json file data, or use tgen.json_topo if None
     """
+    # Nothing here uses the links, create them all at once at the end
+    with tgen.net.batch_links():
+        _build_topo_from_json(tgen, topo)
+
+
+def _build_topo_from_json(tgen, topo):
     if topo is None:
         topo = tgen.json_topo
 
@@ -10,10 +10,14 @@
 #
 
 import configparser
+import copy
 import difflib
 import errno
 import functools
 import glob
+import importlib.util
+import ipaddress
+import itertools
 import json
 import os
 import platform
@@ -23,10 +27,10 @@ import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import logging
 from collections.abc import Mapping
-from copy import deepcopy
 from pathlib import Path
 
 import lib.topolog as topolog
@@ -185,16 +189,29 @@ class json_cmp_result(object):
     "json_cmp result class for better assertion messages"
 
     def __init__(self):
-        self.errors = []
+        self._errors = []
+        self._deferred = []
+
+    @property
+    def errors(self):
+        "List of error message lines"
+        deferred, self._deferred = self._deferred, []
+        for func in deferred:
+            self.add_error(func())
+        return self._errors
 
     def add_error(self, error):
         "Append error message to the result"
         for line in error.splitlines():
             self.errors.append(line)
 
+    def add_deferred_error(self, func):
+        "Append the error message returned by `func`, once it is needed"
+        self._deferred.append(func)
+
     def has_errors(self):
         "Returns True if there were errors, otherwise False."
-        return len(self.errors) > 0
+        return len(self._deferred) > 0 or len(self._errors) > 0
 
     def gen_report(self):
         headline = ["Generated JSON diff error report:", ""]
@@ -206,9 +223,112 @@ class json_cmp_result(object):
         )
 
 
+# Index key of the elements of an array themselves, rather than of one of
+# their members.
+JSON_ELEMENT = object()
+
+
+def json_array_candidates(output, expected, indexes):
+    """
+    Returns the indexes, in order, of the elements of the `output` array which
+    may match the `expected` element: only those having the same values for
+    the scalar members of `expected` can.
+
+    The elements of `output` are indexed by the value of a member the first
+    time an expected element looks for it, the indexes are kept in `indexes`
+    for the next elements of the same array.
+    """
+    if isinstance(expected, dict):
+        keys = [
+            k
+            for k, v in expected.items()
+            if not isinstance(v, (list, dict)) and v is not None and v != "*"
+        ]
+    elif isinstance(expected, list) or expected == "*":
+        keys = []
+    else:
+        keys = [JSON_ELEMENT]
+
+    candidates = None
+    for key in keys:
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = {}
+            for idx, v1 in enumerate(output):
+                if key is JSON_ELEMENT:
+                    value = v1
+                elif isinstance(v1, dict) and key in v1:
+                    value = v1[key]
+                else:
+                    continue
+                if not isinstance(value, (list, dict)):
+                    index.setdefault(value, []).append(idx)
+
+        value = expected if key is JSON_ELEMENT else expected[key]
+        bucket = index.get(value, [])
+        if candidates is None or len(bucket) < len(candidates):
+            candidates = bucket
+
+    if candidates is None:
+        return range(len(output))
+    return candidates
+
+
+def json_match(output, expected, exact=False):
+    """
+    Returns True when `output` matches `expected` the way json_cmp() compares
+    them.  Stops at the first mismatch without building any report.
+    """
+    if expected == "*":
+        return True
+
+    if not isinstance(output, (list, dict)) and not isinstance(expected, (list, dict)):
+        return output == expected
+
+    if isinstance(output, list) and isinstance(expected, list):
+        if exact or (len(expected) > 0 and expected[0] == "__ordered__"):
+            if not exact:
+                expected = expected[1:]
+            return len(output) == len(expected) and all(
+                json_match(v1, v2, exact) for v1, v2 in zip(output, expected)
+            )
+
+        if len(output) < len(expected):
+            return False
+
+        indexes = {}
+        used = set()
+        for v2 in expected:
+            for idx1 in json_array_candidates(output, v2, indexes):
+                if idx1 not in used and json_match(output[idx1], v2):
+                    used.add(idx1)
+                    break
+            else:
+                return False
+        return True
+
+    if isinstance(output, dict) and isinstance(expected, dict):
+        if exact:
+            return output.keys() == expected.keys() and all(
+                json_match(output[k], v, exact) for k, v in expected.items()
+            )
+
+        for k, v in expected.items():
+            if v is None:
+                if k in output:
+                    return False
+            elif k not in output or not json_match(output[k], v):
+                return False
+        return True
+
+    return False
+
+
 def gen_json_diff_report(output, expected, exact=False, path="> $", acc=(0, "")):
     """
     Internal workhorse which compares two JSON data structures and generates an error report suited to be read by a human eye.
+
+    Neither `output` nor `expected` are modified.
     """
 
     def dump_json(v):
@@ -277,7 +397,7 @@ def gen_json_diff_report(output, expected, exact=False, path="> $", acc=(0, ""))
         and ((len(expected) > 0 and expected[0] == "__ordered__") or exact)
     ):
         if not exact:
-            del expected[0]
+            expected = expected[1:]
         if len(output) != len(expected):
             acc = add_error(
                 acc,
@@ -299,24 +419,40 @@ def gen_json_diff_report(output, expected, exact=False, path="> $", acc=(0, ""))
                 ),
             )
         else:
+            # Each output element matches at most one expected element, the
+            # first one that is still free in output order is used.
+            indexes = {}
+            used = set()
             for idx2, v2 in zip(range(0, len(expected)), expected):
                 found_match = False
-                closest_diff = None
-                closest_idx = None
-                for idx1, v1 in zip(range(0, len(output)), output):
-                    tmp_v1 = deepcopy(v1)
-                    tmp_v2 = deepcopy(v2)
-                    tmp_diff = gen_json_diff_report(tmp_v1, tmp_v2, path=add_idx(idx1))
+                candidates = json_array_candidates(output, v2, indexes)
+                for idx1 in candidates:
+                    if idx1 in used:
+                        continue
+                    tmp_diff = gen_json_diff_report(
+                        output[idx1], v2, path=add_idx(idx1)
+                    )
                     if not has_errors(tmp_diff):
                         found_match = True
-                        del output[idx1]
+                        used.add(idx1)
                         break
-                    elif not closest_diff or get_errors_n(tmp_diff) < get_errors_n(
-                        closest_diff
-                    ):
-                        closest_diff = tmp_diff
-                        closest_idx = idx1
                 if not found_match and isinstance(v2, (list, dict)):
+                    # Score the free elements sharing the values expected, or
+                    # all free elements when none does, to report the closest.
+                    free = [idx1 for idx1 in candidates if idx1 not in used]
+                    if not free:
+                        free = [idx1 for idx1 in range(len(output)) if idx1 not in used]
+                    closest_diff = None
+                    closest_idx = None
+                    for idx1 in free:
+                        tmp_diff = gen_json_diff_report(
+                            output[idx1], v2, path=add_idx(idx1)
+                        )
+                        if not closest_diff or get_errors_n(tmp_diff) < get_errors_n(
+                            closest_diff
+                        ):
+                            closest_diff = tmp_diff
+                            closest_idx = idx1
                     sub_error = "\n\n\t{}".format(
                         "\t".join(get_errors(closest_diff).splitlines(True))
                     )
@@ -406,19 +542,159 @@ def json_cmp(output, expected, exact=False):
       without checking the values
     * using '__ordered__' as first element in a JSON Array in expected will also check the
       order when it is compared to an Array in output
+
+    Polling loops mostly care whether the data matches, so the error report is only
+    generated when the result is first printed or its errors looked at.  It is
+    generated from copies of `output` and `expected`, the caller may change them
+    in the meantime.
     """
 
-    (errors_n, errors) = gen_json_diff_report(
-        deepcopy(output), deepcopy(expected), exact=exact
+    if json_match(output, expected, exact):
+        return None
+
+    output = copy.deepcopy(output)
+    expected = copy.deepcopy(expected)
+    result = json_cmp_result()
+    result.add_deferred_error(
+        lambda: gen_json_diff_report(output, expected, exact=exact)[1]
     )
+    return result
 
-    if errors_n > 0:
-        result = json_cmp_result()
-        result.add_error(errors)
-        return result
-    else:
+
+# Route types accepted after the prefix by "show ip/ipv6 route".
+PARTIAL_JSON_ROUTE_TYPES = (
+    "babel|bgp|connected|eigrp|isis|kernel|local|nhrp|openfabric|ospf|ospf6"
+    "|rip|ripng|sharp|static|table|vnc"
+)
+
+# Commands whose JSON output can be fetched one key at a time.
+PARTIAL_JSON_ROUTE_RE = re.compile(
+    r"^show (?P<afi>ip|ipv6) route(?P<vrf> vrf \S+)?"
+    r"(?P<type> (?:{}))? json$".format(PARTIAL_JSON_ROUTE_TYPES)
+)
+PARTIAL_JSON_BGP_RE = re.compile(
+    r"^show (?:ip )?bgp(?P<vrf> (?:vrf|view) \S+)?"
+    r"(?: (?P<afi>ipv4|ipv6)(?: (?:unicast|multicast|labeled-unicast))?)? json$"
+)
+PARTIAL_JSON_NEIGHBOR_RE = re.compile(
+    r"^show (?:ip )?bgp(?: (?:vrf|view) \S+)? neighbors? json$"
+)
+
+# Top level keys of "show bgp json" that are the same for every prefix.
+PARTIAL_JSON_BGP_HEADER = ("vrfId", "vrfName", "routerId", "defaultLocPrf", "localAS")
+
+# Above this many commands the full output is fetched instead.
+PARTIAL_JSON_MAX_CMDS = 32
+
+
+def _partial_json_prefixes(keys, version):
+    "Returns `keys` if they all are canonical prefixes of IP `version`."
+    for key in keys:
+        try:
+            prefix = ipaddress.ip_network(key)
+        except ValueError:
+            return None
+        if prefix.version != version or str(prefix) != key:
+            return None
+    return list(keys)
+
+
+def partial_json_cmds(cmd, expected):
+    """
+    Returns the commands that fetch only the parts of the `cmd` JSON output
+    that `expected` looks at, and the key whose contents are spread across
+    their outputs (None when it is the top level object).
+
+    Returns None when `cmd` is not known or `expected` can't be split, in
+    which case `cmd` itself has to be used. Known commands are:
+
+    * "show ip/ipv6 route [vrf NAME] [TYPE] json" with prefixes as keys
+    * "show [ip] bgp [vrf NAME] [AFI [SAFI]] json" with prefixes under "routes"
+    * "show [ip] bgp [vrf NAME] neighbors json" with addresses as keys
+
+    Prefixes are fetched with "longer-prefixes", which keeps the JSON layout of
+    the full table.
+    """
+    if not isinstance(expected, dict) or not expected:
         return None
 
+    match = PARTIAL_JSON_ROUTE_RE.match(cmd)
+    if match:
+        version = 4 if match.group("afi") == "ip" else 6
+        prefixes = _partial_json_prefixes(expected.keys(), version)
+        if prefixes is None:
+            return None
+        cmds = [
+            "show {} route{} {} longer-prefixes{} json".format(
+                match.group("afi"),
+                match.group("vrf") or "",
+                prefix,
+                match.group("type") or "",
+            )
+            for prefix in prefixes
+        ]
+        return cmds, None
+
+    match = PARTIAL_JSON_BGP_RE.match(cmd)
+    if match:
+        routes = expected.get("routes")
+        if not isinstance(routes, dict) or not routes:
+            return None
+        if any(k != "routes" and k not in PARTIAL_JSON_BGP_HEADER for k in expected):
+            return None
+        version = 6 if match.group("afi") == "ipv6" else 4
+        prefixes = _partial_json_prefixes(routes.keys(), version)
+        if prefixes is None:
+            return None
+        cmds = [
+            "{} {} longer-prefixes json".format(cmd[: -len(" json")], prefix)
+            for prefix in prefixes
+        ]
+        return cmds, "routes"
+
+    match = PARTIAL_JSON_NEIGHBOR_RE.match(cmd)
+    if match:
+        for key in expected:
+            try:
+                ipaddress.ip_address(key)
+            except ValueError:
+                return None
+        cmds = [
+            "{} {} json".format(cmd[: -len(" json")], neighbor) for neighbor in expected
+        ]
+        return cmds, None
+
+    return None
+
+
+def router_json_get(router, cmd, expected=None, exact=False):
+    """
+    Runs `cmd` that returns JSON data and returns the decoded output.
+
+    When `expected` is given, only the parts of the output it looks at are
+    fetched if `cmd` allows it (see partial_json_cmds()), so large tables
+    are not dumped to verify a few of their entries. The slices are merged
+    back into the layout of the full output. Nothing is split when `exact`
+    is set, since it also checks for the keys `expected` doesn't have.
+    """
+    split = None
+    if expected is not None and not exact:
+        split = partial_json_cmds(cmd, expected)
+    if split is None or len(split[0]) > PARTIAL_JSON_MAX_CMDS:
+        return router.vtysh_cmd(cmd, isjson=True)
+
+    cmds, key = split
+    output = {}
+    for slice_cmd in cmds:
+        for k, v in router.vtysh_cmd(slice_cmd, isjson=True).items():
+            if k == key and isinstance(v, dict):
+                output.setdefault(k, {}).update(v)
+            elif k == key or key is None:
+                output[k] = v
+            else:
+                output.setdefault(k, v)
+    return output
+
 
 def router_output_cmp(router, cmd, expected):
     """
@@ -432,19 +708,200 @@ def router_output_cmp(router, cmd, expected):
     )
 
 
-def router_json_cmp(router, cmd, data, exact=False):
+def router_json_cmp(router, cmd, data, exact=False, partial=False):
     """
     Runs `cmd` that returns JSON data (normally the command ends with 'json')
     and compare with `data` contents.
+
+    With `partial`, only the parts of the output `data` looks at are fetched
+    when `cmd` allows it (see router_json_get()).
     """
+    if partial:
+        return json_cmp(router_json_get(router, cmd, data, exact), data, exact)
     return json_cmp(router.vtysh_cmd(cmd, isjson=True), data, exact)
 
 
+# Pollers re-check after this many seconds first, then back off from there.
+POLL_INITIAL_WAIT = 0.05
+
+_poll_cond = threading.Condition()
+_poll_generation = 0
+# Router name -> generation of its last wakeup
+_poll_generations = {}
+_poll_sleep_time = 0.0
+# Routers looked at by the polling loop of the thread, see poll_note()
+_poll_local = threading.local()
+
+
+def poll_wakeup(name=None):
+    """
+    Makes the sleeping pollers looking at router `name`, or all of them when
+    None, re-check right away, see LogWatcher.
+    """
+    global _poll_generation
+    with _poll_cond:
+        _poll_generation += 1
+        _poll_generations[name] = _poll_generation
+        _poll_cond.notify_all()
+
+
+def poll_note(name):
+    """
+    Records that the polling loop of the current thread, if any, looks at
+    router `name`, so that poll_wakeup(name) ends its sleeps.
+    """
+    names = getattr(_poll_local, "names", None)
+    if names is not None:
+        names.add(name)
+
+
+def poll_sleep_time(reset=False):
+    """
+    Returns the seconds pollers spent sleeping since the last reset.
+    """
+    global _poll_sleep_time
+    with _poll_cond:
+        total = _poll_sleep_time
+        if reset:
+            _poll_sleep_time = 0.0
+    return total
+
+
+class Poller(object):
+    """
+    Paces the tries of a polling loop.
+
+    The first sleep lasts POLL_INITIAL_WAIT seconds and each following one
+    doubles, up to `wait`.  With a `timeout`, sleep() returns False instead of
+    sleeping past it.  A call to poll_wakeup() since the previous sleep, e.g.
+    from a log watcher, ends the current sleep early.  When the polled function
+    is run through call(), only the wakeups of the routers it looked at count.
+    """
+
+    def __init__(self, wait, timeout=None):
+        self.wait = wait
+        self.delay = min(POLL_INITIAL_WAIT, wait)
+        self.deadline = None if timeout is None else time.time() + timeout
+        self.generation = _poll_generation
+        self.names = set()
+
+    def call(self, func, *args, **kwargs):
+        "Returns func(*args, **kwargs), noting the routers it looks at"
+        saved = getattr(_poll_local, "names", None)
+        _poll_local.names = self.names
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _poll_local.names = saved
+
+    def _woken(self):
+        if _poll_generation == self.generation:
+            return False
+        if not self.names:
+            return True
+        return any(
+            _poll_generations.get(name, 0) > self.generation
+            for name in itertools.chain([None], self.names)
+        )
+
+    def sleep(self):
+        global _poll_sleep_time
+        delay = self.delay
+        if self.deadline is not None:
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+                return False
+            delay = min(delay, remaining)
+
+        start = time.time()
+        with _poll_cond:
+            _poll_cond.wait_for(self._woken, delay)
+            self.generation = _poll_generation
+            _poll_sleep_time += time.time() - start
+
+        self.delay = min(self.delay * 2, self.wait)
+        return True
+
+
+class LogWatcher(object):
+    """
+    Calls poll_wakeup(name) when one of the watched log files of router `name`
+    gets new lines, so a state change logged by a daemon is checked without
+    waiting out the poll delay.
+
+    The files are checked from a thread every POLL_INITIAL_WAIT seconds, so
+    noisy logs can't wake the pollers any more often than that.  Lines logged
+    at the debug level are ignored, but daemons only mark them as such with
+    "log record-severity" or "log record-priority": without it, a router
+    logging debugs keeps its pollers at the shortest delay.
+    """
+
+    # What daemons put after the timestamp of debug lines, see zlog_targets.c
+    DEBUG_MARKERS = (" DEBUG: ", " debugging: ")
+
+    def __init__(self, name=None):
+        self.name = name
+        self.sizes = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, path):
+        with self.lock:
+            self.sizes.setdefault(path, 0)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _new_lines(self, path, size):
+        """
+        Returns whether `path` got lines other than debugs since `size`,
+        updating its size.
+        """
+        try:
+            with open(path, "rb") as f:
+                newsize = os.fstat(f.fileno()).st_size
+                if newsize == size:
+                    return False
+                if newsize < size:
+                    # Rotated or truncated
+                    size = 0
+                f.seek(size)
+                data = f.read(newsize - size)
+        except OSError:
+            return False
+
+        # Only complete lines, the rest is read again next time
+        end = data.rfind(b"\n") + 1
+        self.sizes[path] = size + end
+        for line in data[:end].decode("utf-8", "replace").splitlines():
+            if not any(marker in line for marker in self.DEBUG_MARKERS):
+                return True
+        return False
+
+    def _run(self):
+        while not self.stopped.wait(POLL_INITIAL_WAIT):
+            grown = False
+            with self.lock:
+                for path, size in self.sizes.items():
+                    if self._new_lines(path, size):
+                        grown = True
+            if grown:
+                poll_wakeup(self.name)
+
+
 def run_and_expect(func, what, count=20, wait=3):
     """
-    Run `func` and compare the result with `what`. Do it for `count` times
-    waiting `wait` seconds between tries. By default it tries 20 times with
-    3 seconds delay between tries.
+    Run `func` and compare the result with `what`. Keep trying for `count`
+    times `wait` seconds, waiting at most `wait` seconds between tries (see
+    Poller). By default it tries for 60 seconds with at most 3 seconds delay
+    between tries.
 
     Changing default count/wait values, please change them below also for
     `minimum_wait`, and `minimum_count`.
@@ -481,17 +938,18 @@ def run_and_expect(func, what, count=20, wait=3):
         wait = minimum_wait
 
     logger.debug(
-        "'{}' polling started (interval {} secs, maximum {} tries)".format(
-            func_name, wait, count
+        "'{}' polling started (interval up to {} secs, maximum wait {} secs)".format(
+            func_name, wait, int(wait * count)
         )
     )
 
-    while count > 0:
-        result = func()
+    poller = Poller(wait, wait * count)
+    while True:
+        result = poller.call(func)
         if result != what:
-            time.sleep(wait)
-            count -= 1
-            continue
+            if poller.sleep():
+                continue
+            break
 
         end_time = time.time()
         logger.debug(
@@ -515,7 +973,7 @@ def run_and_expect_type(func, etype, count=20, wait=3, avalue=None):
     3 seconds delay between tries.
 
     This function is used when you want to test the return type and,
-    optionally, the return value.
+    optionally, the return value. Tries are paced like in run_and_expect().
 
     Returns (True, func-return) on success or
     (False, func-return) on failure.
@@ -538,26 +996,27 @@ def run_and_expect_type(func, etype, count=20, wait=3, avalue=None):
         )
 
     logger.debug(
-        "'{}' polling started (interval {} secs, maximum wait {} secs)".format(
+        "'{}' polling started (interval up to {} secs, maximum wait {} secs)".format(
             func_name, wait, int(wait * count)
         )
     )
 
-    while count > 0:
-        result = func()
+    poller = Poller(wait, wait * count)
+    while True:
+        result = poller.call(func)
         if not isinstance(result, etype):
             logger.debug(
                 "Expected result type '{}' got '{}' instead".format(etype, type(result))
             )
-            time.sleep(wait)
-            count -= 1
-            continue
+            if poller.sleep():
+                continue
+            break
 
         if etype != type(None) and avalue != None and result != avalue:
             logger.debug("Expected value '{}' got '{}' instead".format(avalue, result))
-            time.sleep(wait)
-            count -= 1
-            continue
+            if poller.sleep():
+                continue
+            break
 
         end_time = time.time()
         logger.debug(
@@ -929,6 +1388,32 @@ def proto_name_to_number(protocol):
     )  # default return same as input
 
 
+def _normalize_address(address):
+    "Returns the interface address `address` (e.g. '2001:DB8::1/64') in one form."
+    try:
+        return str(ipaddress.ip_interface(address))
+    except ValueError:
+        return address
+
+
+def ip_show(node, cmd):
+    """
+    Runs the kernel state query `cmd` (e.g. 'ip route') on `node`. The output is
+    kept in the netlink cache of the node namespace, when there is one, and is
+    only queried again after the kernel reports a link, address, route or rule
+    change, which also wakes up the sleeping `Poller`s looking at the node.
+    """
+    poll_note(node.name)
+    commander = getattr(node, "net", node)
+    cache = None
+    if hasattr(commander, "get_netlink_cache"):
+        cache = commander.get_netlink_cache()
+    if cache is None:
+        return node.cmd(cmd)
+    cache.add_callback(functools.partial(poll_wakeup, node.name), key=poll_wakeup)
+    return cache.get(cmd, lambda: node.cmd(cmd))
+
+
 def ip4_route(node):
     """
     Gets a structured return of the command 'ip route'. It can be used in
@@ -947,7 +1432,7 @@ def ip4_route(node):
         }
     }
     """
-    output = normalize_text(node.run("ip route")).splitlines()
+    output = normalize_text(ip_show(node, "ip route")).splitlines()
     result = {}
     for line in output:
         columns = line.split(" ")
@@ -989,7 +1474,7 @@ def ip4_vrf_route(node):
     }
     """
     output = normalize_text(
-        node.run("ip route show vrf {0}-cust1".format(node.name))
+        ip_show(node, "ip route show vrf {0}-cust1".format(node.name))
     ).splitlines()
 
     result = {}
@@ -1031,7 +1516,7 @@ def ip6_route(node):
         }
     }
     """
-    output = normalize_text(node.run("ip -6 route")).splitlines()
+    output = normalize_text(ip_show(node, "ip -6 route")).splitlines()
     result = {}
     for line in output:
         columns = line.split(" ")
@@ -1072,7 +1557,7 @@ def ip6_vrf_route(node):
     }
     """
     output = normalize_text(
-        node.run("ip -6 route show vrf {0}-cust1".format(node.name))
+        ip_show(node, "ip -6 route show vrf {0}-cust1".format(node.name))
     ).splitlines()
     result = {}
     for line in output:
@@ -1120,7 +1605,7 @@ def ip_rules(node):
         }
     ]
     """
-    output = normalize_text(node.run("ip rule")).splitlines()
+    output = normalize_text(ip_show(node, "ip rule")).splitlines()
     result = []
     for line in output:
         columns = line.split(" ")
@@ -1258,12 +1743,59 @@ def checkAddressSanitizerError(output, router, component, logdir=""):
     return False
 
 
+def _sysctl_path(commander, variable):
+    """
+    Returns the /proc/sys file of the network `variable`, which can be read or
+    written from the namespace executor of `commander`, or None.
+    """
+    if not variable.startswith("net") or not hasattr(commander, "get_ns_executor"):
+        return None
+    if "/" not in variable:
+        variable = variable.replace(".", "/")
+    return "/proc/sys/" + variable
+
+
+def _read_file(path):
+    with open(path, encoding="ascii") as file:
+        return file.read()
+
+
+def _write_file(path, value):
+    with open(path, "w", encoding="ascii") as file:
+        file.write(value)
+
+
+def _sysctl_get(commander, variable):
+    # Network variables are per namespace: read them from a thread in the
+    # namespace rather than running sysctl in it.
+    path = _sysctl_path(commander, variable)
+    executor = commander.get_ns_executor() if path else None
+    if executor is not None:
+        try:
+            return executor.run(_read_file, path).strip()
+        except Exception:
+            pass
+    return commander.cmd_raises("sysctl -n " + variable).strip()
+
+
+def _sysctl_set(commander, variable, valstr):
+    path = _sysctl_path(commander, variable)
+    executor = commander.get_ns_executor() if path else None
+    if executor is not None:
+        try:
+            executor.run(_write_file, path, valstr)
+            return
+        except Exception:
+            pass
+    commander.cmd_raises('sysctl -w {}="{}"'.format(variable, valstr))
+
+
 def _sysctl_atleast(commander, variable, min_value):
     if isinstance(min_value, tuple):
         min_value = list(min_value)
     is_list = isinstance(min_value, list)
 
-    sval = commander.cmd_raises("sysctl -n " + variable).strip()
+    sval = _sysctl_get(commander, variable)
     if is_list:
         cur_val = [int(x) for x in sval.split()]
     else:
@@ -1285,7 +1817,7 @@ def _sysctl_atleast(commander, variable, min_value):
         else:
             valstr = str(min_value)
         logger.debug("Increasing sysctl %s from %s to %s", variable, cur_val, valstr)
-        commander.cmd_raises('sysctl -w {}="{}"'.format(variable, valstr))
+        _sysctl_set(commander, variable, valstr)
 
 
 def _sysctl_assure(commander, variable, value):
@@ -1293,7 +1825,7 @@ def _sysctl_assure(commander, variable, value):
         value = list(value)
     is_list = isinstance(value, list)
 
-    sval = commander.cmd_raises("sysctl -n " + variable).strip()
+    sval = _sysctl_get(commander, variable)
     if is_list:
         cur_val = [int(x) for x in sval.split()]
     else:
@@ -1316,7 +1848,7 @@ def _sysctl_assure(commander, variable, value):
         else:
             valstr = str(value)
         logger.debug("Changing sysctl %s from %s to %s", variable, cur_val, valstr)
-        commander.cmd_raises('sysctl -w {}="{}"'.format(variable, valstr))
+        _sysctl_set(commander, variable, valstr)
 
 
 def sysctl_atleast(commander, variable, min_value, raises=False):
@@ -1474,6 +2006,108 @@ def setup_node_tmpdir(logdir, name):
     return logfile
 
 
+FRR_RELOAD_PATH = "/usr/lib/frr/frr-reload.py"
+
+# frr-reload.py as a module, False if it cannot be loaded
+_frr_reload = None
+
+
+def load_frr_reload():
+    """
+    Returns frr-reload.py loaded as a module, or None if it cannot be loaded or
+    is too old to compare configurations without running vtysh.
+    """
+    global _frr_reload
+
+    if _frr_reload is None:
+        _frr_reload = False
+        try:
+            spec = importlib.util.spec_from_file_location("frr_reload", FRR_RELOAD_PATH)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception as error:
+            logger.debug("Cannot load %s: %s", FRR_RELOAD_PATH, error)
+        else:
+            if hasattr(module, "mark_config"):
+                _frr_reload = module
+    return _frr_reload or None
+
+
+class VtyshSessionError(Exception):
+    "The persistent vtysh session of a router failed"
+
+
+class VtyshSession(object):
+    """
+    A long-lived interactive vtysh running inside a router.
+
+    Starting `vtysh -c` for every show command costs a shell, nsenter and a
+    vtysh which then connects to every daemon.  The session keeps one vtysh
+    running on a pseudo-terminal instead, so a command only costs a round
+    trip to the daemons.
+
+    The pseudo-terminal is handled by the VtyshSession of frr-reload.py, this
+    starts it in the router and serializes the commands with a lock so the
+    session can be shared by threads.
+    """
+
+    def __init__(self, router, daemon=None, timeout=120):
+        self.router = router
+        self.daemon = daemon
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.frr_reload = None
+        self.session = None
+
+    def start(self):
+        frr_reload = load_frr_reload()
+        if frr_reload is None or not hasattr(frr_reload.VtyshSession, "typeable"):
+            raise VtyshSessionError("{} not available".format(FRR_RELOAD_PATH))
+
+        session = frr_reload.VtyshSession(
+            frr_reload.Vtysh(daemon=self.daemon), self.timeout, self.router.popen
+        )
+        try:
+            session.start()
+        except frr_reload.VtyshException as error:
+            raise VtyshSessionError("failed to start vtysh: {}".format(error))
+
+        self.frr_reload = frr_reload
+        self.session = session
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    @property
+    def running(self):
+        return self.session is not None and self.session.running
+
+    def typeable(self, command):
+        """
+        Returns False if the session cannot run `command` as typed (see
+        VtyshSession.typeable() in frr-reload.py).
+        """
+        return self.session is not None and self.session.typeable(command)
+
+    def run(self, command, echo=False):
+        """
+        Run a single command and return its output, with the prompt and
+        command echo in front of it when `echo` is set.
+        """
+        with self.lock:
+            if self.session is None:
+                raise VtyshSessionError("vtysh session is not running")
+            if not self.session.typeable(command):
+                raise VtyshSessionError("cannot type {!r}".format(command))
+            try:
+                return self.session.run(command, echo)
+            except self.frr_reload.VtyshException as error:
+                self.close()
+                raise VtyshSessionError(str(error))
+
+
 class Router(Node):
     "A Node with IPv4/IPv6 forwarding enabled"
 
@@ -1531,10 +2165,6 @@ class Router(Node):
             os.path.join(os.path.dirname(os.path.realpath(__file__)), "../pytest.ini")
         )
 
-        self.perf_daemons = {}
-        self.rr_daemons = {}
-        self.valgrind_gdb_daemons = {}
-
         # If this topology is using old API and doesn't have logdir
         # specified, then attempt to generate an unique logdir.
         self.logdir = params.get("logdir")
@@ -1549,6 +2179,26 @@ class Router(Node):
 
         super(Router, self).__init__(name, *posargs, **params)
 
+        self._init_state()
+
+        self.ns_cmd = "sudo nsenter -a -t {} ".format(self.pid)
+        try:
+            # Allow escaping from running inside docker
+            with open("/proc/1/cgroup") as file:
+                cgroup = file.read()
+            m = re.search("[0-9]+:cpuset:/docker/([a-f0-9]+)", cgroup)
+            if m:
+                self.ns_cmd = "docker exec -it {} ".format(m.group(1)) + self.ns_cmd
+        except IOError:
+            pass
+        else:
+            logger.debug("CMD to enter {}: {}".format(self.name, self.ns_cmd))
+
+    def _init_state(self):
+        "Set up the state of a new test module"
+        self.perf_daemons = {}
+        self.rr_daemons = {}
+        self.valgrind_gdb_daemons = {}
         self.daemondir = None
         self.hasmpls = False
         self.routertype = "frr"
@@ -1593,19 +2243,23 @@ class Router(Node):
         self.reportCores = True
         self.version = None
         self.use_netns_vrf = False
+        self.vtysh_sessions = {}
+        self.vtysh_sessions_lock = threading.Lock()
+        self.log_watcher = None
 
-        self.ns_cmd = "sudo nsenter -a -t {} ".format(self.pid)
-        try:
-            # Allow escaping from running inside docker
-            with open("/proc/1/cgroup") as file:
-                cgroup = file.read()
-            m = re.search("[0-9]+:cpuset:/docker/([a-f0-9]+)", cgroup)
-            if m:
-                self.ns_cmd = "docker exec -it {} ".format(m.group(1)) + self.ns_cmd
-        except IOError:
-            pass
-        else:
-            logger.debug("CMD to enter {}: {}".format(self.name, self.ns_cmd))
+    def reuse(self, **params):
+        """
+        Prepare the router of a reused topology (see `Mininet.park()`) for a new
+        test module: `logdir` and `logger` are taken from `params`, the private
+        tmpfs directories are emptied and the daemon state is reset.
+        """
+        self.logdir = params["logdir"]
+        self.logger = params["logger"]
+        for mount in params.get("private_mounts", []):
+            # Bind mounts are shared with the host, only clear tmpfs mounts
+            if ":" not in mount:
+                self.cmd_raises("find {} -mindepth 1 -delete".format(mount))
+        self._init_state()
 
     def _config_frr(self, **params):
         "Configure FRR binaries"
@@ -1655,6 +2309,46 @@ class Router(Node):
         super(Router, self).terminate()
         os.system("chmod -R go+rw " + self.logdir)
 
+    def vtysh_session(self, daemon=None):
+        """
+        Return the persistent vtysh session talking to `daemon`, or to all
+        daemons when None, starting it if needed.  Returns None when sessions
+        are disabled or vtysh could not be started.
+        """
+        if g_pytest_config is not None and g_pytest_config.get_option(
+            "--no-vtysh-session", False
+        ):
+            return None
+
+        with self.vtysh_sessions_lock:
+            session = self.vtysh_sessions.get(daemon)
+            if session is not None and session.running:
+                return session
+
+            session = VtyshSession(self, daemon)
+            try:
+                session.start()
+            except VtyshSessionError as error:
+                logger.debug("%s: no vtysh session: %s", self.name, error)
+                return None
+
+            self.vtysh_sessions[daemon] = session
+            return session
+
+    def close_vtysh_sessions(self):
+        """
+        Stop the persistent vtysh sessions.  vtysh only connects to the
+        daemons running when it starts, so this is needed whenever daemons
+        are started or stopped.
+        """
+        with self.vtysh_sessions_lock:
+            sessions = list(self.vtysh_sessions.values())
+            self.vtysh_sessions = {}
+
+        for session in sessions:
+            with session.lock:
+                session.close()
+
     # Return count of running daemons
     def listDaemons(self):
         ret = []
@@ -1687,6 +2381,11 @@ class Router(Node):
         return ret
 
     def stopRouter(self, assertOnError=True):
+        self.close_vtysh_sessions()
+        if self.log_watcher is not None:
+            self.log_watcher.stop()
+            self.log_watcher = None
+
         # fpm_listener writes its PID file to the gear log directory (next to
         # its data dump), not to /var/run/frr/, so listDaemons() can't see it.
         # Send it SIGTERM first and give it a brief moment to run its atexit
@@ -2049,6 +2748,8 @@ class Router(Node):
     def startRouterDaemons(self, daemons=None, tgen=None):
         "Starts FRR daemons for this router."
 
+        self.close_vtysh_sessions()
+
         asan_abort = bool(g_pytest_config.option.asan_abort)
         cov_option = bool(g_pytest_config.option.cov_topotest)
         cov_dir = Path(g_pytest_config.option.rundir) / "gcda"
@@ -2124,6 +2825,7 @@ class Router(Node):
                     daemons_list.append(daemon)
 
         tail_log_files = []
+        watch_log_files = []
         check_daemon_files = []
 
         def start_daemon(daemon, instance=None):
@@ -2237,6 +2939,9 @@ class Router(Node):
                 if instance != None:
                     cmdopt += " --instance " + instance
                 cmdopt += "--log file:{}.log --log-level debug".format(dfname)
+                watch_log_files.append(
+                    "{}/{}/{}.log".format(self.logdir, self.name, dfname)
+                )
 
                 if daemon in logd_options:
                     logdopt = logd_options[daemon]
@@ -2478,19 +3183,66 @@ class Router(Node):
 
         # Check if the daemons are running
         def _check_daemons_running(check_daemon_files):
+            if not check_daemon_files:
+                return
             wait_time = 30 if (gdb_routers or gdb_daemons) else 10
-            timeout = Timeout(wait_time)
-            for remaining in timeout:
-                if not check_daemon_files:
-                    break
-                check = check_daemon_files[0]
-                if self.path_exists(check):
-                    check_daemon_files.pop(0)
+            self.logger.debug(
+                "Waiting {}s for {} to appear".format(
+                    wait_time, " ".join(check_daemon_files)
+                )
+            )
+            # Wait for all the files from within the router, so it costs a
+            # single command instead of one per file and try.  The files still
+            # missing when time is up are printed.
+            missing = self.cmd(
+                "n={}; while :; do m=; "
+                'for f in {}; do [ -e "$f" ] || m="$m $f"; done; '
+                '[ -z "$m" ] || [ $n -le 0 ] && break; '
+                "n=$((n-1)); sleep 0.05; done; echo $m".format(
+                    wait_time * 20, " ".join(check_daemon_files)
+                )
+            )
+            check_daemon_files[:] = missing.split()
+
+        def _daemon_show(daemon, command):
+            # The checks below are polled, a vtysh session to the daemon saves
+            # starting a new vtysh for every try.
+            session = self.vtysh_session(daemon)
+            if session is not None:
+                try:
+                    output = session.run(command)
+                except VtyshSessionError:
+                    pass
+                else:
+                    if "Warning: closing connection to" not in output:
+                        return output
+            return self.cmd("vtysh -d {} -c '{}'".format(daemon, command))
+
+        def _zebra_addresses_check():
+            # Returns a function checking that the interface addresses
+            # configured in zebra are all in the kernel
+            configured = set()
+            ifname = None
+            for line in _daemon_show("zebra", "show running-config").splitlines():
+                m = re.match(r"interface (\S+)", line)
+                if m:
+                    ifname = m.group(1)
                     continue
-                self.logger.debug(
-                    "Waiting {}s for {} to appear".format(remaining, check)
+                m = re.match(r" ipv6? address (\S+)", line)
+                if m and ifname:
+                    configured.add((ifname, _normalize_address(m.group(1))))
+
+            def check():
+                output = ip_show(self, "ip -o address show")
+                present = set(
+                    (name, _normalize_address(address))
+                    for name, address in re.findall(
+                        r"^\d+: (\S+)\s+inet6? (\S+)", output, re.MULTILINE
+                    )
                 )
-                time.sleep(0.5)
+                return configured <= present
+
+            return check
 
         def _check_connected_to_zebra(self, daemon):
             # Drop the last 'd' from daemon name for checking connection
@@ -2502,7 +3254,7 @@ class Router(Node):
                 return True
             else:
                 daemon = daemon[:-1]
-            output = self.cmd("vtysh -c 'show zebra client summary'")
+            output = _daemon_show("zebra", "show zebra client summary")
             return daemon in output
 
         def _check_connected_to_mgmtd(self, daemon):
@@ -2512,7 +3264,7 @@ class Router(Node):
                 or daemon == "ripd"
                 or daemon == "ripngd"
             ):
-                output = self.cmd("vtysh -c 'show mgmt backend-adapter all'")
+                output = _daemon_show("mgmtd", "show mgmt backend-adapter all")
                 return daemon in output
             else:
                 return True
@@ -2570,9 +3322,13 @@ class Router(Node):
                     assert False, "staticd failed to connect to mgmtd"
 
         if "snmpd" in daemons_list:
-            # Give zerbra a chance to configure interface addresses that snmpd daemon
-            # may then use.
-            time.sleep(2)
+            # Give zebra a chance to configure interface addresses that snmpd
+            # daemon may then use.
+            if zebra_started:
+                check = _zebra_addresses_check()
+                poller = Poller(0.5, 2)
+                while not check() and poller.sleep():
+                    pass
 
             start_daemon("snmpd")
             while "snmpd" in daemons_list:
@@ -2633,6 +3389,14 @@ class Router(Node):
         for tailf in tail_log_files:
             self.run_in_window("tail -n10000 -F " + tailf, title=tailf, background=True)
 
+        if g_pytest_config is not None and g_pytest_config.get_option(
+            "--poll-log-wakeup", False
+        ):
+            if self.log_watcher is None:
+                self.log_watcher = LogWatcher(self.name)
+            for logfile in watch_log_files:
+                self.log_watcher.add(logfile)
+
         return ""
 
     def pid_exists(self, pid):
@@ -2651,6 +3415,7 @@ class Router(Node):
     def killRouterDaemons(self, daemons, wait=True, assertOnError=True):
         # Kill Running FRR
         # Daemons(user specified daemon only) using SIGKILL
+        self.close_vtysh_sessions()
         rundaemons = self.cmd("ls -1 /var/run/%s/*.pid" % self.routertype)
         errors = ""
         daemonsNotRunning = []
@@ -2900,7 +3665,7 @@ class Router(Node):
 
         linklocal = []
 
-        ifaces = self.cmd("ip -6 address")
+        ifaces = ip_show(self, "ip -6 address")
         # Fix newlines (make them all the same)
         ifaces = ("\n".join(ifaces.splitlines()) + "\n").splitlines()
         interface = ""
@@ -7,22 +7,30 @@
 #
 """A module that implements core functionality for library or standalone use."""
 import asyncio
+import contextlib
 import datetime
 import errno
+import fcntl
 import ipaddress
 import logging
 import os
 import platform
 import re
 import readline
+import select
 import shlex
 import signal
+import socket
+import stat
+import struct
 import subprocess
 import sys
 import tempfile
+import threading
 import time as time_mod
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Union
 
@@ -103,6 +111,251 @@ class Timeout:
         return self.is_expired()
 
 
+class NamespaceExecutor:
+    """Run python functions in the network namespace of a process.
+
+    A thread can join a network namespace with setns(2) without affecting the
+    rest of the process. A single worker thread joins the namespace once and
+    then serves all the calls, which saves forking nsenter and a helper
+    program for simple queries. Other namespaces (e.g., mount) can't be joined
+    by a thread of a multi-threaded process, see `ns_path()` for files.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, initializer=self._enter, thread_name_prefix=f"ns{pid}"
+        )
+
+    def _enter(self):
+        fd = os.open(f"/proc/{self.pid}/ns/net", os.O_RDONLY)
+        try:
+            linux.setns(fd, linux.CLONE_NEWNET)
+        finally:
+            os.close(fd)
+
+    def run(self, func, *args, **kwargs):
+        """Call `func` in the namespace and return its result.
+
+        Raises the exception raised by `func`, or `BrokenExecutor` if the
+        namespace could not be joined.
+        """
+        return self.executor.submit(func, *args, **kwargs).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# rtnetlink multicast groups (RTMGRP_*) whose events invalidate a NetlinkCache
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV4_RULE = 0x80
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+RTMGRP_IPV6_RULE = 0x40000
+NETLINK_CACHE_GROUPS = (
+    RTMGRP_LINK
+    | RTMGRP_IPV4_IFADDR
+    | RTMGRP_IPV4_ROUTE
+    | RTMGRP_IPV4_RULE
+    | RTMGRP_IPV6_IFADDR
+    | RTMGRP_IPV6_ROUTE
+    | RTMGRP_IPV6_RULE
+)
+
+
+def _netlink_socket(groups):
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    sock.bind((0, groups))
+    return sock
+
+
+class NetlinkCache:
+    """Cache of kernel network state queries, dropped whenever the state changes.
+
+    A netlink socket subscribed to the link, address, route and rule events of
+    a namespace is opened from its `NamespaceExecutor`. Any event bumps the
+    generation, which drops the cached values, so a query is only run again
+    once something it may depend on changed. `wait_change()` blocks until the
+    next event instead of dumping the state again, and callbacks added with
+    `add_callback()` are called on every event.
+
+    The kernel queues the event of a change before the command making it
+    returns, but the listener thread may not have handled it yet: `get()`
+    reads the pending events itself before using the cache.
+    """
+
+    def __init__(self, executor, groups=NETLINK_CACHE_GROUPS):
+        self.generation = 0
+        self.values = {}
+        self.callbacks = {}
+        self.cond = threading.Condition()
+        self.sock = executor.run(_netlink_socket, groups)
+        self.thread = threading.Thread(target=self._listen, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        """Read the pending events, return True if there were any."""
+        changed = False
+        while True:
+            try:
+                if not self.sock.recv(65536, socket.MSG_DONTWAIT):
+                    return changed
+            except BlockingIOError:
+                return changed
+            except OSError as error:
+                # ENOBUFS: events were lost, which still means a change
+                if error.errno != errno.ENOBUFS:
+                    return changed
+            changed = True
+
+    def _update(self):
+        """Drop the cache and call the callbacks if there were events."""
+        with self.cond:
+            if not self._drain():
+                return
+            self.generation += 1
+            self.values = {}
+            self.cond.notify_all()
+            callbacks = list(self.callbacks.values())
+        for callback in callbacks:
+            callback()
+
+    def _listen(self):
+        while self.sock.fileno() != -1:
+            try:
+                ready, _, _ = select.select([self.sock], [], [], 1)
+            except (OSError, ValueError):
+                break
+            if ready:
+                self._update()
+
+    def add_callback(self, callback, key=None):
+        """Call `callback()` on every event.
+
+        Adding a callback again under the same `key` (`callback` itself by
+        default) replaces it.
+        """
+        with self.cond:
+            self.callbacks[callback if key is None else key] = callback
+
+    def get(self, key, func):
+        """Return the cached value of `key`, calling `func()` to get it if needed."""
+        self._update()
+        with self.cond:
+            generation = self.generation
+            if key in self.values:
+                return self.values[key]
+        value = func()
+        with self.cond:
+            # A change during func() may or may not be in value, don't keep it
+            if generation == self.generation:
+                self.values[key] = value
+        return value
+
+    def wait_change(self, generation, timeout=None):
+        """Wait until the generation differs from `generation`.
+
+        Returns True if it did, False on timeout.
+        """
+        with self.cond:
+            return self.cond.wait_for(lambda: self.generation != generation, timeout)
+
+    def close(self):
+        self.sock.close()
+
+
+def ns_path(pid, path, follow=True):
+    """Return a path reaching `path` of the mount namespace of `pid` from ours.
+
+    The path goes through /proc/PID/root. The kernel resolves absolute
+    symlinks found under it against our own root though, so symlinks are
+    resolved here instead. The last component is only resolved if `follow`.
+    """
+    root = f"/proc/{pid}/root"
+    parts = [x for x in path.split("/") if x]
+    resolved = ""
+    nlinks = 0
+    while parts:
+        part = parts.pop(0)
+        if part == ".":
+            continue
+        if part == "..":
+            resolved = resolved.rsplit("/", 1)[0]
+            continue
+        candidate = resolved + "/" + part
+        try:
+            st = os.lstat(root + candidate)
+        except OSError:
+            # Doesn't exist, neither does what's below
+            return root + "/".join([candidate, *parts])
+        if stat.S_ISLNK(st.st_mode) and (parts or follow):
+            nlinks += 1
+            if nlinks > 40:
+                raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), path)
+            target = os.readlink(root + candidate)
+            if target.startswith("/"):
+                resolved = ""
+            parts = [x for x in target.split("/") if x] + parts
+            continue
+        resolved = candidate
+    return root + resolved
+
+
+def _is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+# `test` flags that `Commander.test()` can check without running `test`
+TEST_PATH_CHECKS = {
+    "-d": os.path.isdir,
+    "-e": os.path.exists,
+    "-f": os.path.isfile,
+    "-L": os.path.islink,
+    "-S": _is_socket,
+}
+
+
+def get_intf_mac(ifname):
+    """Return the MAC address of `ifname` in the current network namespace."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ifreq = struct.pack("256s", ifname.encode()[:15])
+        # SIOCGIFHWADDR
+        ifreq = fcntl.ioctl(sock.fileno(), 0x8927, ifreq)
+    return ":".join(f"{x:02x}" for x in ifreq[18:24])
+
+
+def read_net_sysctls():
+    """Return the values of the /proc/sys/net variables of the current thread."""
+    values = {}
+    for dirpath, _, filenames in os.walk("/proc/sys/net"):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                with open(path, encoding="ascii") as f:
+                    values[path] = f.read()
+            except OSError:
+                pass
+    return values
+
+
+def write_net_sysctls(values):
+    """Set the /proc/sys/net variables which differ from `values`."""
+    for path, value in values.items():
+        try:
+            with open(path, encoding="ascii") as f:
+                if f.read() == value:
+                    continue
+            with open(path, "w", encoding="ascii") as f:
+                f.write(value)
+        except OSError:
+            pass
+
+
 def fsafe_name(name):
     return "".join(x if x.isalnum() else "_" for x in name)
 
@@ -353,6 +606,9 @@ class Commander:  # pylint: disable=R0904
         self.deleting = False
         self.last = None
         self.exec_paths = {}
+        self.ns_executor = None
+        self.ns_executor_lock = threading.Lock()
+        self.netlink_cache = None
 
         # For running commands one time only (deals with asyncio)
         self.cmd_once_done = {}
@@ -429,14 +685,72 @@ class Commander:  # pylint: disable=R0904
         """
         return get_exec_path_host(binary)
 
+    def get_ns_pid(self):
+        """Return the pid in whose namespaces our commands run.
+
+        Only given when commands simply run in the namespaces of a local process,
+        so they can be reached from this process as well (see `get_ns_executor()`
+        and `ns_path()`). Returns None otherwise (e.g., for containers, VMs or
+        remote hosts), in which case only commands can be used.
+        """
+        return None
+
+    def get_ns_executor(self):
+        """Return a `NamespaceExecutor` for the network namespace of our commands.
+
+        Returns None when there is none, see `get_ns_pid()`.
+        """
+        pid = self.get_ns_pid()
+        if pid is None:
+            return None
+        with self.ns_executor_lock:
+            if self.ns_executor is None:
+                self.ns_executor = NamespaceExecutor(pid)
+            return self.ns_executor
+
+    def get_netlink_cache(self):
+        """Return the `NetlinkCache` of the namespace of our commands.
+
+        Returns None when there is no `NamespaceExecutor` or the netlink socket
+        could not be opened.
+        """
+        executor = self.get_ns_executor()
+        if executor is None:
+            return None
+        with self.ns_executor_lock:
+            if self.netlink_cache is None:
+                try:
+                    self.netlink_cache = NetlinkCache(executor)
+                except Exception as error:
+                    self.logger.debug("%s: no netlink cache: %s", self, error)
+                    return None
+            return self.netlink_cache
+
+    def _test_in_ns(self, flags, arg):
+        """Check a `test` condition without running `test`, None if not possible."""
+        pid = self.get_ns_pid()
+        if pid is None or flags not in TEST_PATH_CHECKS or not os.path.isabs(arg):
+            return None
+        try:
+            path = ns_path(pid, arg, follow=flags != "-L")
+        except OSError:
+            return False
+        return TEST_PATH_CHECKS[flags](path)
+
     def test(self, flags, arg):
         """Run test binary, with flags and arg."""
+        result = self._test_in_ns(flags, arg)
+        if result is not None:
+            return result
         test_path = self.get_exec_path(["test"])
         rc, _, _ = self.cmd_status([test_path, flags, arg], warn=False)
         return not rc
 
     def test_nsonly(self, flags, arg):
         """Run test binary, with flags and arg."""
+        result = self._test_in_ns(flags, arg)
+        if result is not None:
+            return result
         test_path = self.get_exec_path(["test"])
         rc, _, _ = self.cmd_status_nsonly([test_path, flags, arg], warn=False)
         return not rc
@@ -1660,6 +1974,12 @@ class Commander:  # pylint: disable=R0904
         invoke `super()._async_delete() without catching any exceptions raised
         therein. See other examples in `base.py` or `native.py`
         """
+        if self.netlink_cache is not None:
+            self.netlink_cache.close()
+            self.netlink_cache = None
+        if self.ns_executor is not None:
+            self.ns_executor.shutdown()
+            self.ns_executor = None
         self.logger.info("%s: deleted", self)
 
     async def async_delete(self):
@@ -1939,6 +2259,7 @@ class LinuxNamespace(Commander, InterfaceMixin):
         self.init_pid = None
         self.unshare_inline = unshare_inline
         self.nsenter_fork = True
+        self.net_snapshot = None
 
         #
         # Collect the namespaces to unshare
@@ -2556,6 +2877,266 @@ class LinuxNamespace(Commander, InterfaceMixin):
         pre_cmd = self.__root_pre_cmd if root_level else self.__pre_cmd
         return shlex.join(pre_cmd) if use_str else list(pre_cmd)
 
+    def get_ns_pid(self):
+        # Sub-classes running commands some other way can't use our pid
+        if type(self)._get_pre_cmd is not LinuxNamespace._get_pre_cmd:
+            return None
+        return self.pid
+
+    def get_ns_processes(self):
+        """Return the pids of the processes in our network namespace.
+
+        Our namespace process (e.g., mutini) and this process are not included.
+        """
+        proc_path = self.unet.proc_path if self.unet else "/proc"
+        netns = os.readlink(f"{proc_path}/{self.pid}/ns/net")
+        own = {self.pid, os.getpid(), self.p.pid if self.p else None}
+        pids = []
+        for entry in os.listdir(proc_path):
+            if not entry.isdigit() or int(entry) in own:
+                continue
+            try:
+                if os.readlink(f"{proc_path}/{entry}/ns/net") == netns:
+                    pids.append(int(entry))
+            except OSError:
+                # Exited or a zombie
+                pass
+        return pids
+
+    def _get_net_links(self):
+        links = {}
+        output = self.cmd_raises_nsonly([self.ip_path, "-o", "link", "show"])
+        for m in re.finditer(r"^\d+: ([^:@]+)[^:]*: <([^>]*)> (.*)$", output, re.M):
+            mtu = re.search(r" ?mtu (\d+)", m.group(3))
+            master = re.search(r" master (\S+)", m.group(3))
+            mac = re.search(r" link/ether (\S+)", m.group(3))
+            links[m.group(1)] = (
+                "UP" in m.group(2).split(","),
+                mtu.group(1) if mtu else None,
+                master.group(1) if master else None,
+                mac.group(1) if mac else None,
+            )
+        return links
+
+    def _get_net_fdb(self):
+        bridge_path = get_exec_path_host("bridge")
+        if not bridge_path:
+            return set()
+        entries = set()
+        for line in self.cmd_raises_nsonly([bridge_path, "fdb", "show"]).splitlines():
+            words = line.split()
+            # Learned entries age out, only the static ones are kept
+            if "permanent" not in words and "static" not in words:
+                continue
+            entries.add(" ".join(words))
+        return entries
+
+    def _get_net_addrs(self):
+        output = self.cmd_raises_nsonly([self.ip_path, "-o", "addr", "show"])
+        return set(re.findall(r"^\d+:\s+(\S+)\s+(inet6?) (\S+)", output, re.M))
+
+    def _get_net_table(self, family, table):
+        if family == "-M":
+            # Fails when the mpls modules are not loaded, then there are none
+            rc, output, _ = self.cmd_status_nsonly(
+                [self.ip_path, family, "route", "show"], warn=False
+            )
+            return [" ".join(x.split()) for x in output.splitlines()] if not rc else []
+        if table == "route":
+            cmd = [self.ip_path, family, "route", "show", "table", "all"]
+        else:
+            cmd = [self.ip_path, family, "rule", "show"]
+        lines = []
+        for line in self.cmd_raises_nsonly(cmd).splitlines():
+            line = " ".join(line.split())
+            if table == "rule":
+                # "100: from all lookup 10" -> "pref 100 from all lookup 10"
+                pref, _, line = line.partition(": ")
+                line = f"pref {pref} {line}"
+            elif " proto kernel" in line:
+                # The kernel maintains these from the links and addresses
+                continue
+            lines.append(line)
+        return lines
+
+    def _get_net_qdiscs(self):
+        tc_path = get_exec_path_host("tc")
+        if not tc_path:
+            return {}
+        qdiscs = {}
+        for line in self.cmd_raises_nsonly([tc_path, "qdisc", "show"]).splitlines():
+            m = re.search(r" dev (\S+) ", line)
+            if m:
+                qdiscs.setdefault(m.group(1), []).append(" ".join(line.split()))
+        return qdiscs
+
+    def _get_net_fixed(self):
+        # The state restore_net_state() only checks, it cannot put it back
+        fixed = {}
+        for cmd in (
+            ["iptables-save"],
+            ["ip6tables-save"],
+            ["nft", "list", "ruleset"],
+            ["bridge", "vlan", "show"],
+            ["ip", "xfrm", "state"],
+            ["ip", "xfrm", "policy"],
+        ):
+            path = get_exec_path_host(cmd[0])
+            if not path:
+                continue
+            rc, output, _ = self.cmd_status_nsonly([path, *cmd[1:]], warn=False)
+            # Drop the comments (with the date) and the counters
+            output = re.sub(r"^#.*\n", "", output, flags=re.M)
+            output = re.sub(r"\[\d+:\d+\]", "", output)
+            output = re.sub(r"packets \d+ bytes \d+", "", output)
+            fixed[" ".join(cmd)] = (rc, output)
+        return fixed
+
+    def snapshot_net_state(self, path):
+        """Save the network state of the namespace, see `restore_net_state()`.
+
+        Args:
+            path: file to save the addresses into.
+        """
+        self.cmd_raises_nsonly(f"{self.ip_path} addr save > {path}")
+        executor = self.get_ns_executor()
+        self.net_snapshot = {
+            "path": path,
+            "links": self._get_net_links(),
+            "addrs": self._get_net_addrs(),
+            "-4": {x: self._get_net_table("-4", x) for x in ("route", "rule")},
+            "-6": {x: self._get_net_table("-6", x) for x in ("route", "rule")},
+            "-M": {"route": self._get_net_table("-M", "route")},
+            "qdiscs": self._get_net_qdiscs(),
+            "fdb": self._get_net_fdb(),
+            "fixed": self._get_net_fixed(),
+            "sysctls": executor.run(read_net_sysctls) if executor else {},
+        }
+
+    def restore_net_state(self):
+        """Return the network state of the namespace to the last snapshot.
+
+        Links created since are deleted, and the state of the others (MAC
+        address, MTU, master, up), their qdiscs, the static fdb entries, the
+        addresses, routes (MPLS included), rules and net sysctls are restored;
+        neighbors and nexthop objects are flushed. Raises MunetError if this
+        is not possible, e.g., when links were moved or deleted, or when the
+        iptables or nftables rules, bridge VLANs or xfrm states and policies
+        differ from the snapshot.
+        """
+        snap = self.net_snapshot
+        if snap is None:
+            raise MunetError(f"{self}: no network snapshot")
+        if self.ifnetns or self.cmd_nostatus_nsonly([self.ip_path, "netns", "list"]):
+            raise MunetError(f"{self}: links were moved to other namespaces")
+        links = self._get_net_links()
+        missing = set(snap["links"]) - set(links)
+        if missing:
+            raise MunetError(f"{self}: links {missing} were deleted")
+
+        cmds = [f"link del dev {x}" for x in links if x not in snap["links"]]
+        for name, (up, mtu, master, mac) in snap["links"].items():
+            cup, cmtu, cmaster, cmac = links[name]
+            if mac != cmac:
+                cmds.append(f"link set dev {name} address {mac}")
+            if mtu != cmtu:
+                cmds.append(f"link set dev {name} mtu {mtu}")
+            if master != cmaster:
+                cmds.append(
+                    f"link set dev {name} "
+                    + (f"master {master}" if master else "nomaster")
+                )
+            if up != cup:
+                cmds.append(f"link set dev {name} " + ("up" if up else "down"))
+        cmds.append("neigh flush all")
+        cmds.append("nexthop flush")
+        self._run_net_batch(cmds)
+
+        # Checked once the links created since (e.g. vxlans) are gone
+        fixed = self._get_net_fixed()
+        changed = [x for x in snap["fixed"] if fixed.get(x) != snap["fixed"][x]]
+        if changed:
+            raise MunetError(f"{self}: the output of {changed} changed")
+
+        if self._get_net_addrs() != snap["addrs"]:
+            self.cmd_raises_nsonly(
+                f"{self.ip_path} -4 addr flush to 0.0.0.0/0"
+                f" && {self.ip_path} -6 addr flush to ::/0"
+                f" && {self.ip_path} addr restore < {snap['path']}"
+            )
+
+        for family in ("-4", "-6", "-M"):
+            cmds = []
+            for table, add in (("rule", "add"), ("route", "replace")):
+                if table not in snap[family]:
+                    continue
+                lines = self._get_net_table(family, table)
+                cmds += [
+                    f"{table} del {x}" for x in lines if x not in snap[family][table]
+                ]
+                cmds += [
+                    f"{table} {add} {x}" for x in snap[family][table] if x not in lines
+                ]
+            self._run_net_batch(cmds, family)
+        if self._get_net_table("-M", "route") != snap["-M"]["route"]:
+            raise MunetError(f"{self}: MPLS routes could not be restored")
+
+        qdiscs = self._get_net_qdiscs()
+        changed = [x for x in snap["links"] if qdiscs.get(x) != snap["qdiscs"].get(x)]
+        if changed:
+            # Deleting the root and ingress qdiscs puts back the default ones
+            self.cmd_status_nsonly(
+                [get_exec_path_host("tc"), "-force", "-batch", "-"],
+                stdin="".join(
+                    f"qdisc del dev {x} root\nqdisc del dev {x} ingress\n"
+                    for x in changed
+                ),
+                warn=False,
+            )
+            qdiscs = self._get_net_qdiscs()
+            changed = [x for x in changed if qdiscs.get(x) != snap["qdiscs"].get(x)]
+            if changed:
+                raise MunetError(f"{self}: qdiscs of {changed} could not be restored")
+
+        fdb = self._get_net_fdb()
+        if fdb != snap["fdb"]:
+            cmds = []
+            for entry in fdb - snap["fdb"]:
+                # e.g. "MAC dev vxlan0 vlan 10 dst 10.0.0.1 self permanent"
+                words = entry.split()
+                cmd = f"fdb del {words[0]} dev {words[2]}"
+                for option in ("vlan", "dst"):
+                    if option in words:
+                        cmd += f" {option} {words[words.index(option) + 1]}"
+                for flag in ("self", "master"):
+                    if flag in words:
+                        cmd += f" {flag}"
+                cmds.append(cmd)
+            self.cmd_status_nsonly(
+                [get_exec_path_host("bridge"), "-force", "-batch", "-"],
+                stdin="".join(x + "\n" for x in cmds),
+                warn=False,
+            )
+            if self._get_net_fdb() != snap["fdb"]:
+                raise MunetError(f"{self}: fdb entries could not be restored")
+
+        executor = self.get_ns_executor()
+        if executor:
+            executor.run(write_net_sysctls, snap["sysctls"])
+
+    def _run_net_batch(self, cmds, family=None):
+        if not cmds:
+            return
+        rc, o, e = self.cmd_status_nsonly(
+            [self.ip_path, *([family] if family else []), "-force", "-batch", "-"],
+            stdin="\n".join(cmds) + "\n",
+            warn=False,
+        )
+        if rc:
+            self.logger.debug(
+                "%s: restoring network state: %s", self, cmd_error(rc, o, e)
+            )
+
     def tmpfs_mount(self, inner):
         self.logger.debug("Mounting tmpfs on %s", inner)
         self.cmd_raises("mkdir -p " + inner)
@@ -2772,6 +3353,12 @@ class SharedNamespace(Commander):
         assert not root_level
         return shlex.join(self.__pre_cmd) if use_str else list(self.__pre_cmd)
 
+    def get_ns_pid(self):
+        # Sub-classes running commands some other way can't use our pid
+        if type(self)._get_pre_cmd is not SharedNamespace._get_pre_cmd:
+            return None
+        return self.pid
+
     def set_ns_cwd(self, cwd: Union[str, Path]):
         """Common code for changing pre_cmd and pre_nscmd."""
         self.logger.debug("%s: new CWD %s", self, cwd)
@@ -2848,6 +3435,55 @@ class Bridge(SharedNamespace, InterfaceMixin):
         await super()._async_delete()
 
 
+class LinkBatch:
+    """Collects `ip` commands to run them with one `ip -batch` per namespace.
+
+    The commands of a commander run in the order they were added, and the
+    commanders in the order they were first given commands, so the ones
+    creating and moving interfaces must be added before the ones using them.
+    """
+
+    def __init__(self):
+        self.cmds = {}
+        self.macs = []
+        self.constraints = []
+
+    def add(self, commander, *cmds):
+        """Add `ip` commands (without the leading "ip") to run on `commander`."""
+        self.cmds.setdefault(commander, []).extend(cmds)
+
+    def add_mac(self, commander, name, ifname):
+        """Look up the MAC of `ifname` of node `name` once the links exist."""
+        self.add(commander, f"link show {ifname}")
+        self.macs.append((commander, name, ifname))
+
+    def add_constraints(self, node, ifname, constraints):
+        """Set interface constraints once the links exist."""
+        self.constraints.append((node, ifname, constraints))
+
+    def apply(self, unet):
+        """Run the collected commands and cache the MACs in `unet`."""
+        outputs = {}
+        for commander, cmds in self.cmds.items():
+            outputs[commander] = commander.cmd_raises_nsonly(
+                ["ip", "-o", "-batch", "-"], stdin="\n".join(cmds) + "\n"
+            )
+
+        for commander, name, ifname in self.macs:
+            m = re.search(
+                rf"^\d+: {re.escape(ifname)}(@\S+)?: .*"
+                r"link/(loopback|ether) ([0-9a-fA-F:]+) ",
+                outputs[commander],
+                re.MULTILINE,
+            )
+            mac = m.group(3)
+            unet.macs[(name, ifname)] = mac
+            unet.rmacs[mac] = (name, ifname)
+
+        for node, ifname, constraints in self.constraints:
+            node.set_intf_constraints(ifname, **constraints)
+
+
 class BaseMunet(LinuxNamespace):
     """Munet."""
 
@@ -2866,6 +3502,8 @@ class BaseMunet(LinuxNamespace):
         self.hosts = {}
         self.switches = {}
         self.links = {}
+        self.link_batch = None
+        self.snapshot_dir = None
         self.macs = {}
         self.rmacs = {}
         self.isolated = isolated
@@ -2990,12 +3628,39 @@ class BaseMunet(LinuxNamespace):
         if intf_constraints:
             node1.set_intf_constraints(if1, **intf_constraints)
 
+    @contextlib.contextmanager
+    def batch_links(self):
+        """Create the links added within the context all at once on exit.
+
+        `add_link()` runs its `ip` commands with one `ip -batch` per namespace
+        involved in the link. Within this context the commands of all the links
+        are collected and run when it exits instead, so building a whole
+        topology only takes one `ip -batch` per namespace. The links can't be
+        used before the context exits.
+        """
+        if self.link_batch is not None:
+            yield self.link_batch
+            return
+
+        batch = self.link_batch = LinkBatch()
+        try:
+            yield batch
+        finally:
+            self.link_batch = None
+        batch.apply(self)
+
     def add_link(self, node1, node2, if1, if2, mtu=None, **intf_constraints):
         """Add a link between switch and node or 2 nodes.
 
         If constraints are given they are applied to each endpoint. See
         `InterfaceMixin::set_intf_constraints()` for more info.
+
+        The link is created right away, unless within `batch_links()`.
         """
+        with self.batch_links() as batch:
+            self._add_link(batch, node1, node2, if1, if2, mtu, intf_constraints)
+
+    def _add_link(self, batch, node1, node2, if1, if2, mtu, intf_constraints):
         isp2p = False
 
         try:
@@ -3035,28 +3700,31 @@ class BaseMunet(LinuxNamespace):
         # And create the veth now.
         if isp2p:
             lhost, rhost = self.hosts[name1], self.hosts[name2]
-            lifname = "i1{:x}".format(lhost.pid)
+            # Unique per link as the renames of a batch only run after all the
+            # links have been moved into their namespace.
+            lifname = "i{:x}.{:x}".format(len(self.links), lhost.pid)
 
             # Done at root level
             nsif1 = lhost.get_ns_ifname(if1)
             nsif2 = rhost.get_ns_ifname(if2)
 
             # Use pids[-1] to get the unet scoped pid for hosts
-            self.cmd_raises_nsonly(
-                f"ip link add {lifname} type veth peer name {nsif2}"
-                f" netns {rhost.pids[-1]}"
+            batch.add(
+                self,
+                f"link add {lifname} type veth peer name {nsif2}"
+                f" netns {rhost.pids[-1]}",
+                f"link set {lifname} netns {lhost.pids[-1]}",
             )
-            self.cmd_raises_nsonly(f"ip link set {lifname} netns {lhost.pids[-1]}")
 
-            lhost.cmd_raises_nsonly("ip link set {} name {}".format(lifname, nsif1))
+            batch.add(lhost, "link set {} name {}".format(lifname, nsif1))
             if mtu:
-                lhost.cmd_raises_nsonly("ip link set {} mtu {}".format(nsif1, mtu))
-            lhost.cmd_raises_nsonly("ip link set {} up".format(nsif1))
+                batch.add(lhost, "link set {} mtu {}".format(nsif1, mtu))
+            batch.add(lhost, "link set {} up".format(nsif1))
             lhost.register_interface(if1)
 
             if mtu:
-                rhost.cmd_raises_nsonly("ip link set {} mtu {}".format(nsif2, mtu))
-            rhost.cmd_raises_nsonly("ip link set {} up".format(nsif2))
+                batch.add(rhost, "link set {} mtu {}".format(nsif2, mtu))
+            batch.add(rhost, "link set {} up".format(nsif2))
             rhost.register_interface(if2)
         else:
             switch = self.switches[name1]
@@ -3078,9 +3746,10 @@ class BaseMunet(LinuxNamespace):
 
             # Use pids[-1] to get the unet scoped pid for hosts
             # switch is already in our namespace so nothing to convert.
-            self.cmd_raises_nsonly(
-                f"ip link add {nsif1} type veth peer name {nsif2}"
-                f" netns {rhost.pids[-1]}"
+            batch.add(
+                self,
+                f"link add {nsif1} type veth peer name {nsif2}"
+                f" netns {rhost.pids[-1]}",
             )
 
             if mtu:
@@ -3089,26 +3758,27 @@ class BaseMunet(LinuxNamespace):
                 #     switch.cmd_raises_nsonly(
                 #         "ip link set {} mtu {}".format(if1, switch.mtu)
                 #     )
-                switch.cmd_raises_nsonly("ip link set {} mtu {}".format(nsif1, mtu))
-                rhost.cmd_raises_nsonly("ip link set {} mtu {}".format(nsif2, mtu))
+                batch.add(switch, "link set {} mtu {}".format(nsif1, mtu))
+                batch.add(rhost, "link set {} mtu {}".format(nsif2, mtu))
 
             switch.register_interface(if1)
             rhost.register_interface(if2)
             rhost.register_network(switch.name, if2)
 
-            switch.cmd_raises_nsonly(f"ip link set {nsif1} master {switch.name}")
+            batch.add(switch, f"link set {nsif1} master {switch.name}")
 
-            switch.cmd_raises_nsonly(f"ip link set {nsif1} up")
-            rhost.cmd_raises_nsonly(f"ip link set {nsif2} up")
+            batch.add(switch, f"link set {nsif1} up")
+            batch.add(rhost, f"link set {nsif2} up")
 
         # Cache the MAC values, and reverse mapping
-        self.get_mac(name1, nsif1)
-        self.get_mac(name2, nsif2)
+        ldev = self.hosts[name1] if isp2p else self.switches[name1]
+        batch.add_mac(ldev, name1, nsif1)
+        batch.add_mac(rhost, name2, nsif2)
 
         # Setup interface constraints if provided
         if intf_constraints:
-            node1.set_intf_constraints(if1, **intf_constraints)
-            node2.set_intf_constraints(if2, **intf_constraints)
+            batch.add_constraints(node1, if1, intf_constraints)
+            batch.add_constraints(node2, if2, intf_constraints)
 
     def add_switch(self, name, cls=Bridge, **kwargs):
         """Add a switch to munet."""
@@ -3125,14 +3795,43 @@ class BaseMunet(LinuxNamespace):
         nsifname = self.get_ns_ifname(ifname)
 
         if (name, ifname) not in self.macs:
-            _, output, _ = dev.cmd_status_nsonly("ip -o link show " + nsifname)
-            m = re.match(".*link/(loopback|ether) ([0-9a-fA-F:]+) .*", output)
-            mac = m.group(2)
+            executor = dev.get_ns_executor()
+            try:
+                mac = executor.run(get_intf_mac, nsifname) if executor else None
+            except Exception:
+                mac = None
+            if mac is None:
+                _, output, _ = dev.cmd_status_nsonly("ip -o link show " + nsifname)
+                m = re.match(".*link/(loopback|ether) ([0-9a-fA-F:]+) .*", output)
+                mac = m.group(2)
             self.macs[(name, ifname)] = mac
             self.rmacs[mac] = (name, ifname)
 
         return self.macs[(name, ifname)]
 
+    def snapshot(self):
+        """Save the network state of all the namespaces, see `restore()`."""
+        if self.snapshot_dir is None:
+            self.snapshot_dir = tempfile.mkdtemp(prefix="mu-snap-")
+        for i, node in enumerate([self, *self.hosts.values()]):
+            node.snapshot_net_state(os.path.join(self.snapshot_dir, f"{i}.addr"))
+
+    def restore(self):
+        """Return all the namespaces to the network state of the last `snapshot()`.
+
+        Raises MunetError if a namespace cannot be restored, e.g., when a host
+        was added since the snapshot.
+        """
+        nodes = [self, *self.hosts.values()]
+        for node in nodes:
+            if node.net_snapshot is None:
+                raise MunetError(f"{node}: no network snapshot")
+        # The MAC addresses looked up since may have been changed
+        self.macs = {}
+        self.rmacs = {}
+        for node in nodes:
+            node.restore_net_state()
+
     async def _delete_link(self, lname):
         rname, rif = self.links[lname][2:4]
         host = self.hosts[rname]
@@ -3193,6 +3892,9 @@ class BaseMunet(LinuxNamespace):
                     "rm -rf " + os.path.dirname(self.cli_sockpath)
                 )
                 self.cli_sockpath = None
+            if self.snapshot_dir:
+                await self.async_cmd_status("rm -rf " + self.snapshot_dir)
+                self.snapshot_dir = None
         except Exception as error:
             logger.error(
                 "%s: error cli server or sockpaths: %s", self, error, exc_info=True
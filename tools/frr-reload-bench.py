@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+# Benchmark for the frr-reload.py diff engine
+#
+"""
+Time the compare/fixup pipeline of frr-reload.py on synthetic configurations.
+
+A running configuration with the requested number of lines is generated
+(BGP VRF instances with peer-groups and neighbors, prefix-lists, route-maps
+and interfaces), along with a target configuration in which a share of the
+neighbors, prefix-list entries and interfaces changed.  Both are parsed
+without vtysh, the generator already emits the markers "vtysh -m" would add,
+and compare_context_objects() is timed on them.
+
+    tools/frr-reload-bench.py 10000 50000 200000
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+
+def load_frr_reload():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frr-reload.py")
+    spec = importlib.util.spec_from_file_location("frr_reload", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def gen_config(nlines, changed):
+    """
+    Generate about nlines lines of marked configuration.  When changed is
+    set, every fifth neighbor is removed, every tenth one gets a different
+    remote-as, bfd timers and route-map, every tenth prefix-list entry a
+    different prefix and every tenth interface a different description.
+    """
+    lines = []
+    vrf = 0
+
+    while len(lines) < nlines:
+        vrf += 1
+        name = "vrf%d" % vrf
+
+        lines.append("interface eth%d" % vrf)
+        description = "uplink %d" % vrf
+        if changed and vrf % 10 == 0:
+            description += " new"
+        lines.append(" description %s" % description)
+        lines.append(" ip address 10.%d.%d.1/24" % (vrf // 250, vrf % 250))
+        lines.append("exit")
+        lines.append("end")
+
+        for seq in range(1, 21):
+            prefix = "10.%d.%d.0/24" % (seq, vrf % 250)
+            if changed and seq % 10 == 0:
+                prefix = "11.%d.%d.0/24" % (seq, vrf % 250)
+            lines.append(
+                "ip prefix-list PL-%s seq %d permit %s le 32" % (name, seq * 5, prefix)
+            )
+            lines.append("end")
+
+        lines.append("route-map RM-%s permit 10" % name)
+        lines.append(" match ip address prefix-list PL-%s" % name)
+        lines.append(" set local-preference 200")
+        lines.append("exit")
+        lines.append("end")
+
+        lines.append("router bgp 65000 vrf %s" % name)
+        lines.append(" bgp router-id 10.255.%d.%d" % (vrf // 250, vrf % 250))
+        lines.append(" neighbor PG peer-group")
+        lines.append(" neighbor PG remote-as external")
+        for nbr in range(1, 41):
+            if changed and nbr % 5 == 0:
+                continue
+            addr = "10.%d.%d.%d" % (vrf // 250, vrf % 250, nbr)
+            remote_as = 65001 + nbr
+            bfd_rx = 300
+            if changed and nbr % 10 == 1:
+                remote_as += 1000
+                bfd_rx = 500
+            lines.append(" neighbor %s remote-as %d" % (addr, remote_as))
+            lines.append(" neighbor %s timers 3 9" % addr)
+            lines.append(" neighbor %s bfd 3 %d 300" % (addr, bfd_rx))
+        lines.append("exit")
+        lines.append("end")
+        lines.append("router bgp 65000 vrf %s" % name)
+        lines.append(" address-family ipv4 unicast")
+        for nbr in range(1, 41):
+            if changed and nbr % 5 == 0:
+                continue
+            addr = "10.%d.%d.%d" % (vrf // 250, vrf % 250, nbr)
+            route_map = "RM-%s" % name
+            if changed and nbr % 10 == 1:
+                route_map += "-NEW"
+            lines.append("  neighbor %s route-map %s in" % (addr, route_map))
+        lines.append(" exit-address-family")
+        lines.append("exit")
+        lines.append("end")
+
+    return lines
+
+
+def build_config(frr_reload, lines):
+    config = frr_reload.Config(None)
+    config.lines = lines
+    config.load_contexts()
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[10000, 50000, 200000],
+        help="number of configuration lines to benchmark",
+    )
+    args = parser.parse_args()
+
+    frr_reload = load_frr_reload()
+
+    print("%10s %10s %10s %10s %10s" % ("lines", "parse", "compare", "add", "del"))
+    for size in args.sizes:
+        start = time.monotonic()
+        running = build_config(frr_reload, gen_config(size, False))
+        newconf = build_config(frr_reload, gen_config(size, True))
+        parsed = time.monotonic()
+
+        lines_to_add, lines_to_del = frr_reload.compare_context_objects(
+            newconf, running
+        )
+        compared = time.monotonic()
+
+        print(
+            "%10d %9.2fs %9.2fs %10d %10d"
+            % (
+                size,
+                parsed - start,
+                compared - parsed,
+                len(lines_to_add),
+                len(lines_to_del),
+            )
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
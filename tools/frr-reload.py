@@ -10,19 +10,40 @@ This program
 - compares the two configs and determines what commands to execute to
   synchronize frr's running configuration with the configuration in the
   text file
+
+It can also be used as a library, see compare_config_text():
+
+    spec = importlib.util.spec_from_file_location("frr_reload", path)
+    frr_reload = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(frr_reload)
+    delta = frr_reload.compare_config_text(new_text, running_text)
 """
 
 from __future__ import print_function, unicode_literals
 import argparse
+import bisect
+import codecs
 import datetime
+import fcntl
+import hashlib
+import json
 import logging
 import os, os.path
+import pty
 import random
 import re
+import select
+import shutil
 import string
+import struct
 import subprocess
 import sys
+import termios
+import threading
+import time
 from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from ipaddress import IPv6Address, ip_network
 from pprint import pformat
 
@@ -40,10 +61,22 @@ class VtyshException(Exception):
 
 
 class Vtysh(object):
-    def __init__(self, bindir=None, confdir=None, sockdir=None, pathspace=None):
+    def __init__(
+        self,
+        bindir=None,
+        confdir=None,
+        sockdir=None,
+        pathspace=None,
+        daemon=None,
+        marker=None,
+    ):
         self.bindir = bindir
         self.confdir = confdir
+        self.sockdir = sockdir
         self.pathspace = pathspace
+        self.daemon = daemon
+        # Marks configuration text in place of "vtysh -m", see mark_config()
+        self.marker = marker
         self.common_args = [os.path.join(bindir or "", "vtysh")]
         if confdir:
             self.common_args.extend(["--config_dir", confdir])
@@ -51,6 +84,21 @@ class Vtysh(object):
             self.common_args.extend(["--vty_socket", sockdir])
         if pathspace:
             self.common_args.extend(["-N", pathspace])
+        if daemon:
+            self.common_args.extend(["-d", daemon])
+
+    def for_daemon(self, daemon):
+        """
+        Return a Vtysh that only talks to one daemon
+        """
+        return Vtysh(
+            self.bindir,
+            self.confdir,
+            self.sockdir,
+            self.pathspace,
+            daemon,
+            self.marker,
+        )
 
     def _call(self, args, stdin=None, stdout=None, stderr=None):
         kwargs = {}
@@ -60,6 +108,7 @@ class Vtysh(object):
             kwargs["stdout"] = stdout
         if stderr is not None:
             kwargs["stderr"] = stderr
+        stats.count("vtysh_processes")
         return subprocess.Popen(self.common_args + args, **kwargs)
 
     def _call_cmd(self, command, stdin=None, stdout=None, stderr=None):
@@ -86,6 +135,43 @@ class Vtysh(object):
             )
         return stdout.decode("UTF-8")
 
+    def exec_batch(self, commands, stdouts=None):
+        """
+        Run a list of CLI commands through a single vtysh process.
+
+        vtysh stops at the first command that fails, so the commands are
+        echoed (-E) to find out how far it got.  Returns the number of
+        commands, counted from the start of the list, that were executed
+        successfully.  The output of the failing command, if any, is
+        appended to stdouts.
+        """
+        args = ["-E"] + [item for sub in commands for item in ["-c", sub]]
+        proc = self._call(args, stdout=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        output = stdout.decode("UTF-8")
+
+        if proc.wait() == 0:
+            return len(commands)
+
+        # Every command is echoed as "<prompt><command>" before it runs, the
+        # last one echoed is the one that failed.
+        echoed = 0
+        last_echo = 0
+        lines = output.split("\n")
+        for lineno, line in enumerate(lines):
+            if echoed == len(commands):
+                break
+
+            cmd = commands[echoed]
+            if line.endswith(cmd) and re.match(r"^\S+[#>] $", line[: -len(cmd)]):
+                echoed += 1
+                last_echo = lineno
+
+        if stdouts is not None:
+            stdouts.append("\n".join(lines[last_echo + 1 :]).rstrip())
+
+        return max(echoed - 1, 0)
+
     def is_config_available(self):
         """
         Return False if no frr daemon is running or some other vtysh session is
@@ -109,6 +195,16 @@ class Vtysh(object):
             )
 
     def mark_file(self, filename, stdin=None):
+        with stats.phase("mark"):
+            return self._mark_file(filename, stdin)
+
+    def _mark_file(self, filename, stdin=None):
+        if self.marker is not None:
+            if filename == "-":
+                return self.marker(stdin.decode("UTF-8"))
+            with open(filename) as fh:
+                return self.marker(fh.read())
+
         child = self._call(
             ["-m", "-f", filename],
             stdout=subprocess.PIPE,
@@ -116,7 +212,7 @@ class Vtysh(object):
             stderr=subprocess.PIPE,
         )
         try:
-            stdout, stderr = child.communicate()
+            stdout, stderr = child.communicate(stdin)
         except subprocess.TimeoutExpired:
             child.kill()
             stdout, stderr = child.communicate()
@@ -130,11 +226,27 @@ class Vtysh(object):
 
         return stdout.decode("UTF-8")
 
+    def mark_text(self, text):
+        """
+        Mark configuration text that is already in memory
+        """
+        return self.mark_file("-", text.encode("UTF-8"))
+
     def mark_show_run(self, daemon=None):
         cmd = "show running-config"
         if daemon:
             cmd += " %s" % daemon
         cmd += " no-header"
+        if self.marker is not None:
+            with stats.phase("show_running"):
+                config = self(cmd)
+            with stats.phase("mark"):
+                return self.marker(config)
+
+        with stats.phase("show_running"):
+            return self._mark_show_run(cmd)
+
+    def _mark_show_run(self, cmd):
         show_run = self._call_cmd(cmd, stdout=subprocess.PIPE)
         mark = self._call(
             ["-m", "-f", "-"], stdin=show_run.stdout, stdout=subprocess.PIPE
@@ -157,6 +269,241 @@ class Vtysh(object):
         return stdout.decode("UTF-8")
 
 
+class VtyshSession(object):
+    """
+    A long-lived interactive vtysh process shared by all the show, config
+    and write commands of a reload.
+
+    vtysh is run on a pseudo-terminal so that it behaves as if a user were
+    typing.  Each command is framed by two comment lines, which vtysh
+    ignores but echoes back, so the output of the command is whatever shows
+    up between the two echoes.
+
+    An interactive vtysh has no exit status per command, a failure is only
+    visible when the command prints a "%" line.  That is good enough for the
+    show commands, anything else (configuration, write) goes through a
+    separate vtysh process whose exit status tells whether it worked.  So do
+    the commands holding characters readline takes as keys: "?" for help
+    and tab for completion.
+
+    Marking ("vtysh -m") is a vtysh startup mode rather than a command, so
+    it still goes through a separate vtysh process, fed from memory.  Calls
+    the session cannot handle are passed on to the Vtysh object it wraps.
+
+    popen starts the vtysh process, it defaults to subprocess.Popen.  The
+    topotests use it to run the session inside a router.
+    """
+
+    def __init__(self, vtysh, timeout=300, popen=None):
+        self.vtysh = vtysh
+        self.timeout = timeout
+        self.popen = popen or subprocess.Popen
+        self.proc = None
+        self.fd = None
+        self.seq = 0
+        self.buf = ""
+        self.nonce = "".join(
+            random.SystemRandom().choice(string.ascii_uppercase + string.digits)
+            for _ in range(8)
+        )
+        self.decoder = codecs.getincrementaldecoder("UTF-8")(errors="replace")
+
+    def start(self):
+        master, slave = pty.openpty()
+
+        # vtysh's readline echoes what it reads by itself, the terminal must
+        # not echo input on its own or the frames end up out of order.  A
+        # wide terminal keeps readline from wrapping long lines.
+        attrs = termios.tcgetattr(slave)
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", 0, 65535, 0, 0))
+
+        env = dict(os.environ, TERM="dumb", VTYSH_HISTFILE="/dev/null")
+        env.pop("VTYSH_PAGER", None)
+
+        stats.count("vtysh_processes")
+        try:
+            self.proc = self.popen(
+                self.vtysh.common_args,
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+                env=env,
+                start_new_session=True,
+            )
+        except OSError as e:
+            os.close(master)
+            raise VtyshException("failed to start vtysh session: %s" % e)
+        finally:
+            os.close(slave)
+
+        self.fd = master
+
+        try:
+            # Skip the banner, and do not page the output
+            self.run("")
+            self.run("no terminal paginate")
+        except VtyshException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.proc is None:
+            return
+
+        try:
+            os.write(self.fd, b"end\nexit\n")
+            self.proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            # Closing the terminal hangs vtysh up, a wrapper running it (e.g.
+            # nsenter) may not forward the kill.
+            os.close(self.fd)
+            self.fd = None
+            self.proc.kill()
+            self.proc.wait()
+
+        if self.fd is not None:
+            os.close(self.fd)
+        self.proc = None
+        self.fd = None
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_until(self, marker):
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            index = self.buf.find(marker)
+            if index >= 0:
+                return index
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise VtyshException("vtysh session timed out")
+
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                continue
+
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError:
+                data = b""
+
+            if not data:
+                raise VtyshException("vtysh session closed unexpectedly")
+
+            self.buf += self.decoder.decode(data)
+
+    def run(self, command, echo=False):
+        """
+        Run a single command and return its output, with the prompt and
+        command echo in front of it when echo is set.  The command must be
+        typeable().
+        """
+        if self.proc is None:
+            raise VtyshException("vtysh session is not running")
+
+        self.seq += 1
+        stats.count("vtysh_session_commands")
+        begin = "! frr-reload %s-%d-begin" % (self.nonce, self.seq)
+        end = "! frr-reload %s-%d-end" % (self.nonce, self.seq)
+
+        try:
+            os.write(self.fd, ("%s\n%s\n%s\n" % (begin, command, end)).encode("UTF-8"))
+        except OSError as e:
+            raise VtyshException("vtysh session write failed: %s" % e)
+
+        # Output starts after the echo of the command, on the line following
+        # the begin marker, and stops at the prompt echoing the end marker.
+        index = self._read_until(begin)
+        self.buf = self.buf[index + len(begin) :]
+        index = self._read_until(end)
+        output = self.buf[: self.buf.rfind("\n", 0, index) + 1]
+        self.buf = self.buf[index + len(end) :]
+
+        output = re.sub(r"\x1b\[[0-9;?]*[A-Za-z]", "", output.replace("\r", ""))
+        lines = output.split("\n")[1:] if echo else output.split("\n")[2:]
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def typeable(command):
+        """
+        Return False if readline would take characters of command as keys
+        """
+        return command.isprintable() and "?" not in command
+
+    @classmethod
+    def in_session(cls, command):
+        """
+        Return True if command can be run through the session
+        """
+        if isinstance(command, list) or not command.startswith("show "):
+            return False
+        return cls.typeable(command)
+
+    def __call__(self, command, stdouts=None):
+        """
+        Call a CLI command, or a list of them.  Single show commands are run
+        through the session, the others by the wrapped Vtysh (see in_session()).
+        """
+        if not self.in_session(command):
+            return self.vtysh(command, stdouts)
+
+        output = self.run(command)
+        if any(line.startswith("%") for line in output.split("\n")):
+            if stdouts is not None:
+                stdouts.append(output)
+            raise VtyshException('vtysh session failed for command "%s"' % (command))
+
+        return output
+
+    def is_config_available(self):
+        stdouts = []
+        try:
+            output = self(["configure"], stdouts)
+        except VtyshException as error:
+            output = "".join(stdouts)
+            log.error(f"vtysh 'configure' failed: {error}\n{output}\n")
+            return False
+
+        if "configuration is locked" in output.lower():
+            log.error(f"vtysh 'configure' returned\n{output}\n")
+            return False
+
+        return True
+
+    def mark_file(self, filename, stdin=None):
+        return self.vtysh.mark_file(filename, stdin)
+
+    def mark_show_run(self, daemon=None):
+        cmd = "show running-config"
+        if daemon:
+            cmd += " %s" % daemon
+        cmd += " no-header"
+
+        with stats.phase("show_running"):
+            config = self(cmd)
+        return self.vtysh.mark_text(config)
+
+    def exec_file(self, filename):
+        return self.vtysh.exec_file(filename)
+
+    def exec_batch(self, commands, stdouts=None):
+        return self.vtysh.exec_batch(commands, stdouts)
+
+
 class Context(object):
     """
         A Context object represents a section of frr configuration such as:
@@ -198,16 +545,28 @@ class Context(object):
             self.dlines[ligne] = True
 
 
+re_es_id = re.compile(r"(evpn mh es-id|evpn mh es-sys-mac) (?P<esi>\S*)")
+re_interface_vrf = re.compile(r"interface (\S+) vrf (\S+)")
+re_ebgp_multihop = re.compile(r"(.*)ebgp-multihop\s+255")
+re_aggregate_address = re.compile(
+    r"^aggregate-address\s+(\S+(?:\s+\d+\.\d+\.\d+\.\d+)?)\s*(.*)$"
+)
+re_static_route = re.compile(r"^(ip|ipv6) route\s+(\S+)\s+(.*)$")
+re_distance = re.compile(r"^\d+$")
+re_vrf_context = re.compile(r"^vrf ([a-z]+)$")
+re_pim_legacy = re.compile(
+    r"^ip(v6)? pim ((ecmp|join|keep|mlag|packets|register|rp|send|spt|ssm).*)$"
+)
+re_pim_legacy_global = re.compile(r"^ip(v6)? ((ssmpingd|msdp).*)$")
+
+
 def get_normalized_es_id(line):
     """
     The es-id or es-sys-mac need to be converted to lower case
     """
-    sub_strs = ["evpn mh es-id", "evpn mh es-sys-mac"]
-    for sub_str in sub_strs:
-        obj = re.match(sub_str + r" (?P<esi>\S*)", line)
-        if obj:
-            line = "%s %s" % (sub_str, obj.group("esi").lower())
-            break
+    obj = re_es_id.match(line)
+    if obj:
+        line = "%s %s" % (obj.group(1), obj.group("esi").lower())
     return line
 
 
@@ -229,7 +588,7 @@ def get_normalized_interface_vrf(line):
     correctly and configurations are matched appropriately.
     """
 
-    intf_vrf = re.search(r"interface (\S+) vrf (\S+)", line)
+    intf_vrf = re_interface_vrf.search(line)
     if intf_vrf:
         old_line = "vrf %s" % intf_vrf.group(2)
         new_line = line.replace(old_line, "").strip()
@@ -239,7 +598,7 @@ def get_normalized_interface_vrf(line):
 
 
 def get_normalized_ebgp_multihop_line(line):
-    obj = re.search(r"(.*)ebgp-multihop\s+255", line)
+    obj = re_ebgp_multihop.search(line)
     if obj:
         line = obj.group(1) + "ebgp-multihop"
 
@@ -259,9 +618,7 @@ def get_normalized_aggregate_address_line(line):
     Otherwise frr-reload deletes and re-adds the aggregate on every reload,
     briefly withdrawing the aggregate route.
     """
-    match = re.match(
-        r"^aggregate-address\s+(\S+(?:\s+\d+\.\d+\.\d+\.\d+)?)\s*(.*)$", line
-    )
+    match = re_aggregate_address.match(line)
     if not match:
         return line
 
@@ -332,7 +689,7 @@ def get_normalized_static_route_line(line):
     Otherwise frr-reload deletes and re-adds the route on every reload,
     briefly creating a routing hole.
     """
-    match = re.match(r"^(ip|ipv6) route\s+(\S+)\s+(.*)$", line)
+    match = re_static_route.match(line)
     if not match:
         return line
 
@@ -413,7 +770,7 @@ def get_normalized_static_route_line(line):
         elif tok == "vrf" and i + 1 < len(rest):
             i += 1
             vrf = rest[i]
-        elif re.match(r"^\d+$", tok) and int(tok) <= 255:
+        elif re_distance.match(tok) and int(tok) <= 255:
             distance = tok
         elif not nexthop:
             nexthop.append(tok)
@@ -482,6 +839,155 @@ def get_normalized_static_route_line(line):
     return normalized
 
 
+# The normalizers applied to the lines of a configuration file, by first
+# word of the line.  Each one is only called for the lines that start with
+# its prefix and contain its needle.  Lines with a ":" in them (IPv6
+# addresses, MACs, ESIs) also go through get_normalized_mac_ip_line(),
+# before these.
+line_normalizers = {
+    "interface": [("interface ", " vrf ", get_normalized_interface_vrf)],
+    "neighbor": [("neighbor ", "ebgp-multihop", get_normalized_ebgp_multihop_line)],
+    "aggregate-address": [
+        ("aggregate-address ", "", get_normalized_aggregate_address_line)
+    ],
+    "ip": [("ip route ", "", get_normalized_static_route_line)],
+    "ipv6": [("ipv6 route ", "", get_normalized_static_route_line)],
+}
+
+
+class Profile(object):
+    """
+    Number of calls and time spent per step (normalizer, ...), collected
+    when frr-reload runs with --profile
+    """
+
+    def __init__(self):
+        self.calls = OrderedDict()
+        self.time = OrderedDict()
+
+    def add(self, name, elapsed):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.time[name] = self.time.get(name, 0.0) + elapsed
+
+    def report(self):
+        for name in sorted(self.time, key=self.time.get, reverse=True):
+            log.info(
+                f"profile {name}: {self.calls[name]} calls, {self.time[name]:.3f}s"
+            )
+
+
+# Set by --profile
+profile = None
+
+
+class Stats(object):
+    """
+    Time spent in each phase of a reload and counters of what was done,
+    logged at the end of the run (and saved with --stats-json).
+
+    Phases may nest (the fixups are part of "compare", everything is part of
+    "pass1" or "pass2") and are summed over all the threads and worker
+    processes of --parallel.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.phases.clear()
+            self.counters.clear()
+
+    def merge(self, data):
+        """
+        Add the phases and counters of as_dict() output, e.g. those of a
+        worker process (see compare_context_objects_worker())
+        """
+        with self.lock:
+            for name, elapsed in data["phases"].items():
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            for name, value in data["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "total": round(time.monotonic() - self.start, 6),
+                "phases": {name: round(t, 6) for name, t in self.phases.items()},
+                "counters": dict(self.counters),
+            }
+
+    def log(self, logfmt=False):
+        """
+        Log the statistics, as logfmt fields when logfmt is set
+        """
+        data = self.as_dict()
+        fields = OrderedDict(total_seconds=round(data["total"], 3))
+        for name, elapsed in data["phases"].items():
+            fields[f"{name}_seconds"] = round(elapsed, 3)
+        fields.update(data["counters"])
+
+        if logfmt:
+            log.info("reload statistics", extra=fields)
+        else:
+            log.info(
+                "reload statistics: "
+                + " ".join(f"{name}={value}" for name, value in fields.items())
+            )
+
+
+stats = Stats()
+
+
+def normalize_line(line):
+    """
+    Return line, with duplicate whitespaces already compressed, as FRR
+    renders it, see line_normalizers
+    """
+    if ":" in line:
+        line = run_profiled(get_normalized_mac_ip_line, line)
+
+    normalizers = line_normalizers.get(line.split(" ", 1)[0])
+    if normalizers is None:
+        return line
+
+    for prefix, needle, normalizer in normalizers:
+        if line.startswith(prefix) and needle in line:
+            line = run_profiled(normalizer, line)
+
+    return line
+
+
+def run_profiled(func, *args):
+    """
+    Return func(*args), accounting for the time spent in profile if set
+    """
+    if profile is None:
+        return func(*args)
+
+    start = time.perf_counter()
+    result = func(*args)
+    profile.add(func.__name__, time.perf_counter() - start)
+    return result
+
+
 # This dictionary contains a tree of all commands that we know start a
 # new multi-line context. All other commands are treated either as
 # commands inside a multi-line context or as single-line contexts. This
@@ -540,6 +1046,356 @@ ctx_keywords = {
 }
 
 
+# Top level contexts that only one daemon knows about.  These are used to
+# split a reload by daemon (--parallel); everything else (interfaces, vrfs,
+# route-maps, prefix-lists, ...) is handled by several daemons and stays in
+# the shared part.  Daemons behind mgmtd are left out since their
+# configuration goes through mgmtd rather than the daemon itself.  More
+# specific prefixes must come first.
+ctx_daemons = [
+    ("router bgp ", "bgpd"),
+    ("bgp community-list ", "bgpd"),
+    ("bgp large-community-list ", "bgpd"),
+    ("bgp extcommunity-list ", "bgpd"),
+    ("bgp as-path ", "bgpd"),
+    ("rpki", "bgpd"),
+    ("router ospf6", "ospf6d"),
+    ("router ospf", "ospfd"),
+    ("router isis ", "isisd"),
+    ("router openfabric ", "fabricd"),
+    ("router eigrp ", "eigrpd"),
+    ("router babel", "babeld"),
+    ("router pim6", "pim6d"),
+    ("router pim", "pimd"),
+    ("mpls ldp", "ldpd"),
+    ("l2vpn ", "ldpd"),
+    ("bfd", "bfdd"),
+    ("pbr-map ", "pbrd"),
+]
+
+
+# Config of the daemons converted to mgmtd.  Changes to it can be committed
+# as one mgmtd transaction, see apply_transaction().  The first list is
+# matched against the top level context, the second one against the lines of
+# vrf and interface contexts.
+mgmtd_ctx_prefixes = ("ip route ", "ipv6 route ", "router rip")
+mgmtd_line_prefixes = ("ip route ", "ipv6 route ", "ip rip ", "ipv6 ripng ")
+
+
+def is_mgmtd_line(ctx_keys, line):
+    """
+    Return True if the line of the context is handled by mgmtd
+    """
+    key = ctx_keys[0]
+    if key.startswith("no "):
+        # A deleted top level line, see compare_context_objects()
+        key = key[3:]
+    if key.startswith(mgmtd_ctx_prefixes):
+        return True
+
+    return bool(
+        line
+        and len(ctx_keys) == 1
+        and ctx_keys[0].startswith(("vrf ", "interface "))
+        and line.startswith(mgmtd_line_prefixes)
+    )
+
+
+def get_context_daemon(ctx_keys):
+    """
+    Return the daemon that owns the context, None if it is shared
+    """
+    for prefix, daemon in ctx_daemons:
+        if ctx_keys[0].startswith(prefix):
+            return daemon
+
+    return None
+
+
+# Commands that only exist in the config node, an unindented one always
+# leaves the contexts it follows.  ctx_sub_commands lists the contexts that
+# do have some of them as sub-commands.
+ctx_top_level = (
+    "access-list ",
+    "agentx",
+    "bgp ",
+    "debug ",
+    "frr ",
+    "hostname ",
+    "ip forwarding",
+    "ip import-table ",
+    "ip nht ",
+    "ip prefix-list ",
+    "ip protocol ",
+    "ip route ",
+    "ipv6 forwarding",
+    "ipv6 import-table ",
+    "ipv6 nht ",
+    "ipv6 prefix-list ",
+    "ipv6 protocol ",
+    "ipv6 route ",
+    "log ",
+    "no bgp ",
+    "password ",
+    "service ",
+)
+
+ctx_sub_commands = {
+    "router bgp ": ("bgp ", "no bgp "),
+    "router isis ": ("hostname ",),
+    "router openfabric ": ("hostname ",),
+    "vrf ": ("ip ", "ipv6 "),
+}
+
+
+def _is_top_level(contexts, line):
+    """
+    Return True if line is a command of the config node that none of the
+    contexts (the lines entering them) has as sub-command
+    """
+    if not line.startswith(ctx_top_level):
+        return False
+
+    for context in contexts:
+        for prefix, sub_commands in ctx_sub_commands.items():
+            if context.startswith(prefix) and line.startswith(sub_commands):
+                return False
+
+    return True
+
+
+def _match_ctx_keyword(keywords, line, walk_up):
+    """
+    Return the sub-keywords of the context entered by line, None if line
+    does not enter a context from keywords.  When walking up, a keyword
+    that could also be the start of an ordinary command ("segment-routing"
+    vs "segment-routing on") must match the whole line.
+    """
+    for k, v in keywords.items():
+        if not line.startswith(k):
+            continue
+        if k == "candidate-path " and "explicit" in line:
+            return None
+        if walk_up and not k.endswith(" ") and not k.startswith("router "):
+            if line != k:
+                continue
+        return v
+
+    return None
+
+
+def mark_config(text):
+    """
+    Pure python version of "vtysh -m": copy the configuration, adding the
+    "exit" lines vtysh would emit when a command walks up from the current
+    node, and an "end" after "exit-vrf" and at the very end.
+
+    vtysh finds the node of a command in its command graph.  This uses the
+    context keywords (ctx_keywords) to know which lines enter a node, and
+    indentation to know when a line leaves one: once a context has indented
+    sub-commands, a line that is not indented deeper than the context ends
+    it.  In contexts without indentation, a line entering a node from a
+    parent context walks up, and "!" or a command of the config node only
+    (ctx_top_level) at the start of a line go back to the config node.
+    Commands are not validated.
+    """
+    out = []
+    # One (keywords, indent of the line entering the context, whether the
+    # sub-commands are indented, line entering the context) per context
+    # entered
+    stack = []
+
+    for line in text.splitlines(True):
+        if not line.endswith("\n"):
+            line += "\n"
+        stripped = line.strip()
+
+        if stripped == "!" and line[0] == "!":
+            while stack and not stack[-1][2] and stack[-1][1] == 0:
+                out.append("exit\n")
+                stack.pop()
+
+        if not stripped or stripped[0] in "!#":
+            out.append(line)
+            continue
+
+        # vtysh ignores "end", it places its own
+        if stripped == "end":
+            continue
+
+        if stripped.startswith("exit"):
+            out.append(line)
+            if stripped == "exit-vrf":
+                out.append("end\n")
+            if stack:
+                stack.pop()
+            continue
+
+        indent = len(line) - len(line.lstrip())
+        stripped = " ".join(stripped.split())
+
+        while stack and stack[-1][2] and indent <= stack[-1][1]:
+            out.append("exit\n")
+            stack.pop()
+
+        if stack and stack[-1][2] is None:
+            stack[-1][2] = indent > stack[-1][1]
+
+        if (
+            stack
+            and not indent
+            and not stack[-1][2]
+            and _is_top_level([ctx[3] for ctx in stack], stripped)
+        ):
+            out.extend(["exit\n"] * len(stack))
+            del stack[:]
+
+        keywords = stack[-1][0] if stack else ctx_keywords
+        sub_keywords = _match_ctx_keyword(keywords, stripped, False)
+
+        if sub_keywords is None and stack and not stack[-1][2]:
+            for depth in range(len(stack) - 1, -1, -1):
+                keywords = stack[depth - 1][0] if depth else ctx_keywords
+                sub_keywords = _match_ctx_keyword(keywords, stripped, True)
+                if sub_keywords is not None:
+                    for _ in range(len(stack) - depth):
+                        out.append("exit\n")
+                    del stack[depth:]
+                    break
+
+        out.append(line)
+        if sub_keywords is not None:
+            stack.append([sub_keywords, indent, None, stripped])
+
+    out.append("\nend\n")
+    return "".join(out)
+
+
+def split_config_blocks(text):
+    """
+    Split configuration text into its top-level blocks: a block starts with
+    each line that is not indented, comment and exit lines excepted, and
+    runs up to the next one.  This expects the indented layout written by
+    vtysh, sub-commands must not start at the beginning of a line.
+
+    Returns None if they do: an unindented line which follows a context
+    that no "exit" (or "!" once it has indented lines) has closed, and which
+    neither enters another context nor is a command of the config node only
+    (see _is_top_level()), is taken as a sub-command of that context.
+    """
+    blocks = []
+    block = []
+    # The line entering the context still open, and whether it has
+    # indented lines
+    context = None
+    indented = False
+
+    for line in text.splitlines(True):
+        if not line.endswith("\n"):
+            line += "\n"
+        stripped = " ".join(line.split())
+
+        if not stripped or stripped[0] == "#":
+            pass
+        elif line[0] in " \t":
+            indented = True
+        elif stripped[0] == "!":
+            if indented:
+                context = None
+        elif stripped in ("end", "exit", "exit-vrf"):
+            context = None
+        elif _match_ctx_keyword(ctx_keywords, stripped, False) is not None:
+            context = stripped
+            indented = False
+        elif context is None or _is_top_level([context], stripped):
+            context = None
+        else:
+            return None
+
+        if (
+            block
+            and line[0] not in " \t\r\n!#"
+            and line.strip() not in ("end", "exit", "exit-vrf")
+        ):
+            blocks.append("".join(block))
+            block = []
+
+        block.append(line)
+
+    if block:
+        blocks.append("".join(block))
+
+    return blocks
+
+
+class ConfigCache(object):
+    """
+    The contexts parsed from each top-level block of the configuration last
+    applied by "--incremental", keyed by the hash of the block text.  tag
+    identifies what the cache is valid for (vtysh binary, marker, version of
+    this script, daemon, ...), a cache saved with another tag is ignored.
+    """
+
+    version = 1
+
+    def __init__(self, filename, tag):
+        self.filename = filename
+        self.tag = tag
+        # Hashes of the blocks, in the order of the configuration
+        self.order = []
+        # Hash -> list of (keys, lines) of the contexts of the block
+        self.blocks = {}
+
+    def load(self):
+        try:
+            with open(self.filename) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            log.info(f"Not using config cache {self.filename}: {e}")
+            return
+
+        if data.get("version") != self.version or data.get("tag") != self.tag:
+            log.info(f"Not using config cache {self.filename}: out of date")
+            return
+
+        self.order = data["order"]
+        self.blocks = data["blocks"]
+
+    def update(self, order, blocks):
+        """
+        Replace the content of the cache.  Returns the top-level keys of the
+        contexts of the blocks that were added or removed, or None if the
+        cache was empty.
+        """
+        touched = None
+        if self.order:
+            touched = set()
+            for digest in set(self.order).symmetric_difference(order):
+                for key, _ in blocks.get(digest) or self.blocks[digest]:
+                    touched.add(key[0])
+
+        self.order = order
+        self.blocks = blocks
+
+        return touched
+
+    def save(self):
+        data = {
+            "version": self.version,
+            "tag": self.tag,
+            "order": self.order,
+            "blocks": self.blocks,
+        }
+        filename = self.filename + ".tmp"
+        with open(filename, "w") as fh:
+            json.dump(data, fh)
+        os.replace(filename, self.filename)
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+
 class Config(object):
     """
     A frr configuration is stored in a Config object. A Config object
@@ -547,9 +1403,9 @@ class Config(object):
     ('router ospf' for example) are our dictionary key.
     """
 
-    def __init__(self, vtysh):
+    def __init__(self, vtysh, contexts=None):
         self.lines = []
-        self.contexts = OrderedDict()
+        self.contexts = OrderedDict(contexts or ())
         self.vtysh = vtysh
 
     def load_from_file(self, filename):
@@ -560,116 +1416,181 @@ class Config(object):
         """
         log.info(f"Loading Config object from file {filename}")
 
-        file_output = self.vtysh.mark_file(filename)
+        self.load_marked(self.vtysh.mark_file(filename))
+
+    def load_from_text(self, text):
+        """
+        Same as load_from_file(), for configuration text already in memory
+        """
+        self.load_marked(self.vtysh.mark_text(text))
+
+    def load_marked(self, file_output):
+        """
+        Slurp configuration already marked by "vtysh -m" into internal memory
+        """
+        with stats.phase("parse"):
+            vrf_context = None
+            pim_vrfs = []
+
+            lines = file_output.split("\n")
+            stats.count("lines_parsed", len(lines))
+            for line in lines:
+                # Compress duplicate whitespaces
+                line = " ".join(line.split())
+
+                # Detect when we are within a vrf context for converting legacy PIM commands
+                if vrf_context:
+                    if line in ("exit-vrf", "exit", "end"):
+                        vrf_context = None
+                elif line.startswith("vrf "):
+                    re_vrf = re_vrf_context.match(line)
+                    if re_vrf:
+                        vrf_context = re_vrf.group(1)
+
+                if line.startswith("ip"):
+                    line = run_profiled(self.move_pim_line, line, vrf_context, pim_vrfs)
+
+                line = normalize_line(line)
+
+                if line.startswith("ip route ") or line.startswith("ipv6 route "):
+                    line = run_profiled(self.move_vrf_static_route_line, line)
+
+                self.lines.append(line)
 
-        vrf_context = None
-        pim_vrfs = []
+            if len(pim_vrfs) > 0:
+                self.lines.append(pim_vrfs)
 
-        for line in file_output.split("\n"):
-            line = line.strip()
+            run_profiled(self.load_contexts)
 
-            # Compress duplicate whitespaces
-            line = " ".join(line.split())
+    def move_pim_line(self, line, vrf_context, pim_vrfs):
+        """
+        Move a legacy global pim command under its router pim context.  The
+        ones found in a vrf context are queued on pim_vrfs.  Returns what is
+        left of the line.
+        """
+        re_pim = re_pim_legacy.match(line) or re_pim_legacy_global.match(line)
+        if re_pim and re_pim.group(2):
+            router_pim = "router pim"
+            if re_pim.group(1):
+                router_pim += "6"
+            if vrf_context:
+                router_pim += " vrf " + vrf_context
 
-            # Detect when we are within a vrf context for converting legacy PIM commands
             if vrf_context:
-                re_vrf = re.match("^(exit-vrf|exit|end)$", line)
-                if re_vrf:
-                    vrf_context = None
+                pim_vrfs.append(router_pim)
+                pim_vrfs.append(re_pim.group(2))
+                pim_vrfs.append("exit")
+                line = "# PIM VRF LINE MOVED TO ROUTER PIM"
             else:
-                re_vrf = re.match("^vrf ([a-z]+)$", line)
-                if re_vrf:
-                    vrf_context = re_vrf.group(1)
-
-            # Detect legacy pim commands that need to move under the router pim context
-            re_pim = re.match(
-                "^ip(v6)? pim ((ecmp|join|keep|mlag|packets|register|rp|send|spt|ssm).*)$",
-                line,
-            )
-            if re_pim and re_pim.group(2):
-                router_pim = "router pim"
-                if re_pim.group(1):
-                    router_pim += "6"
-                if vrf_context:
-                    router_pim += " vrf " + vrf_context
+                self.lines.append(router_pim)
+                self.lines.append(re_pim.group(2))
+                line = "exit"
 
-                if vrf_context:
-                    pim_vrfs.append(router_pim)
-                    pim_vrfs.append(re_pim.group(2))
-                    pim_vrfs.append("exit")
-                    line = "# PIM VRF LINE MOVED TO ROUTER PIM"
-                else:
-                    self.lines.append(router_pim)
-                    self.lines.append(re_pim.group(2))
-                    line = "exit"
-
-            re_pim = re.match("^ip(v6)? ((ssmpingd|msdp).*)$", line)
-            if re_pim and re_pim.group(2):
-                router_pim = "router pim"
-                if re_pim.group(1):
-                    router_pim += "6"
-                if vrf_context:
-                    router_pim += " vrf " + vrf_context
+        return line
 
-                if vrf_context:
-                    pim_vrfs.append(router_pim)
-                    pim_vrfs.append(re_pim.group(2))
-                    pim_vrfs.append("exit")
-                    line = "# PIM VRF LINE MOVED TO ROUTER PIM"
-                else:
-                    self.lines.append(router_pim)
-                    self.lines.append(re_pim.group(2))
-                    line = "exit"
+    def move_vrf_static_route_line(self, line):
+        """
+        vrf static routes can be added in two ways. The old way is:
 
-            # Remove 'vrf <vrf_name>' from 'interface <x> vrf <vrf_name>'
-            if line.startswith("interface ") and "vrf" in line:
-                line = get_normalized_interface_vrf(line)
+        "ip route x.x.x.x/x y.y.y.y vrf <vrfname>"
 
-            if ":" in line:
-                line = get_normalized_mac_ip_line(line)
+        but it's rendered in the configuration as the new way::
 
-            if "ebgp-multihop" in line:
-                line = get_normalized_ebgp_multihop_line(line)
+        vrf <vrf-name>
+         ip route x.x.x.x/x y.y.y.y
+         exit-vrf
 
-            if line.startswith("aggregate-address "):
-                line = get_normalized_aggregate_address_line(line)
+        this difference causes frr-reload to not consider them a
+        match and delete vrf static routes incorrectly.
+        fix the old way to match new "show running" output so a
+        proper match is found.
+        """
+        if " vrf " in line:
+            newline = line.split(" ")
+            vrf_index = newline.index("vrf")
+            vrf_ctx = newline[vrf_index] + " " + newline[vrf_index + 1]
+            del newline[vrf_index : vrf_index + 2]
+            newline = " ".join(newline)
+            self.lines.append(vrf_ctx)
+            self.lines.append(newline)
+            self.lines.append("exit-vrf")
+            line = "end"
 
-            if line.startswith("ip route ") or line.startswith("ipv6 route "):
-                line = get_normalized_static_route_line(line)
+        return line
 
-            # vrf static routes can be added in two ways. The old way is:
-            #
-            # "ip route x.x.x.x/x y.y.y.y vrf <vrfname>"
-            #
-            # but it's rendered in the configuration as the new way::
-            #
-            # vrf <vrf-name>
-            #  ip route x.x.x.x/x y.y.y.y
-            #  exit-vrf
-            #
-            # this difference causes frr-reload to not consider them a
-            # match and delete vrf static routes incorrectly.
-            # fix the old way to match new "show running" output so a
-            # proper match is found.
-            if (
-                line.startswith("ip route ") or line.startswith("ipv6 route ")
-            ) and " vrf " in line:
-                newline = line.split(" ")
-                vrf_index = newline.index("vrf")
-                vrf_ctx = newline[vrf_index] + " " + newline[vrf_index + 1]
-                del newline[vrf_index : vrf_index + 2]
-                newline = " ".join(newline)
-                self.lines.append(vrf_ctx)
-                self.lines.append(newline)
-                self.lines.append("exit-vrf")
-                line = "end"
+    def load_from_file_incremental(self, filename, cache):
+        """
+        Same as load_from_file(), but only the top-level blocks of filename
+        (see split_config_blocks()) missing from cache are marked and parsed,
+        the contexts of the other blocks are taken from the cache.
+
+        Returns the top-level keys of the contexts which may differ from the
+        configuration cache was saved for, or None if cache was empty.
+        """
+        log.info(f"Loading Config object incrementally from file {filename}")
+
+        with open(filename) as fh:
+            blocks = split_config_blocks(fh.read())
+        if blocks is None:
+            log.info(f"{filename} has unindented sub-commands, loading it whole")
+            return self._load_from_file_uncached(filename, cache)
+
+        order = [hashlib.sha256(block.encode()).hexdigest() for block in blocks]
+        contexts = {}
+        new_blocks = OrderedDict()
+        for digest, block in zip(order, blocks):
+            if digest in cache.blocks:
+                contexts[digest] = cache.blocks[digest]
+            else:
+                new_blocks[digest] = block
+
+        if new_blocks:
+            log.info(f"Marking {len(new_blocks)} of {len(blocks)} blocks")
+
+            # Mark all the new blocks with one vtysh, the separators are
+            # comments and are copied as is to the output.
+            separator = "! frr-reload block\n"
+            text = "".join(separator + block for block in new_blocks.values())
+            chunks = self.vtysh.mark_text(text).split(separator)[1:]
+            if len(chunks) != len(new_blocks):
+                raise VtyshException("failed to split the marked configuration")
+
+            configs = []
+            for chunk in chunks:
+                config = Config(None)
+                config.load_marked(chunk)
+                if len(set(key[0] for key in config.contexts)) > 1:
+                    # Not a block on its own, e.g. a sub-command the marker
+                    # found a context for only with the lines before it
+                    log.info(f"{filename} has blocks of several contexts")
+                    return self._load_from_file_uncached(filename, cache)
+                configs.append(config)
+
+            for digest, config in zip(new_blocks, configs):
+                self.lines.extend(config.lines)
+                contexts[digest] = [
+                    (list(key), ctx.lines) for key, ctx in iteritems(config.contexts)
+                ]
 
-            self.lines.append(line)
+        for digest in order:
+            for key, lines in contexts[digest]:
+                key = tuple(key)
+                if key in self.contexts:
+                    self.contexts[key].add_lines(list(lines))
+                else:
+                    self.contexts[key] = Context(key, list(lines))
 
-        if len(pim_vrfs) > 0:
-            self.lines.append(pim_vrfs)
+        return cache.update(order, contexts)
 
-        self.load_contexts()
+    def _load_from_file_uncached(self, filename, cache):
+        """
+        load_from_file() for a file load_from_file_incremental() can't split
+        into blocks: the cache is emptied and None returned, the whole
+        configuration has to be compared.
+        """
+        self.load_from_file(filename)
+        cache.update([], {})
+        return None
 
     def load_from_show_running(self, daemon):
         """
@@ -681,19 +1602,55 @@ class Config(object):
 
         config_text = self.vtysh.mark_show_run(daemon)
 
-        for line in config_text.split("\n"):
-            line = line.strip()
-
-            if (
-                line == "Building configuration..."
-                or line == "Current configuration:"
-                or not line
-            ):
-                continue
+        with stats.phase("parse"):
+            for line in config_text.split("\n"):
+                line = line.strip()
 
-            self.lines.append(line)
+                if (
+                    line == "Building configuration..."
+                    or line == "Current configuration:"
+                    or not line
+                ):
+                    continue
+
+                stats.count("lines_parsed")
+                self.lines.append(line)
+
+            run_profiled(self.load_contexts)
+
+    def select(self, daemon):
+        """
+        Return a Config holding only the contexts owned by daemon, or the
+        shared contexts if daemon is None (see get_context_daemon()).
+        """
+        config = Config(self.vtysh)
+        for key, ctx in iteritems(self.contexts):
+            if get_context_daemon(key) == daemon:
+                config.contexts[key] = ctx
+
+        return config
+
+    def select_keys(self, keys):
+        """
+        Return a Config holding only the contexts whose top-level key is in
+        keys
+        """
+        config = Config(self.vtysh)
+        for key, ctx in iteritems(self.contexts):
+            if key[0] in keys:
+                config.contexts[key] = ctx
+
+        return config
+
+    def get_daemons(self):
+        """
+        Return the daemons owning at least one of the contexts, in order
+        """
+        daemons = OrderedDict()
+        for key in self.contexts:
+            daemons[get_context_daemon(key)] = True
 
-        self.load_contexts()
+        return [daemon for daemon in daemons if daemon is not None]
 
     def get_lines(self):
         """
@@ -1070,7 +2027,189 @@ def get_normalized_ipv6_line(line):
     return norm_line.strip()
 
 
+class LineSet(object):
+    """
+    An ordered collection of (ctx_keys, line) tuples, as produced by
+    compare_context_objects().
+
+    It behaves like the list it replaces (duplicates are kept, iteration is
+    in insertion order, remove() drops the first occurrence) but membership
+    tests and removals are O(1), and the lines are indexed by context and by
+    their first two words so line_exist() does not have to walk the whole
+    delta.  Iterating over a LineSet works on a snapshot, so it may be
+    modified inside the loop.
+    """
+
+    _REMOVED = object()
+
+    def __init__(self, items=()):
+        # slots in insertion order, _REMOVED for deleted entries
+        self._items = []
+        # item -> sorted list of its slots
+        self._slots = {}
+        # ctx_keys -> first word -> second word -> {line: count}
+        self._index = {}
+        # ctx_keys[0] -> count
+        self._ctx0 = {}
+        self._len = 0
+
+        self.extend(items)
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        return iter([item for item in self._items if item is not self._REMOVED])
+
+    def __contains__(self, item):
+        return item in self._slots
+
+    def __repr__(self):
+        return "LineSet(%r)" % list(self)
+
+    def __reduce__(self):
+        return (LineSet, (list(self),))
+
+    @staticmethod
+    def _words(line):
+        words = line.split(" ", 2)
+        return words[0], words[1] if len(words) > 1 else ""
+
+    def _link(self, item, slot):
+        slots = self._slots.setdefault(item, [])
+        if not slots or slots[-1] < slot:
+            slots.append(slot)
+        else:
+            bisect.insort(slots, slot)
+
+        ctx_keys, line = item
+        self._ctx0[ctx_keys[0]] = self._ctx0.get(ctx_keys[0], 0) + 1
+        if line:
+            word1, word2 = self._words(line)
+            lines = (
+                self._index.setdefault(ctx_keys, {})
+                .setdefault(word1, {})
+                .setdefault(word2, {})
+            )
+            lines[line] = lines.get(line, 0) + 1
+        self._len += 1
+
+    def _unlink(self, item):
+        slots = self._slots[item]
+        slot = slots.pop(0)
+        if not slots:
+            del self._slots[item]
+
+        ctx_keys, line = item
+        self._ctx0[ctx_keys[0]] -= 1
+        if not self._ctx0[ctx_keys[0]]:
+            del self._ctx0[ctx_keys[0]]
+        if line:
+            word1, word2 = self._words(line)
+            by_word1 = self._index[ctx_keys]
+            by_word2 = by_word1[word1]
+            lines = by_word2[word2]
+            lines[line] -= 1
+            if not lines[line]:
+                del lines[line]
+                if not lines:
+                    del by_word2[word2]
+                    if not by_word2:
+                        del by_word1[word1]
+                        if not by_word1:
+                            del self._index[ctx_keys]
+        self._len -= 1
+
+        return slot
+
+    def _compact(self):
+        items = list(self)
+        self._items = []
+        self._slots = {}
+        self._index = {}
+        self._ctx0 = {}
+        self._len = 0
+        self.extend(items)
+
+    def append(self, item):
+        self._items.append(item)
+        self._link(item, len(self._items) - 1)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def remove(self, item):
+        """
+        Remove the first occurrence of item, ValueError if there is none
+        """
+        if item not in self._slots:
+            raise ValueError("%r not in LineSet" % (item,))
+
+        self._items[self._unlink(item)] = self._REMOVED
+
+        # Reclaim the removed slots once they outnumber the live ones
+        if len(self._items) > 1024 and len(self._items) > 2 * self._len:
+            self._compact()
+
+    def replace(self, item, new_item):
+        """
+        Replace the first occurrence of item by new_item, in place
+        """
+        if item not in self._slots:
+            raise ValueError("%r not in LineSet" % (item,))
+
+        slot = self._unlink(item)
+        self._items[slot] = new_item
+        self._link(new_item, slot)
+
+    def move_to_end(self, item):
+        """
+        Move the first occurrence of item to the end
+        """
+        self.remove(item)
+        self.append(item)
+
+    def count_ctx0(self, key):
+        """
+        Number of entries whose first context key is key
+        """
+        return self._ctx0.get(key, 0)
+
+    def exists(self, target_ctx_keys, target_line, exact_match=True):
+        """
+        Is there a line in target_ctx_keys that is target_line (exact_match)
+        or starts with it?
+        """
+        if exact_match:
+            return (target_ctx_keys, target_line) in self._slots
+
+        by_word1 = self._index.get(target_ctx_keys)
+        if not by_word1:
+            return False
+
+        words = target_line.split(" ", 2)
+        if len(words) == 1:
+            return any(word1.startswith(words[0]) for word1 in by_word1)
+
+        by_word2 = by_word1.get(words[0])
+        if not by_word2:
+            return False
+
+        if len(words) == 2:
+            return any(word2.startswith(words[1]) for word2 in by_word2)
+
+        lines = by_word2.get(words[1], {})
+        return any(line.startswith(target_line) for line in lines)
+
+
 def line_exist(lines, target_ctx_keys, target_line, exact_match=True):
+    if isinstance(lines, LineSet):
+        return lines.exists(target_ctx_keys, target_line, exact_match)
+
     for ctx_keys, line in lines:
         if ctx_keys == target_ctx_keys:
             if exact_match:
@@ -1110,8 +2249,7 @@ def bgp_delete_inst_move_line(lines_to_del):
                 and not line
                 and "vrf" not in ctx_keys[0]
             ):
-                lines_to_del.remove((ctx_keys, line))
-                lines_to_del.append((ctx_keys, line))
+                lines_to_del.move_to_end((ctx_keys, line))
 
 
 def bgp_delete_nbr_remote_as_line(lines_to_add):
@@ -1220,13 +2358,14 @@ def bgp_remove_neighbor_cfg(lines_to_del, del_nbr_dict):
             and ((line.startswith("neighbor ") or line.startswith("no neighbor ")))
         ):
             if ctx_keys[0] in del_nbr_dict:
-                for nbr in del_nbr_dict[ctx_keys[0]]:
-                    re_nbr_pg = re.search(r"neighbor (\S+) .*peer-group (\S+)", line)
-                    nb_exp = r"neighbor %s .*" % nbr
-                    if not re_nbr_pg:
-                        re_nb = re.search(nb_exp, line)
-                        if re_nb:
-                            lines_to_del_to_del.append((ctx_keys, line))
+                re_nbr_pg = re.search(r"neighbor (\S+) .*peer-group (\S+)", line)
+                re_nb = re.search(r"neighbor (\S+) ", line)
+                if (
+                    not re_nbr_pg
+                    and re_nb
+                    and re_nb.group(1) in del_nbr_dict[ctx_keys[0]]
+                ):
+                    lines_to_del_to_del.append((ctx_keys, line))
 
     for ctx_keys, line in lines_to_del_to_del:
         lines_to_del.remove((ctx_keys, line))
@@ -1347,8 +2486,7 @@ def bgp_delete_move_lines(lines_to_add, lines_to_del):
 
     # move neighbor remote-as lines at the end
     for ctx_keys, line in lines_to_del_to_app:
-        lines_to_del.remove((ctx_keys, line))
-        lines_to_del.append((ctx_keys, line))
+        lines_to_del.move_to_end((ctx_keys, line))
 
     if found_pg_del_cmd == False:
         bgp_delete_inst_move_line(lines_to_del)
@@ -1365,15 +2503,17 @@ def bgp_delete_move_lines(lines_to_add, lines_to_del):
             and line.startswith("neighbor ")
         ):
             if ctx_keys[0] in del_dict:
-                for pg_key in del_dict[ctx_keys[0]]:
-                    # 'neighbor <peer> [interface] peer-group <pg_name>'
-                    nb_pg = r"neighbor (\S+) .*peer-group %s$" % pg_key
-                    re_nbr_pg = re.search(nb_pg, line)
-                    if (
-                        re_nbr_pg
-                        and re_nbr_pg.group(1) not in del_dict[ctx_keys[0]][pg_key]
-                    ):
-                        del_dict[ctx_keys[0]][pg_key].append(re_nbr_pg.group(1))
+                # 'neighbor <peer> [interface] peer-group <pg_name>'
+                re_nbr_pg = re.search(r"neighbor (\S+) .*peer-group (\S+)$", line)
+                if re_nbr_pg and re_nbr_pg.group(2) in del_dict[ctx_keys[0]]:
+                    pg_nbrs = del_dict[ctx_keys[0]][re_nbr_pg.group(2)]
+                    if re_nbr_pg.group(1) not in pg_nbrs:
+                        pg_nbrs.append(re_nbr_pg.group(1))
+
+    # Index the peers of the deleted peer-groups by bgp instance
+    del_pg_nbrs = dict()
+    for ctx_key0, pgs in del_dict.items():
+        del_pg_nbrs[ctx_key0] = set(nbr for pg in pgs for nbr in pgs[pg])
 
     lines_to_del_to_app = []
     for ctx_keys, line in lines_to_del:
@@ -1383,25 +2523,20 @@ def bgp_delete_move_lines(lines_to_add, lines_to_del):
             and line.startswith("neighbor ")
         ):
             if ctx_keys[0] in del_dict:
-                for pg in del_dict[ctx_keys[0]]:
-                    for nbr in del_dict[ctx_keys[0]][pg]:
-                        nb_exp = r"neighbor %s .*" % nbr
-                        re_nb = re.search(nb_exp, line)
-                        # add peer configs to delete list.
-                        if re_nb and line not in lines_to_del_to_del:
-                            lines_to_del_to_del.append((ctx_keys, line))
-
-                    pg_exp = "neighbor %s peer-group$" % pg
-                    re_pg = re.match(pg_exp, line)
-                    if re_pg:
-                        lines_to_del_to_app.append((ctx_keys, line))
+                # add peer configs to delete list.
+                re_nb = re.search(r"neighbor (\S+) ", line)
+                if re_nb and re_nb.group(1) in del_pg_nbrs[ctx_keys[0]]:
+                    lines_to_del_to_del.append((ctx_keys, line))
+
+                re_pg = re.match(r"neighbor (\S+) peer-group$", line)
+                if re_pg and re_pg.group(1) in del_dict[ctx_keys[0]]:
+                    lines_to_del_to_app.append((ctx_keys, line))
 
     for ctx_keys, line in lines_to_del_to_del:
         lines_to_del.remove((ctx_keys, line))
 
     for ctx_keys, line in lines_to_del_to_app:
-        lines_to_del.remove((ctx_keys, line))
-        lines_to_del.append((ctx_keys, line))
+        lines_to_del.move_to_end((ctx_keys, line))
 
     bgp_delete_inst_move_line(lines_to_del)
 
@@ -1417,9 +2552,7 @@ def pim_delete_move_lines(lines_to_add, lines_to_del):
     pim_disable = []
     lines_to_del_to_del = []
 
-    index = -1
     for ctx_keys, line in lines_to_del:
-        index = index + 1
         if ctx_keys[0].startswith("interface") and line and line == "ip pim":
             pim_disable.append(ctx_keys[0])
 
@@ -1429,8 +2562,7 @@ def pim_delete_move_lines(lines_to_add, lines_to_del):
             if pim_msdp_peer:
                 source_sub_str = "source %s" % pim_msdp_peer.group(2)
                 new_line = line.replace(source_sub_str, "").strip()
-                lines_to_del.remove((ctx_keys, line))
-                lines_to_del.insert(index, (ctx_keys, new_line))
+                lines_to_del.replace((ctx_keys, line), (ctx_keys, new_line))
 
     for ctx_keys, line in lines_to_del:
         if (
@@ -1465,21 +2597,30 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
     lines_to_del_to_del = []
     lines_to_add_vrf_no_static_route = []
 
-    index = -1
+    # BGP lines being added that the neighbor bfd and route-map checks below
+    # compare against, so they do not have to walk all of lines_to_add for
+    # every deleted neighbor line.
+    bgp_bfd_lines_to_add = []
+    bgp_rm_lines_to_add = []
+    for ctx_keys, line in lines_to_add:
+        if ctx_keys[0].startswith("router bgp") and line:
+            if " bfd " in line:
+                bgp_bfd_lines_to_add.append((ctx_keys, line))
+            if "route-map" in line:
+                bgp_rm_lines_to_add.append((ctx_keys, line))
+
     for ctx_keys, line in lines_to_del:
         deleted = False
 
         # no form of route-map description command only
         # accept 'no description', replace 'no description blah'
         # to just 'no description'.
-        index = index + 1
         if (
             ctx_keys[0].startswith("route-map")
             and line
             and line.startswith("description ")
         ):
-            lines_to_del.remove((ctx_keys, line))
-            lines_to_del.insert(index, (ctx_keys, "description"))
+            lines_to_del.replace((ctx_keys, line), (ctx_keys, "description"))
 
         # interface x ; description blah
         # no form of description does not accept any argument,
@@ -1489,8 +2630,7 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
             and line
             and line.startswith("description ")
         ):
-            lines_to_del.remove((ctx_keys, line))
-            lines_to_del.insert(index, (ctx_keys, "description"))
+            lines_to_del.replace((ctx_keys, line), (ctx_keys, "description"))
 
         # If there is a change in the segment routing block ranges, do it
         # in-place, to avoid requesting spurious label chunks which might fail
@@ -1587,19 +2727,19 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
                     bfd_nbr = r"neighbor %s" % nbr
                     bfd_search_string = bfd_nbr + r" bfd (\S+) (\S+) (\S+)"
 
-                    for ctx_keys, add_line in lines_to_add:
-                        if ctx_keys[0].startswith("router bgp"):
+                    for ctx_keys_al, add_line in bgp_bfd_lines_to_add:
+                        if ctx_keys_al[0].startswith("router bgp") and add_line:
                             re_add_nbr_bfd_timers = re.search(
                                 bfd_search_string, add_line
                             )
 
                             if re_add_nbr_bfd_timers:
                                 found_add_bfd_nbr = line_exist(
-                                    lines_to_add, ctx_keys, bfd_nbr, False
+                                    lines_to_add, ctx_keys_al, bfd_nbr, False
                                 )
 
                                 if found_add_bfd_nbr:
-                                    lines_to_del_to_del.append((ctx_keys, line))
+                                    lines_to_del_to_del.append((ctx_keys_al, line))
 
                 # Neighbor changes of route-maps need to be accounted for in
                 # that we do not want to do a `no route-map...` `route-map
@@ -1617,7 +2757,7 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
                     dir = re_nbr_rm.group(3)
                     search = r"neighbor%sroute-map(.*)%s" % (neighbor_name, dir)
                     save_line = "EMPTY"
-                    for ctx_keys_al, add_line in lines_to_add:
+                    for ctx_keys_al, add_line in bgp_rm_lines_to_add:
                         if ctx_keys_al[0].startswith("router bgp"):
                             rm_match = None
                             if add_line:
@@ -1770,11 +2910,10 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
                 + re_acl_pfxlst.group(5)
                 + re_acl_pfxlst.group(6)
             )
-            for ctx in lines_to_add:
-                if ctx[0][0] == tmpline:
-                    lines_to_del_to_del.append((ctx_keys, None))
-                    lines_to_add_to_del.append(((tmpline,), None))
-                    found = True
+            for _ in range(lines_to_add.count_ctx0(tmpline)):
+                lines_to_del_to_del.append((ctx_keys, None))
+                lines_to_add_to_del.append(((tmpline,), None))
+                found = True
             # If prefix-lists or access-lists are being deleted and not added
             # (see comment above), add command with 'no' to lines_to_add and
             # remove from lines_to_del to improve scaling performance.
@@ -1804,11 +2943,10 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
                 + re_bgp_lists.group(6)
                 + re_bgp_lists.group(7)
             )
-            for ctx in lines_to_add:
-                if ctx[0][0] == tmpline:
-                    lines_to_del_to_del.append((ctx_keys, None))
-                    lines_to_add_to_del.append(((tmpline,), None))
-                    found = True
+            for _ in range(lines_to_add.count_ctx0(tmpline)):
+                lines_to_del_to_del.append((ctx_keys, None))
+                lines_to_add_to_del.append(((tmpline,), None))
+                found = True
             if found is False:
                 add_cmd = ("no " + ctx_keys[0],)
                 lines_to_add.append((add_cmd, None))
@@ -1833,11 +2971,10 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
                 + re_bgp_as_path.group(6)
                 + re_bgp_as_path.group(7)
             )
-            for ctx in lines_to_add:
-                if ctx[0][0] == tmpline:
-                    lines_to_del_to_del.append((ctx_keys, None))
-                    lines_to_add_to_del.append(((tmpline,), None))
-                    found = True
+            for _ in range(lines_to_add.count_ctx0(tmpline)):
+                lines_to_del_to_del.append((ctx_keys, None))
+                lines_to_add_to_del.append(((tmpline,), None))
+                found = True
             if found is False:
                 add_cmd = ("no " + ctx_keys[0],)
                 lines_to_add.append((add_cmd, None))
@@ -1924,7 +3061,7 @@ def ignore_delete_re_add_lines(lines_to_add, lines_to_del):
                         lines_to_del_to_del.append((ctx_keys, line))
                         lines_to_add_to_del.append((tmp_ctx_keys, line))
 
-    lines_to_add = lines_to_add_vrf_no_static_route + lines_to_add
+    lines_to_add = LineSet(lines_to_add_vrf_no_static_route + list(lines_to_add))
 
     for ctx_keys, line in lines_to_del_to_del:
         try:
@@ -2003,8 +3140,8 @@ def compare_context_objects(newconf, running):
     """
 
     # Compare the two Config objects to find the lines that we need to add/del
-    lines_to_add = []
-    lines_to_del = []
+    lines_to_add = LineSet()
+    lines_to_del = LineSet()
     pollist_to_del = []
     seglist_to_del = []
     pceconf_to_del = []
@@ -2250,13 +3387,508 @@ def compare_context_objects(newconf, running):
     if len(candidates_to_add) > 0:
         lines_to_add.extend(candidates_to_add)
 
-    lines_to_add, lines_to_del = ignore_delete_re_add_lines(lines_to_add, lines_to_del)
-    lines_to_add, lines_to_del = delete_move_lines(lines_to_add, lines_to_del)
-    lines_to_add, lines_to_del = ignore_unconfigurable_lines(lines_to_add, lines_to_del)
+    for fixup in (
+        ignore_delete_re_add_lines,
+        delete_move_lines,
+        ignore_unconfigurable_lines,
+    ):
+        with stats.phase(fixup.__name__):
+            lines_to_add, lines_to_del = fixup(lines_to_add, lines_to_del)
 
     return (lines_to_add, lines_to_del)
 
 
+def compare_context_objects_worker(newconf, running):
+    """
+    compare_context_objects() for a worker of a ProcessPoolExecutor: the
+    statistics it gathers stay in the worker process, so they are returned
+    with its result, as Stats.as_dict() output for Stats.merge().
+    """
+    # A forked worker starts with a copy of the statistics of its parent
+    stats.reset()
+    return compare_context_objects(newconf, running), stats.as_dict()
+
+
+def delta_to_dict(lines_to_add, lines_to_del):
+    """
+    Return the output of compare_context_objects() as a dictionary that can
+    be serialized to JSON:
+
+    {
+        "delete": [{"context": [...], "line": ..., "commands": [...]}, ...],
+        "add": [...]
+    }
+
+    The commands are those "--test" prints, with their indentation.
+    """
+    delta = {"delete": [], "add": []}
+    for name, lines, delete in (
+        ("delete", lines_to_del, True),
+        ("add", lines_to_add, False),
+    ):
+        for ctx_keys, line in lines:
+            if line == "!":
+                continue
+
+            delta[name].append(
+                {
+                    "context": list(ctx_keys),
+                    "line": line,
+                    "commands": lines_to_config(ctx_keys, line, delete),
+                }
+            )
+
+    return delta
+
+
+def compare_config_text(new_text, running_text, vtysh=None):
+    """
+    Compute the changes needed to go from the running_text configuration to
+    new_text, both in the frr.conf format.  The configurations are marked
+    with vtysh if given (a Vtysh object), else with the vtysh found in $PATH.
+    mark_config() is only used, without starting any process, when there is
+    no vtysh: it does not know the commands of each node as vtysh does, so
+    it may place some hand written lines in the wrong context.
+
+    Returns the changes as delta_to_dict() does.
+    """
+    if vtysh is None:
+        path = shutil.which("vtysh")
+        if path is not None:
+            vtysh = Vtysh(os.path.dirname(path))
+        else:
+            vtysh = Vtysh(marker=mark_config)
+
+    newconf = Config(vtysh)
+    newconf.load_from_text(new_text)
+    running = Config(vtysh)
+    running.load_from_text(running_text)
+
+    return delta_to_dict(*compare_context_objects(newconf, running))
+
+
+def delete_fallback(vtysh, cmd, stdouts):
+    """
+    Retry a "no" command that failed, dropping its last word on each attempt.
+
+    Some commands in frr are picky about taking a "no" of the entire line.
+    OSPF is bad about this, you can't "no" the entire line, you have to "no"
+    only the beginning. If we hit one of these command an exception will be
+    thrown.  Catch it and remove the last '-c', 'FOO' from cmd and try again.
+
+    Example:
+    frr(config-if)# ip ospf authentication message-digest 1.1.1.1
+    frr(config-if)# no ip ospf authentication message-digest 1.1.1.1
+     % Unknown command.
+    frr(config-if)# no ip ospf authentication message-digest
+     % Unknown command.
+    frr(config-if)# no ip ospf authentication
+    frr(config-if)#
+
+    The first attempt with the full command has already been made by the
+    caller, stdouts holds its output.
+    """
+    original_cmd = list(cmd)
+    cmd = list(cmd)
+
+    while True:
+        # - Pull the last entry from cmd (this would be
+        #   'no ip ospf authentication message-digest 1.1.1.1' in
+        #   our example above
+        # - Split that last entry by whitespace and drop the last word
+        log.error(f"Failed to execute {' '.join(cmd)}")
+        last_arg = cmd[-1].split(" ")
+
+        if len(last_arg) <= 2:
+            log.error(
+                '"%s" we failed to remove this command',
+                " -- ".join(original_cmd),
+            )
+            # Log first error msg for original_cmd
+            if stdouts:
+                log.error(stdouts[0])
+            return False
+
+        new_last_arg = last_arg[0:-1]
+        cmd[-1] = " ".join(new_last_arg)
+
+        stats.count("delete_retries")
+        try:
+            vtysh(["configure"] + cmd, stdouts)
+        except VtyshException:
+            continue
+
+        log.info(f'Executed "{" ".join(cmd)}"')
+        return True
+
+
+def apply_deletes(vtysh, commands, batch_size=1000):
+    """
+    Execute the "no" commands produced by lines_to_config().
+
+    'no' commands are tricky, we can't just put them in a file and vtysh -f
+    that file since a failing one has to be retried in a shorter form (see
+    delete_fallback()).  Instead of spawning one vtysh per command, up to
+    batch_size of them are sent through a single vtysh session.  When one
+    of them fails only that command goes through the fallback, and the
+    batch resumes with the command after it.
+
+    vtysh stays in the node of the previous command, so each command is
+    wrapped in "configure" ... "end" to start from the config node like it
+    did in its own vtysh process.
+
+    Returns False if any of the commands could not be applied.
+    """
+    reload_ok = True
+    pending = list(commands)
+
+    while pending:
+        batch = pending[:batch_size]
+        flat = [line for cmd in batch for line in ["configure"] + cmd + ["end"]]
+
+        stdouts = []
+        executed = vtysh.exec_batch(flat, stdouts)
+
+        # Find the command the failing line belongs to, everything before it
+        # has been applied.
+        for index, cmd in enumerate(batch):
+            if executed == 0:
+                log.error(f"vtysh 'configure' failed\n{''.join(stdouts)}")
+                return False
+            if executed <= len(cmd):
+                break
+            if executed == len(cmd) + 1:
+                log.error(f"vtysh 'end' failed\n{''.join(stdouts)}")
+                return False
+            executed -= len(cmd) + 2
+            log.info(f'Executed "{" ".join(cmd)}"')
+        else:
+            pending = pending[len(batch) :]
+            continue
+
+        if not delete_fallback(vtysh, batch[index], stdouts):
+            reload_ok = False
+
+        pending = pending[index + 1 :]
+
+    return reload_ok
+
+
+def exec_config_lines(vtysh, rundir, lines_to_configure):
+    """
+    Apply the commands through a temporary file in rundir, with "vtysh -f"
+    """
+    random_string = "".join(
+        random.SystemRandom().choice(string.ascii_uppercase + string.digits)
+        for _ in range(6)
+    )
+
+    filename = rundir + "/reload-%s.txt" % random_string
+    log.info(f"{filename} content\n{pformat(lines_to_configure)}")
+
+    with open(filename, "w") as fh:
+        for line in lines_to_configure:
+            fh.write(line + "\n")
+    stats.count("bytes_written", os.path.getsize(filename))
+
+    try:
+        vtysh.exec_file(filename)
+    finally:
+        os.unlink(filename)
+
+
+def apply_transaction(vtysh, rundir, lines_to_del, lines_to_add):
+    """
+    Apply the deletes then the adds as one mgmtd transaction.
+
+    "vtysh -f" locks the mgmtd datastores ("configure terminal file-lock")
+    and wraps the file in XFRR_start/end_configuration, so mgmtd queues the
+    edits in the candidate datastore and validates and commits them once at
+    the end, rather than committing every command.
+
+    Returns False if any command or the commit failed.
+    """
+    lines_to_configure = []
+    for lines, delete in ((lines_to_del, True), (lines_to_add, False)):
+        for ctx_keys, line in lines:
+            cmd = "\n".join(lines_to_config(ctx_keys, line, delete)) + "\n"
+            lines_to_configure.append(cmd)
+
+    try:
+        exec_config_lines(vtysh, rundir, lines_to_configure)
+    except VtyshException as e:
+        log.warning(f"mgmtd transaction failed, applying the lines one by one: {e}")
+        return False
+
+    return True
+
+
+def reload_config(
+    vtysh, newconf, daemon, rundir, select=None, compare=None, transaction=False
+):
+    """
+    Apply the differences between newconf and the running configuration.
+
+    daemon restricts the running configuration to that of one daemon
+    (show running-config <daemon>).  If given, select is called with the
+    running configuration and returns the part of it newconf is compared
+    to, e.g. Config.select().  compare computes the delta, it defaults to
+    compare_context_objects().  If transaction is set, the changes handled by
+    mgmtd are applied first with apply_transaction(), and only fall back to
+    the two passes below if that fails.
+
+    Returns False if some of the changes could not be applied.
+    """
+    reload_ok = True
+    if compare is None:
+        compare = compare_context_objects
+
+    # This looks a little odd but we have to do this twice...here is why
+    # If the user had this running bgp config:
+    #
+    # router bgp 10
+    #  neighbor 1.1.1.1 remote-as 50
+    #  neighbor 1.1.1.1 route-map FOO out
+    #
+    # and this config in the newconf config file
+    #
+    # router bgp 10
+    #  neighbor 1.1.1.1 remote-as 999
+    #  neighbor 1.1.1.1 route-map FOO out
+    #
+    #
+    # Then the script will do
+    # - no neighbor 1.1.1.1 remote-as 50
+    # - neighbor 1.1.1.1 remote-as 999
+    #
+    # The problem is the "no neighbor 1.1.1.1 remote-as 50" will also remove
+    # the "neighbor 1.1.1.1 route-map FOO out" line...so we compare the
+    # configs again to put this line back.
+
+    # There are many keywords in FRR that can only appear one time under
+    # a context, take "bgp router-id" for example. If the config that we are
+    # reloading against has the following:
+    #
+    # router bgp 10
+    #   bgp router-id 1.1.1.1
+    #   bgp router-id 2.2.2.2
+    #
+    # The final config needs to contain "bgp router-id 2.2.2.2". On the
+    # first pass we will add "bgp router-id 2.2.2.2" but then on the second
+    # pass we will see that "bgp router-id 1.1.1.1" is missing and add that
+    # back which cancels out the "bgp router-id 2.2.2.2". The fix is for the
+    # second pass to include all of the "adds" from the first pass.
+    lines_to_add_first_pass = []
+    mgmtd_applied = False
+
+    for x in range(2):
+        with stats.phase(f"pass{x + 1}"):
+            running = Config(vtysh)
+            running.load_from_show_running(daemon)
+            log.debug(f"Running Frr Config (Pass #{x})\n{running.get_lines()}")
+            if select is not None:
+                running = select(running)
+
+            with stats.phase("compare"):
+                lines_to_add, lines_to_del = compare(newconf, running)
+
+            if mgmtd_applied:
+                # Committed on the first pass, no need to go over it again
+                lines_to_del = LineSet(
+                    item for item in lines_to_del if not is_mgmtd_line(*item)
+                )
+                lines_to_add = LineSet(
+                    item for item in lines_to_add if not is_mgmtd_line(*item)
+                )
+            elif transaction and x == 0:
+                mgmtd_to_del = [
+                    (ctx_keys, line)
+                    for ctx_keys, line in lines_to_del
+                    if line != "!" and is_mgmtd_line(ctx_keys, line)
+                ]
+                mgmtd_to_add = [
+                    (ctx_keys, line)
+                    for ctx_keys, line in lines_to_add
+                    if line != "!" and is_mgmtd_line(ctx_keys, line)
+                ]
+                if mgmtd_to_del or mgmtd_to_add:
+                    with stats.phase("transaction"):
+                        mgmtd_applied = apply_transaction(
+                            vtysh, rundir, mgmtd_to_del, mgmtd_to_add
+                        )
+                if mgmtd_applied:
+                    lines_to_del = LineSet(
+                        item for item in lines_to_del if not is_mgmtd_line(*item)
+                    )
+                    lines_to_add = LineSet(
+                        item for item in lines_to_add if not is_mgmtd_line(*item)
+                    )
+
+            if x == 0:
+                lines_to_add_first_pass = lines_to_add
+            else:
+                lines_to_add.extend(lines_to_add_first_pass)
+
+            # Only do deletes on the first pass. The reason being if we
+            # configure a bgp neighbor via "neighbor swp1 interface" FRR
+            # will automatically add:
+            #
+            # interface swp1
+            #  ipv6 nd ra-interval 10
+            #  no ipv6 nd suppress-ra
+            # !
+            #
+            # but those lines aren't in the config we are reloading against so
+            # on the 2nd pass they will show up in lines_to_del.  This could
+            # apply to other scenarios as well where configuring FOO adds BAR
+            # to the config.
+            if lines_to_del and x == 0:
+                delete_cmds = []
+                for ctx_keys, line in lines_to_del:
+                    if line == "!":
+                        continue
+
+                    delete_cmds.append(lines_to_config(ctx_keys, line, True))
+
+                with stats.phase("delete"):
+                    if not apply_deletes(vtysh, delete_cmds):
+                        reload_ok = False
+
+            if lines_to_add:
+                lines_to_configure = []
+
+                for ctx_keys, line in lines_to_add:
+                    if line == "!":
+                        continue
+
+                    # Don't run "no" commands twice since they can error
+                    # out the second time due to first deletion
+                    if x == 1 and ctx_keys[0].startswith("no "):
+                        continue
+
+                    cmd = "\n".join(lines_to_config(ctx_keys, line, False)) + "\n"
+                    lines_to_configure.append(cmd)
+
+                if lines_to_configure:
+                    try:
+                        with stats.phase("add"):
+                            exec_config_lines(vtysh, rundir, lines_to_configure)
+                    except VtyshException as e:
+                        log.warning(f"frr-reload.py failed due to\n{e.args}")
+                        reload_ok = False
+
+    return reload_ok
+
+
+def compare_context_objects_by_daemon(newconf, running, executor=None):
+    """
+    Same as compare_context_objects(), but the contexts owned by each daemon
+    (see get_context_daemon()) and the shared ones are diffed separately, in
+    parallel if an executor (e.g. a ProcessPoolExecutor) is given.  The
+    shared lines come first, then those of each daemon.
+    """
+    daemons = [None]
+    for daemon in newconf.get_daemons() + running.get_daemons():
+        if daemon not in daemons:
+            daemons.append(daemon)
+
+    results = []
+    for daemon in daemons:
+        # The vtysh objects are not needed to compare, and cannot be
+        # passed to another process.
+        newconf_daemon = Config(None, newconf.select(daemon).contexts)
+        running_daemon = Config(None, running.select(daemon).contexts)
+
+        if executor is not None:
+            results.append(
+                executor.submit(
+                    compare_context_objects_worker, newconf_daemon, running_daemon
+                )
+            )
+        else:
+            results.append(compare_context_objects(newconf_daemon, running_daemon))
+
+    lines_to_add = LineSet()
+    lines_to_del = LineSet()
+    for result in results:
+        if executor is not None:
+            result, worker_stats = result.result()
+            stats.merge(worker_stats)
+        lines_to_add.extend(result[0])
+        lines_to_del.extend(result[1])
+
+    return (lines_to_add, lines_to_del)
+
+
+def reload_config_by_daemon(vtysh, session, newconf, rundir, transaction=False):
+    """
+    Reload each daemon in parallel.
+
+    The shared contexts are applied first, through the integrated session,
+    since the daemon specific ones may refer to them.  Then every daemon
+    owning contexts in newconf or in the running configuration gets its
+    own vtysh and is reloaded concurrently with the others, as if
+    "--daemon <daemon>" had been given.  The daemons behind mgmtd are part
+    of the shared contexts, transaction applies to them.  The deltas are computed in a pool
+    of processes.
+    """
+    running = Config(session)
+    running.load_from_show_running(None)
+
+    daemons = []
+    for daemon in newconf.get_daemons() + running.get_daemons():
+        if daemon not in daemons:
+            daemons.append(daemon)
+
+    with ProcessPoolExecutor() as executor:
+
+        def compare(newconf, running):
+            newconf = Config(None, newconf.contexts)
+            running = Config(None, running.contexts)
+            result, worker_stats = executor.submit(
+                compare_context_objects_worker, newconf, running
+            ).result()
+            stats.merge(worker_stats)
+            return result
+
+        def reload_daemon(daemon):
+            start = time.monotonic()
+            try:
+                if daemon is None:
+                    daemon_vtysh = session
+                else:
+                    daemon_vtysh = vtysh.for_daemon(daemon)
+
+                ok = reload_config(
+                    daemon_vtysh,
+                    newconf.select(daemon),
+                    daemon,
+                    rundir,
+                    select=lambda running: running.select(daemon),
+                    compare=compare,
+                    transaction=transaction and daemon is None,
+                )
+            except VtyshException as e:
+                log.error(f"Failed to reload {daemon or 'shared'} configuration: {e}")
+                ok = False
+
+            log.info(
+                f"Reloaded {daemon or 'shared'} configuration in "
+                f"{time.monotonic() - start:.2f}s"
+            )
+            return ok
+
+        reload_ok = reload_daemon(None)
+
+        if daemons:
+            with ThreadPoolExecutor(max_workers=len(daemons)) as threads:
+                for ok in threads.map(reload_daemon, daemons):
+                    if not ok:
+                        reload_ok = False
+
+    return reload_ok
+
+
 class LogFmtFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -2363,6 +3995,52 @@ if __name__ == "__main__":
     parser.add_argument(
         "--daemon", help="daemon for which want to replace the config", default=""
     )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Compute and apply the changes of each daemon in parallel",
+        default=False,
+    )
+    parser.add_argument(
+        "--transaction",
+        action="store_true",
+        help="Commit the changes to the daemons behind mgmtd (staticd, ripd, "
+        "ripngd) as one transaction",
+        default=False,
+    )
+    parser.add_argument(
+        "--marker",
+        help="Find the end of the config contexts with vtysh, or with a "
+        "python version of vtysh -m that does not validate the commands",
+        default="vtysh",
+        choices=("vtysh", "python"),
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only parse and compare the top-level contexts that changed in "
+        "the config file since the last incremental reload, as cached under "
+        "--rundir.  The rest of the running config is not checked",
+        default=False,
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="With --test, print the deltas as JSON",
+        default=False,
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="FILE",
+        help="Save the time spent in each phase and the counters as JSON",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log the time spent normalizing and parsing the config",
+        default=False,
+    )
     parser.add_argument(
         "--test-reset",
         action="store_true",
@@ -2424,6 +4102,10 @@ if __name__ == "__main__":
         stdout_hdlr.setFormatter(logging.Formatter())
         log.addHandler(stdout_hdlr)
 
+    if args.incremental and args.parallel:
+        log.error("--incremental cannot be used with --parallel")
+        sys.exit(1)
+
     # Verify the new config file is valid
     if not os.path.isfile(args.filename):
         log.error(f"Filename {args.filename} does not exist")
@@ -2476,7 +4158,13 @@ if __name__ == "__main__":
         log.error(msg)
         sys.exit(1)
 
-    vtysh = Vtysh(args.bindir, args.confdir, args.vty_socket, args.pathspace)
+    vtysh = Vtysh(
+        args.bindir,
+        args.confdir,
+        args.vty_socket,
+        args.pathspace,
+        marker=mark_config if args.marker == "python" else None,
+    )
 
     # Verify that 'service integrated-vtysh-config' is configured
     if args.pathspace:
@@ -2502,10 +4190,35 @@ if __name__ == "__main__":
 
     log.info(f'Called via "{args}"')
 
+    if args.profile:
+        profile = Profile()
+
     # Create a Config object from the config generated by newconf
     newconf = Config(vtysh)
+    cache = None
+    touched = None
+    if args.incremental:
+        vtysh_stat = os.stat(args.bindir + "/vtysh")
+        # The parse depends on the marker and on this script as well
+        with open(__file__, "rb") as fh:
+            script_digest = hashlib.sha256(fh.read()).hexdigest()
+        cache = ConfigCache(
+            os.path.join(args.rundir, "frr-reload.cache"),
+            [
+                vtysh_stat.st_size,
+                vtysh_stat.st_mtime_ns,
+                args.marker,
+                script_digest,
+                args.daemon,
+                args.pathspace,
+            ],
+        )
+        cache.load()
     try:
-        newconf.load_from_file(args.filename)
+        if cache is not None:
+            touched = newconf.load_from_file_incremental(args.filename, cache)
+        else:
+            newconf.load_from_file(args.filename)
         reload_ok = True
     except VtyshException as ve:
         log.error("vtysh failed to process new configuration: {}".format(ve))
@@ -2520,222 +4233,139 @@ if __name__ == "__main__":
         else:
             running.load_from_show_running(args.daemon)
 
-        lines_to_add, lines_to_del = compare_context_objects(newconf, running)
-
-        if lines_to_del:
-            if not args.test_reset:
-                print("\nLines To Delete")
-                print("===============")
-
-            for ctx_keys, line in lines_to_del:
-                if line == "!":
-                    continue
+        if touched is not None:
+            newconf = newconf.select_keys(touched)
+            running = running.select_keys(touched)
 
-                nolines = lines_to_config(ctx_keys, line, True)
-
-                if args.test_reset:
-                    # For topotests the original code stripped the lines, and omitted blank lines
-                    # after, do that here
-                    nolines = [x.strip() for x in nolines]
-                    # For topotests leave these lines in (don't delete them)
-                    # [chopps: why is "log file" more special than other "log" commands?]
-                    nolines = [
-                        x for x in nolines if "debug" not in x and "log file" not in x
-                    ]
-                    if not nolines:
-                        continue
-
-                cmd = "\n".join(nolines)
-                print(cmd)
-
-        if lines_to_add:
-            if not args.test_reset:
-                print("\nLines To Add")
-                print("============")
-
-            for ctx_keys, line in lines_to_add:
-                if line == "!":
-                    continue
-
-                lines = lines_to_config(ctx_keys, line, False)
-
-                if args.test_reset:
-                    # For topotests the original code stripped the lines, and omitted blank lines
-                    # after, do that here
-                    lines = [x.strip() for x in lines if x.strip()]
-                    if not lines:
-                        continue
-
-                cmd = "\n".join(lines)
-                print(cmd)
-
-    elif args.reload:
-        lines_to_configure = []
-
-        # We will not be able to do anything, go ahead and exit(1)
-        if not vtysh.is_config_available() or not reload_ok:
-            sys.exit(1)
-
-        log.debug(f"New Frr Config\n{newconf.get_lines()}")
-
-        # This looks a little odd but we have to do this twice...here is why
-        # If the user had this running bgp config:
-        #
-        # router bgp 10
-        #  neighbor 1.1.1.1 remote-as 50
-        #  neighbor 1.1.1.1 route-map FOO out
-        #
-        # and this config in the newconf config file
-        #
-        # router bgp 10
-        #  neighbor 1.1.1.1 remote-as 999
-        #  neighbor 1.1.1.1 route-map FOO out
-        #
-        #
-        # Then the script will do
-        # - no neighbor 1.1.1.1 remote-as 50
-        # - neighbor 1.1.1.1 remote-as 999
-        #
-        # The problem is the "no neighbor 1.1.1.1 remote-as 50" will also remove
-        # the "neighbor 1.1.1.1 route-map FOO out" line...so we compare the
-        # configs again to put this line back.
-
-        # There are many keywords in FRR that can only appear one time under
-        # a context, take "bgp router-id" for example. If the config that we are
-        # reloading against has the following:
-        #
-        # router bgp 10
-        #   bgp router-id 1.1.1.1
-        #   bgp router-id 2.2.2.2
-        #
-        # The final config needs to contain "bgp router-id 2.2.2.2". On the
-        # first pass we will add "bgp router-id 2.2.2.2" but then on the second
-        # pass we will see that "bgp router-id 1.1.1.1" is missing and add that
-        # back which cancels out the "bgp router-id 2.2.2.2". The fix is for the
-        # second pass to include all of the "adds" from the first pass.
-        lines_to_add_first_pass = []
-
-        for x in range(2):
-            running = Config(vtysh)
-            running.load_from_show_running(args.daemon)
-            log.debug(f"Running Frr Config (Pass #{x})\n{running.get_lines()}")
-
-            lines_to_add, lines_to_del = compare_context_objects(newconf, running)
+        if args.parallel and not args.daemon:
+            with ProcessPoolExecutor() as executor:
+                lines_to_add, lines_to_del = compare_context_objects_by_daemon(
+                    newconf, running, executor
+                )
+        else:
+            with stats.phase("compare"):
+                lines_to_add, lines_to_del = compare_context_objects(newconf, running)
 
-            if x == 0:
-                lines_to_add_first_pass = lines_to_add
-            else:
-                lines_to_add.extend(lines_to_add_first_pass)
+        if args.json:
+            print(json.dumps(delta_to_dict(lines_to_add, lines_to_del), indent=4))
+        else:
+            if lines_to_del:
+                if not args.test_reset:
+                    print("\nLines To Delete")
+                    print("===============")
 
-            # Only do deletes on the first pass. The reason being if we
-            # configure a bgp neighbor via "neighbor swp1 interface" FRR
-            # will automatically add:
-            #
-            # interface swp1
-            #  ipv6 nd ra-interval 10
-            #  no ipv6 nd suppress-ra
-            # !
-            #
-            # but those lines aren't in the config we are reloading against so
-            # on the 2nd pass they will show up in lines_to_del.  This could
-            # apply to other scenarios as well where configuring FOO adds BAR
-            # to the config.
-            if lines_to_del and x == 0:
                 for ctx_keys, line in lines_to_del:
                     if line == "!":
                         continue
 
-                    # 'no' commands are tricky, we can't just put them in a file and
-                    # vtysh -f that file. See the next comment for an explanation
-                    # of their quirks
-                    cmd = lines_to_config(ctx_keys, line, True)
-                    original_cmd = cmd
-
-                    # Some commands in frr are picky about taking a "no" of the entire line.
-                    # OSPF is bad about this, you can't "no" the entire line, you have to "no"
-                    # only the beginning. If we hit one of these command an exception will be
-                    # thrown.  Catch it and remove the last '-c', 'FOO' from cmd and try again.
-                    #
-                    # Example:
-                    # frr(config-if)# ip ospf authentication message-digest 1.1.1.1
-                    # frr(config-if)# no ip ospf authentication message-digest 1.1.1.1
-                    #  % Unknown command.
-                    # frr(config-if)# no ip ospf authentication message-digest
-                    #  % Unknown command.
-                    # frr(config-if)# no ip ospf authentication
-                    # frr(config-if)#
-
-                    stdouts = []
-                    while True:
-                        try:
-                            vtysh(["configure"] + cmd, stdouts)
-
-                        except VtyshException:
-                            # - Pull the last entry from cmd (this would be
-                            #   'no ip ospf authentication message-digest 1.1.1.1' in
-                            #   our example above
-                            # - Split that last entry by whitespace and drop the last word
-                            log.error(f"Failed to execute {' '.join(cmd)}")
-                            last_arg = cmd[-1].split(" ")
-
-                            if len(last_arg) <= 2:
-                                log.error(
-                                    '"%s" we failed to remove this command',
-                                    " -- ".join(original_cmd),
-                                )
-                                # Log first error msg for original_cmd
-                                if stdouts:
-                                    log.error(stdouts[0])
-                                reload_ok = False
-                                break
-
-                            new_last_arg = last_arg[0:-1]
-                            cmd[-1] = " ".join(new_last_arg)
-                        else:
-                            log.info(f'Executed "{" ".join(cmd)}"')
-                            break
+                    nolines = lines_to_config(ctx_keys, line, True)
+
+                    if args.test_reset:
+                        # For topotests the original code stripped the lines, and omitted blank lines
+                        # after, do that here
+                        nolines = [x.strip() for x in nolines]
+                        # For topotests leave these lines in (don't delete them)
+                        # [chopps: why is "log file" more special than other "log" commands?]
+                        nolines = [
+                            x
+                            for x in nolines
+                            if "debug" not in x and "log file" not in x
+                        ]
+                        if not nolines:
+                            continue
+
+                    cmd = "\n".join(nolines)
+                    print(cmd)
 
             if lines_to_add:
-                lines_to_configure = []
+                if not args.test_reset:
+                    print("\nLines To Add")
+                    print("============")
 
                 for ctx_keys, line in lines_to_add:
                     if line == "!":
                         continue
 
-                    # Don't run "no" commands twice since they can error
-                    # out the second time due to first deletion
-                    if x == 1 and ctx_keys[0].startswith("no "):
-                        continue
+                    lines = lines_to_config(ctx_keys, line, False)
 
-                    cmd = "\n".join(lines_to_config(ctx_keys, line, False)) + "\n"
-                    lines_to_configure.append(cmd)
+                    if args.test_reset:
+                        # For topotests the original code stripped the lines, and omitted blank lines
+                        # after, do that here
+                        lines = [x.strip() for x in lines if x.strip()]
+                        if not lines:
+                            continue
 
-                if lines_to_configure:
-                    random_string = "".join(
-                        random.SystemRandom().choice(
-                            string.ascii_uppercase + string.digits
-                        )
-                        for _ in range(6)
-                    )
+                    cmd = "\n".join(lines)
+                    print(cmd)
 
-                    filename = args.rundir + "/reload-%s.txt" % random_string
-                    log.info(f"{filename} content\n{pformat(lines_to_configure)}")
+    elif args.reload:
+        # Keep one vtysh around for the whole reload instead of starting a
+        # new one for every show/config/write command.
+        session = VtyshSession(vtysh)
+        try:
+            session.start()
+        except VtyshException as e:
+            log.warning(f"vtysh session not available, not using it: {e}")
+            session.close()
+            session = vtysh
 
-                    with open(filename, "w") as fh:
-                        for line in lines_to_configure:
-                            fh.write(line + "\n")
+        # We will not be able to do anything, go ahead and exit(1)
+        if not session.is_config_available() or not reload_ok:
+            sys.exit(1)
 
-                    try:
-                        vtysh.exec_file(filename)
-                    except VtyshException as e:
-                        log.warning(f"frr-reload.py failed due to\n{e.args}")
-                        reload_ok = False
-                    os.unlink(filename)
+        log.debug(f"New Frr Config\n{newconf.get_lines()}")
+
+        if args.parallel and not args.daemon:
+            if not reload_config_by_daemon(
+                vtysh, session, newconf, args.rundir, args.transaction
+            ):
+                reload_ok = False
+        elif touched is not None:
+            log.info(f"{len(touched)} top-level contexts changed since last reload")
+            if touched and not reload_config(
+                session,
+                newconf.select_keys(touched),
+                args.daemon,
+                args.rundir,
+                select=lambda running: running.select_keys(touched),
+                transaction=args.transaction,
+            ):
+                reload_ok = False
+        elif not reload_config(
+            session,
+            newconf,
+            args.daemon,
+            args.rundir,
+            transaction=args.transaction,
+        ):
+            reload_ok = False
 
         # Make these changes persistent
         target = str(args.confdir + "/frr.conf")
         if args.overwrite or (not args.daemon and args.filename != target):
-            vtysh("write")
+            try:
+                session("write")
+            except VtyshException as e:
+                log.error(f"Failed to save the configuration: {e}")
+                reload_ok = False
+
+        if session is not vtysh:
+            session.close()
+
+        # Only trust the cache if the running config now matches it
+        if cache is not None:
+            if reload_ok:
+                cache.save()
+            else:
+                cache.remove()
+
+    stats.log(args.logfmt)
+    if args.stats_json:
+        with open(args.stats_json, "w") as fh:
+            json.dump(stats.as_dict(), fh, indent=4)
+
+    if profile is not None:
+        profile.report()
 
     if not reload_ok:
         sys.exit(1)